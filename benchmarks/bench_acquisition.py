@@ -0,0 +1,243 @@
+"""Benchmark the RGA acquisition path from socket to PV.
+
+Starts the local MASsoft simulator on a background thread, drives the real
+``cap2.RGAIOC`` acquisition loop against it, and records for every
+(channel count, cycle rate) case:
+
+  * rows/s stored in the history (every row processed) versus rows/s
+    produced, and rows/s published (the publisher coalesces a backlog),
+  * latency percentiles from the simulator producing a row to the row
+    reaching the history (every row) and to its last PV write (published
+    rows); rows are matched on their ms column,
+  * IOC-side CPU time per row (process CPU minus the simulator thread),
+  * traced allocation peak and retained blocks per row (separate tracemalloc pass).
+
+Results are written as JSON so runs from different versions can be diffed:
+
+    python benchmarks/bench_acquisition.py --channels 10 100 400 --rates 1 10 50 \
+        --duration 5 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hiden'))
+
+from simulator import MASsoftSimulator  # noqa: E402
+import cap2  # noqa: E402
+
+
+class SimulatorThread:
+    """Run a MASsoftSimulator on its own event loop in a daemon thread."""
+
+    def __init__(self, **kwargs):
+        self.sim = MASsoftSimulator(port=0, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.sim.start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+        self._ready.wait()
+        return self
+
+    def call(self, fn, *args):
+        """Run fn(*args) on the simulator thread and return its result."""
+        async def _call():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(_call(), self.loop).result()
+
+    def cpu_time(self):
+        return self.call(time.thread_time)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.sim.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    if len(samples) < 2:
+        return {f'p{p}': (samples[0] if samples else None) for p in points}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {f'p{p}': cuts[p - 1] for p in points}
+
+
+async def _drive(ioc, sim_thread, duration, counts, warmup=1.0):
+    """Open/run the simulated experiment, acquire for `duration` seconds."""
+    await ioc.client.open_experiment('file1.exp')
+    await ioc.client.run_experiment(verify_timeout=0)
+    await ioc.acquire.write(1)
+    # Measurement starts `warmup` seconds after the first stored row, so
+    # the legend fetch and the initial backlog are excluded
+    while not counts['stored']:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(warmup)
+    start = (time.monotonic(), time.process_time(), sim_thread.cpu_time(), dict(counts))
+    await asyncio.sleep(duration)
+    end = (time.monotonic(), time.process_time(), sim_thread.cpu_time(), dict(counts))
+    await ioc.acquire.write(0)
+    await ioc.client.shutdown()
+    return start, end
+
+
+def trace_rows(ioc, counts, stored, published):
+    """Record when rows reach the history and when their PVs are written.
+
+    stored    -- (monotonic time, first ms, last ms, rows) per history batch
+    published -- (monotonic time the row's last PV was written, its ms)
+    """
+    new_history = ioc.client.new_history
+
+    def traced_history(*args, **kwargs):
+        history = new_history(*args, **kwargs)
+        extend = history.extend
+
+        def timed_extend(rows):
+            extend(rows)
+            stored.append((time.monotonic(), rows[0, 1], rows[-1, 1], len(rows)))
+            counts['stored'] += len(rows)
+        history.extend = timed_extend
+        return history
+
+    publish_row = ioc._publish_row
+
+    async def timed_publish(row, arrival):
+        await publish_row(row, arrival)
+        published.append((time.monotonic(), row[1]))
+        counts['published'] += 1
+
+    ioc.client.new_history = traced_history
+    ioc._publish_row = timed_publish
+
+
+def latency_summary(samples):
+    return dict(percentiles(samples), max=max(samples) if samples else None, samples=len(samples))
+
+
+def run_case(channels, rate, duration, trace_alloc=False):
+    sim_thread = SimulatorThread(channels=channels, cycle_rate=rate, seed=1).start()
+    sim = sim_thread.sim
+    ioc = cap2.RGAIOC(prefix='', host='127.0.0.1', port=sim.port)
+    counts = {'stored': 0, 'published': 0}
+    stored, published = [], []
+    trace_rows(ioc, counts, stored, published)
+
+    if trace_alloc:
+        tracemalloc.start()
+    try:
+        start, end = asyncio.run(_drive(ioc, sim_thread, duration, counts))
+        if trace_alloc:
+            _, peak = tracemalloc.get_traced_memory()
+            blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        if trace_alloc:
+            tracemalloc.stop()
+        sim_thread.call(sim.stop_scan, 'Stopped')
+        # The simulator sends ms as int(elapsed * 1e3): unique per cycle
+        produced_ms = np.array([int(row.elapsed * 1e3) for row in sim.rows], dtype=float)
+        produced_at = np.array([row.produced for row in sim.rows])
+        sim_thread.stop()
+        ioc.close()
+
+    elapsed = end[0] - start[0]
+    rows = end[3]['stored'] - start[3]['stored']
+    publications = end[3]['published'] - start[3]['published']
+    window = [batch for batch in stored if start[0] <= batch[0] < end[0]]
+    store_latencies = []
+    for t, first_ms, last_ms, n in window:
+        lo, hi = np.searchsorted(produced_ms, [first_ms, last_ms], side='left')
+        store_latencies.extend((t - produced_at[lo:hi + 1]) * 1e3)
+    publish_latencies = []
+    for t, ms in published:
+        if start[0] <= t < end[0]:
+            i = np.searchsorted(produced_ms, ms)
+            if i < len(produced_ms) and produced_ms[i] == ms:
+                publish_latencies.append((t - produced_at[i]) * 1e3)
+    ioc_cpu = (end[1] - start[1]) - (end[2] - start[2])
+    result = {
+        'channels': channels,
+        'cycle_rate': rate,
+        'duration_s': elapsed,
+        'rows': rows,
+        'rows_per_s': rows / elapsed if elapsed else 0.0,
+        'published': publications,
+        'published_per_s': publications / elapsed if elapsed else 0.0,
+        'latency_ms': latency_summary([float(x) for x in store_latencies]),
+        'publish_latency_ms': latency_summary(publish_latencies),
+        'cpu_us_per_row': ioc_cpu / rows * 1e6 if rows else None,
+        'framer': ioc.client.data_sock.framer.stats(),
+    }
+    if trace_alloc:
+        result['alloc_peak_bytes_per_row'] = peak / rows if rows else None
+        result['retained_blocks_per_row'] = blocks / rows if rows else None
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RGA acquisition path benchmark')
+    parser.add_argument('--channels', type=int, nargs='+', default=[10, 50, 200, 500])
+    parser.add_argument('--rates', type=float, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per case')
+    parser.add_argument('--no-alloc', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    cases = []
+    for channels in args.channels:
+        for rate in args.rates:
+            result = run_case(channels, rate, args.duration)
+            if not args.no_alloc:
+                alloc = run_case(channels, rate, args.duration, trace_alloc=True)
+                result['alloc_peak_bytes_per_row'] = alloc['alloc_peak_bytes_per_row']
+                result['retained_blocks_per_row'] = alloc['retained_blocks_per_row']
+            print(f"{channels:4d} ch @ {rate:6.1f} Hz: {result['rows_per_s']:8.1f} rows/s "
+                  f"({result['published_per_s']:.1f} published), "
+                  f"p50 {result['latency_ms']['p50']} ms stored / "
+                  f"{result['publish_latency_ms']['p50']} ms published, "
+                  f"{result['cpu_us_per_row']} us CPU/row")
+            cases.append(result)
+
+    report = {
+        'benchmark': 'acquisition',
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cases': cases,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""Derived quantities per cycle (partial pressures, gas ratios, ...) computed
+in a pool of worker processes, off the IOC's event loop.
+
+The acquisition history is a ColumnRingBuffer in shared memory.  For every
+received batch AnalysisStage sends the pool only the block's name; a worker
+maps the same block (ringbuffer.SharedHistory) and runs every analysis on a
+view of its newest rows, without copying the data.  At most
+`max_in_flight` frames are being computed at a time; while the workers are
+busy only the newest frame waits, older ones are dropped, so results always
+describe a recent cycle however slow the analysis is.
+
+Analyses are listed in a JSON file (RGA_ANALYSIS), e.g.
+
+    [
+      {"type": "PartialPressure", "sensitivity": {"28": 1.0, "32": 0.86, "44": 1.4},
+       "background": {"18": 2e-11}, "window": 5},
+      {"type": "GasRatio", "name": "N2_O2", "numerator": 28, "denominator": 32}
+    ]
+
+and published by the caproto IOC as XF:08IDB-SE{RGA:1}A:<output>-I PVs.
+"""
+import abc
+import asyncio
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from metrics import ANALYSIS_DROPPED, ANALYSIS_SECONDS
+from ringbuffer import SharedHistory
+
+log = logging.getLogger('rga.analysis')
+
+ANALYSIS_FILE = os.environ.get('RGA_ANALYSIS')  # JSON list of analyses, see above
+ANALYSIS_WORKERS = int(os.environ.get('RGA_ANALYSIS_WORKERS', 2))
+MASS_TOLERANCE = 0.5  # amu between a configured mass and a data column
+# Workers must not be forked from the IOC once its logging, metrics and
+# caproto threads run (a fork copies locks those threads may hold)
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# One unit of work: analyse the newest rows of the shared history block
+Frame = collections.namedtuple('Frame', 'buffer masses arrival')
+
+
+class Analysis(abc.ABC):
+    """One derived computation on the newest rows of the history.
+
+    compute() gets a (window, masses) array of intensities, newest row
+    last, and the masses of its columns; it returns {output name: value},
+    a float or, for outputs listed in `waveforms`, a 1-D array.  Instances
+    are sent to the worker processes once, when the pool starts.  Both
+    methods are abstract, so a subclass missing one cannot be instantiated
+    and a configuration using it fails when it is loaded.
+    """
+    window = 1
+    waveforms = frozenset()
+
+    @abc.abstractmethod
+    def outputs(self):
+        """Names of the values compute() returns."""
+
+    @abc.abstractmethod
+    def compute(self, intensities, masses):
+        """{output name: value} for the newest `window` rows of intensities."""
+
+
+def _mass_map(values, masses, default):
+    """Per-column vector from {mass: value}, matching masses within
+    MASS_TOLERANCE; `default` where nothing matches."""
+    vector = np.full(len(masses), default, dtype=float)
+    if values and len(masses):
+        configured = np.array(sorted(values))
+        nearest = np.abs(masses[:, None] - configured[None, :]).argmin(axis=1)
+        close = np.abs(masses - configured[nearest]) <= MASS_TOLERANCE
+        lookup = np.array([values[m] for m in configured])
+        vector[close] = lookup[nearest[close]]
+    return vector
+
+
+def _column(masses, mass):
+    """Index of the column closest to `mass`, or None if none is within MASS_TOLERANCE."""
+    if not len(masses):
+        return None
+    i = int(np.abs(masses - mass).argmin())
+    return i if abs(masses[i] - mass) <= MASS_TOLERANCE else None
+
+
+class PartialPressure(Analysis):
+    """Background-subtracted intensities over per-mass sensitivities, averaged
+    over `window` cycles: PartialP (one value per mass) and TotalP (their sum).
+
+    sensitivity -- {mass: intensity per unit pressure}; default_sensitivity elsewhere
+    background -- {mass: intensity} subtracted before calibration
+    """
+    waveforms = frozenset({'PartialP'})
+
+    def __init__(self, sensitivity=None, background=None, default_sensitivity=1.0, window=1):
+        self.sensitivity = {float(m): float(v) for m, v in (sensitivity or {}).items()}
+        self.background = {float(m): float(v) for m, v in (background or {}).items()}
+        self.default_sensitivity = float(default_sensitivity)
+        self.window = int(window)
+        self._vectors = {}  # masses -> (sensitivity, background) vectors
+
+    def outputs(self):
+        return ['PartialP', 'TotalP']
+
+    def compute(self, intensities, masses):
+        key = masses.tobytes()
+        if key not in self._vectors:
+            # The same masses come back every cycle of an acquisition
+            self._vectors = {key: (
+                _mass_map(self.sensitivity, masses, self.default_sensitivity),
+                _mass_map(self.background, masses, 0.0),
+            )}
+        sensitivity, background = self._vectors[key]
+        pressures = np.clip((intensities.mean(axis=0) - background) / sensitivity, 0.0, None)
+        return {'PartialP': pressures, 'TotalP': float(np.nansum(pressures))}
+
+
+class GasRatio(Analysis):
+    """Ratio of the mean intensities of two masses over `window` cycles (NaN
+    if either mass is not in the scan or the denominator is zero)."""
+
+    def __init__(self, name, numerator, denominator, window=1):
+        self.name = name
+        self.numerator = float(numerator)
+        self.denominator = float(denominator)
+        self.window = int(window)
+
+    def outputs(self):
+        return [self.name]
+
+    def compute(self, intensities, masses):
+        num, den = _column(masses, self.numerator), _column(masses, self.denominator)
+        if num is None or den is None:
+            return {self.name: float('nan')}
+        bottom = intensities[:, den].mean()
+        return {self.name: float(intensities[:, num].mean() / bottom) if bottom else float('nan')}
+
+
+ANALYSES = {cls.__name__: cls for cls in (PartialPressure, GasRatio)}
+
+
+def load_analyses(path):
+    """Build analyses from a JSON list of {"type": ..., **arguments}."""
+    with open(path) as f:
+        entries = json.load(f)
+    analyses = []
+    for entry in entries:
+        entry = dict(entry)
+        kind = entry.pop('type')
+        if kind not in ANALYSES:
+            raise ValueError(f"Unknown analysis {kind!r}; expected one of {sorted(ANALYSES)}")
+        analyses.append(ANALYSES[kind](**entry))
+    names = [name for analysis in analyses for name in analysis.outputs()]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Analysis outputs must be unique: {names}")
+    return analyses
+
+
+# — Worker process side —
+_analyses = ()
+_history = None  # SharedHistory last mapped
+
+
+def _init_worker(analyses):
+    global _analyses
+    _analyses = analyses
+
+
+def _attach(name):
+    """Map the shared history `name`, reusing the mapping while it is current."""
+    global _history
+    if _history is None or _history.name != name:
+        if _history is not None:
+            _history.close()
+        _history = SharedHistory(name)
+    elif _history.closed:
+        # A new acquisition published a new block under the same name
+        _history.reopen()
+    return _history
+
+
+def _run(buffer, masses):
+    """Run every analysis on the newest rows; returns (row count, results),
+    or None if the history was closed meanwhile."""
+    history = _attach(buffer)
+    window = max(analysis.window for analysis in _analyses)
+    while not history.closed:
+        count, rows = history.snapshot(window)
+        intensities = rows[:, 2:]  # skip the Time and ms columns
+        results = {}
+        for analysis in _analyses:
+            results.update(analysis.compute(intensities[-analysis.window:], masses))
+        # Recompute if the writer wrapped around onto these rows meanwhile
+        if history.valid(count, len(rows)):
+            return count, results
+    return None
+
+
+class AnalysisStage:
+    """Feed the newest rows of a shared history to the analyses in a process
+    pool and hand each result to publish(results, arrival).
+
+    offer() is called after every batch is added to the history.  It sends a
+    frame if fewer than max_in_flight are being computed; otherwise the frame
+    waits, replacing (and dropping) any frame already waiting.  Workers
+    analyse the rows that are newest when they start; results for rows no
+    newer than those already published are discarded.
+
+    Counters: submitted, published, dropped (never computed), discarded, failed.
+    """
+
+    def __init__(self, analyses, publish, workers=ANALYSIS_WORKERS, max_in_flight=None):
+        self.analyses = list(analyses)
+        self.publish = publish
+        self.max_in_flight = max_in_flight or workers
+        self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(START_METHOD),
+                                         initializer=_init_worker, initargs=(self.analyses,))
+        self._broken = False
+        self._history = None
+        self._masses = None
+        self._pending = None
+        self._in_flight = set()
+        self._latest = 0  # row count the newest published results end at
+        # Counters
+        self.submitted = 0
+        self.published = 0
+        self.dropped = 0
+        self.discarded = 0
+        self.failed = 0
+
+    def outputs(self):
+        """[(output name, is waveform)] of every analysis, in order."""
+        return [(name, name in analysis.waveforms) for analysis in self.analyses
+                for name in analysis.outputs()]
+
+    def start(self, history, masses):
+        """Analyse `history` (a shared ColumnRingBuffer) from now on."""
+        if history.shm_name is None:
+            raise ValueError("AnalysisStage needs a history in shared memory (shared=True)")
+        self._history = history
+        self._masses = np.asarray(masses, dtype=float)
+        self._latest = 0
+
+    def offer(self, arrival):
+        """Queue the newest rows of the history (received at loop time `arrival`)."""
+        history = self._history
+        if history is None or self._broken or not len(history):
+            return
+        frame = Frame(history.shm_name, self._masses, arrival)
+        if len(self._in_flight) < self.max_in_flight:
+            self._submit(frame)
+            return
+        if self._pending is not None:
+            self.dropped += 1
+            ANALYSIS_DROPPED.inc()
+        self._pending = frame
+
+    def _submit(self, frame):
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._pool, _run, frame.buffer, frame.masses)
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._broken = True
+            log.error(f"Analysis pool unavailable, analysis stopped: {e}")
+            return
+        self.submitted += 1
+        task = asyncio.ensure_future(self._complete(frame, future, time.perf_counter()))
+        self._in_flight.add(task)
+
+    async def _complete(self, frame, future, submitted):
+        try:
+            done = await future
+            ANALYSIS_SECONDS.observe(time.perf_counter() - submitted)
+            if done is None or self._history is None or done[0] <= self._latest:
+                self.discarded += 1
+            else:
+                self._latest, results = done
+                await self.publish(results, frame.arrival)
+                self.published += 1
+        except asyncio.CancelledError:
+            raise
+        except BrokenProcessPool as e:
+            self._broken = True
+            self.failed += 1
+            log.error(f"Analysis pool broke, analysis stopped: {e}")
+        except Exception as e:
+            self.failed += 1
+            log.error(f"Analysis failed: {e!r}")
+        finally:
+            self._in_flight.discard(asyncio.current_task())
+        if self._pending is not None and not self._broken:
+            frame, self._pending = self._pending, None
+            self._submit(frame)
+
+    async def stop(self):
+        """Stop analysing the current history: drop the waiting frame and
+        wait for the ones being computed. The history can be closed after."""
+        self._pending = None
+        self._history = None
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {'submitted': self.submitted, 'published': self.published, 'dropped': self.dropped,
+                'discarded': self.discarded, 'failed': self.failed}
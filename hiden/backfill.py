@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from metrics import HELD_BATCHES
+
+log = logging.getLogger('rga.backfill')
+
+MS_COLUMN = 1  # elapsed milliseconds of the cycle, unique and increasing within a run
+
+
+class RowMerger:
+    """Hand rows to `store(rows, stamps)` in cycle order, each cycle once.
+
+    Live batches go through live(); backfill() merges a bulk transfer of
+    earlier cycles (AsyncMASsoftClient.fetch_cycles) while the live stream
+    keeps running.  Until the backfill has caught up with the first live
+    row, live batches are held back, then stored after it, so the history
+    and recorder see one gap-free sequence.  Cycles are told apart by their
+    ms column: a row not newer than the last one stored is a duplicate (the
+    overlap between backfill and live stream, or rows replayed after a
+    reconnect) and is skipped.
+
+    Create it with backfilling=True before the live stream starts when a
+    backfill will follow, so no live row is stored ahead of it.
+
+    Live rows are stamped with their arrival time.  Backfilled rows were
+    produced earlier; their stamps are estimated from the ms column, relative
+    to the first live batch (or, if none has arrived, to the first backfilled
+    batch taken as received now).
+
+    Counters: stored, backfilled, duplicates.
+    """
+
+    def __init__(self, store, backfilling=False, ms_column=MS_COLUMN):
+        self.store = store
+        self.ms_column = ms_column
+        self._last_ms = -np.inf
+        # Live (rows, stamp) batches waiting for the backfill to catch up
+        self._held = [] if backfilling else None
+        self._anchor = None  # (ms, wall time) that backfilled stamps are relative to
+        # Counters
+        self.stored = 0
+        self.backfilled = 0
+        self.duplicates = 0
+
+    def _store(self, rows, stamps):
+        ms = rows[:, self.ms_column]
+        if len(ms) and ms[0] <= self._last_ms:
+            keep = ms > self._last_ms
+            self.duplicates += len(rows) - int(keep.sum())
+            rows, ms = rows[keep], ms[keep]
+            if not np.isscalar(stamps):
+                stamps = stamps[keep]
+        if not len(rows):
+            return 0
+        self._last_ms = ms[-1]
+        self.store(rows, stamps)
+        self.stored += len(rows)
+        return len(rows)
+
+    def live(self, rows, stamp=None):
+        """Store (or, during a backfill, hold) a batch from the live stream."""
+        stamp = time.time() if stamp is None else stamp
+        if not len(rows):
+            return
+        if self._anchor is None:
+            self._anchor = (rows[-1, self.ms_column], stamp)
+        if self._held is not None:
+            self._held.append((rows, stamp))
+            HELD_BATCHES.set(len(self._held))
+        else:
+            self._store(rows, stamp)
+
+    def _stamps(self, ms):
+        if self._anchor is None:
+            self._anchor = (ms[-1], time.time())
+        anchor_ms, anchor_wall = self._anchor
+        return anchor_wall - (anchor_ms - ms) / 1e3
+
+    async def backfill(self, frames):
+        """Merge the rows of `frames` (an async iterator of ScanFrames in
+        cycle order, e.g. fetch_cycles()) ahead of the live stream. Returns the
+        number of rows backfilled; stops early once it reaches the first live row."""
+        if self._held is None:
+            self._held = []
+        started = time.perf_counter()
+        try:
+            async for frame in frames:
+                rows = frame.rows
+                ms = rows[:, self.ms_column]
+                if self._held:
+                    # Rows from the first held live row on are already here
+                    first_live = self._held[0][0][0, self.ms_column]
+                    cut = int(np.searchsorted(ms, first_live))
+                    self.backfilled += self._store(rows[:cut], self._stamps(ms[:cut]))
+                    if cut < len(rows):
+                        break
+                else:
+                    self.backfilled += self._store(rows, self._stamps(ms))
+                # Let the live stream and the IOC run between batches
+                await asyncio.sleep(0)
+        except (ConnectionError, OSError) as e:
+            log.warning(f"Backfill stopped after {self.backfilled} rows ({e}); earlier cycles may be missing")
+        finally:
+            held, self._held = self._held, None
+            for rows, stamp in held:
+                self._store(rows, stamp)
+            HELD_BATCHES.set(0)
+            if hasattr(frames, 'aclose'):
+                await frames.aclose()
+        elapsed = time.perf_counter() - started
+        log.info(f"Backfilled {self.backfilled} rows in {elapsed:.2f} s "
+                 f"({self.duplicates} duplicates skipped, {len(held)} live batches held)")
+        return self.backfilled
+
+    def stats(self):
+        return {'stored': self.stored, 'backfilled': self.backfilled, 'duplicates': self.duplicates}
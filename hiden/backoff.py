@@ -0,0 +1,81 @@
+import asyncio
+import random
+import time
+
+BACKOFF_INITIAL = 0.5   # s before the first reconnect attempt
+BACKOFF_MAX = 30.0      # s cap between attempts
+BACKOFF_FACTOR = 2.0
+
+# Hot-link commands that must be re-issued after a reconnect
+HOTLINK_COMMANDS = ('-lData', '-lStatus')
+
+
+def backoff_delays(initial=BACKOFF_INITIAL, maximum=BACKOFF_MAX, factor=BACKOFF_FACTOR):
+    """Yield reconnect delays: exponential growth capped at `maximum`, each
+    drawn uniformly from [delay/2, delay] so clients don't retry in lockstep."""
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(delay * factor, maximum)
+
+
+class LinkState:
+    """What a MASsoft socket has set up and must replay after reconnecting:
+    its file association (-f) and any hot-links (-lData/-lStatus)."""
+
+    def __init__(self):
+        self.association = None
+        self.hotlinks = {}
+        self.reconnects = 0
+
+    def record(self, command):
+        word = command.split()[0] if command.split() else ''
+        if word.startswith('-f'):
+            self.association = command
+        elif word in HOTLINK_COMMANDS:
+            self.hotlinks[word] = command
+        elif word == '-xClose':
+            self.association = None
+            self.hotlinks.clear()
+
+    def replay_commands(self):
+        """Commands to send, in order, on a fresh connection."""
+        commands = [self.association] if self.association else []
+        return commands + list(self.hotlinks.values())
+
+
+# Readiness polling: MASsoft answers '0' until a file/view is ready
+READY_POLL_INITIAL = 0.05  # s before the first re-ask
+READY_POLL_MAX = 1.0       # s cap between re-asks
+READY_TIMEOUT = 20.0       # matches the -d20 retry window
+
+
+def is_ready(reply):
+    """True for a real MASsoft reply, False for '0' (not ready) or no reply."""
+    return bool(reply) and reply != '0'
+
+
+def wait_ready(call, ready=is_ready, timeout=READY_TIMEOUT,
+               initial=READY_POLL_INITIAL, maximum=READY_POLL_MAX):
+    """Call `call()` until `ready(reply)`, re-asking after short, growing
+    pauses instead of a fixed sleep. Returns the last reply on timeout."""
+    deadline = time.monotonic() + timeout
+    delays = backoff_delays(initial, maximum)
+    reply = call()
+    while not ready(reply) and time.monotonic() < deadline:
+        time.sleep(min(next(delays), max(0.0, deadline - time.monotonic())))
+        reply = call()
+    return reply
+
+
+async def await_ready(call, ready=is_ready, timeout=READY_TIMEOUT,
+                      initial=READY_POLL_INITIAL, maximum=READY_POLL_MAX):
+    """Async wait_ready: `call` is a coroutine function."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delays = backoff_delays(initial, maximum)
+    reply = await call()
+    while not ready(reply) and loop.time() < deadline:
+        await asyncio.sleep(min(next(delays), max(0.0, deadline - loop.time())))
+        reply = await call()
+    return reply
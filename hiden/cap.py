@@ -1,3 +1,4 @@
+import os
 import socket
 import time
 import pandas as pd
@@ -5,14 +6,14 @@ import pandas as pd
 
 
 class HidenHPR20Interface:
-    def __init__(self, file_name=None, view=None):
+    def __init__(self, file_name=None, view=None, host=None, port=None):
         self.file_name = file_name
         self.view = view
         # self.file_path = r'C:\Users\08id-user\Documents\Hiden Analytical\MASsoft\11'
         # self.full_path = os.path.join(self.file_path, self.file_name)
         self.full_path = "HIDEN_LastFile"
-        self.host = '10.66.58.225'
-        self.port = 5026
+        self.host = host or os.environ.get('MAS_HOST', '10.66.58.225')
+        self.port = port or int(os.environ.get('MAS_PORT', 5026))
         self.out_terminator = "\r\n"
         self.in_terminator = "\r\n"
         self.data_sock = None
@@ -1,13 +1,33 @@
 import asyncio
 import logging
-from pathlib import PureWindowsPath
+import os
+import time
 
-from caproto import ChannelType
+import numpy as np
+from caproto import ChannelDouble, ChannelType
 from caproto.server import PVGroup, pvproperty, ioc_arg_parser, run
 
-from massoft_client import MASsoftClient, EXPERIMENT_DIRECTORY, MOST_RECENT_FILE
+from analysis import ANALYSIS_FILE, AnalysisStage, load_analyses
+from backfill import RowMerger
+from logconfig import setup_logging
+from massoft_client_async import AsyncMASsoftClient, MAS_HOST, MAS_PORT
+from metrics import (ANALYSIS_DROPPED, ANALYSIS_SECONDS, COMMANDS, COMMAND_SECONDS, HELD_BATCHES,
+                     METRICS_PORT, PARSE_SECONDS, PUBLISH_SECONDS, RECONNECTS, RECORD_QUEUE_DEPTH,
+                     ROWS_DROPPED, ROWS_PARSED, serve)
+from publisher import RowPublisher
+from recorder import ScanRecorder
+from ringbuffer import DEFAULT_CAPACITY
+from status import RunState
 
-logging.basicConfig(level=logging.INFO)
+log = logging.getLogger('rga.ioc')
+
+MAX_SPECTRUM_POINTS = 4096  # upper bound on masses / bar-scan points per cycle
+DEFAULT_MID_COUNT = 10      # MID PVs served before an experiment's legends are read
+RECORD_DIR = os.environ.get('RGA_RECORD_DIR')  # archive every acquisition here if set
+MAX_PUBLISH_RATE = float(os.environ.get('RGA_MAX_RATE', 0))  # Hz, 0 = publish every cycle
+DIAG_INTERVAL = 1.0         # s between updates of the Diag: PVs
+SHM_NAME = os.environ.get('RGA_SHM_NAME')  # publish the live history in shared memory under this name
+BACKFILL = bool(int(os.environ.get('RGA_BACKFILL', 0)))  # fetch cycles pushed before Acquire
 
 class RGAIOC(PVGroup):
     # — Control / Configuration PVs —
@@ -48,27 +68,238 @@ class RGAIOC(PVGroup):
         doc='Write 1 to close the experiment file'
     )
 
-    # — MID-I & Mass PVs (1–10) —
-    for idx in range(1, 11):
-        locals()[f'mid{idx}'] = pvproperty(
-            name=f'XF:08IDB-SE{{{{RGA:1}}}}P:MID{idx}-I',
-            value=0.0, dtype=float,
-            doc=f'RGA reading for MID{idx}',
-        )
-        locals()[f'mass{idx}'] = pvproperty(
-            name=f'XF:08IDB-VA{{{{RGA:1}}}}Mass:MID{idx}',
-            value=0.0, dtype=float,
-            doc=f'RGA mass for MID{idx}',
-        )
-    del idx
-
-    def __init__(self, *args, **kwargs):
+    run_state = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:RunState-I',
+        value=RunState.UNKNOWN.value, dtype=ChannelType.ENUM,
+        enum_strings=[state.value for state in RunState], read_only=True,
+        doc='Experiment state pushed on the MASsoft status hot-link'
+    )
+
+    status_text = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Status-I',
+        value='', dtype=ChannelType.STRING, max_length=40, read_only=True,
+        doc='Last MASsoft status string (e.g. ScanningActive)'
+    )
+
+    latency = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Latency-I',
+        value=0.0, dtype=float, read_only=True,
+        doc='Row arrival to PV update latency (ms)'
+    )
+
+    max_rate = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:MaxRate-SP',
+        value=MAX_PUBLISH_RATE, dtype=float,
+        doc='Maximum MID/spectrum updates per second (0 = no limit)'
+    )
+
+    coalesced = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Coalesced-I',
+        value=0, dtype=int, read_only=True,
+        doc='Rows superseded by a newer row before they were published'
+    )
+
+    backfilled = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Backfilled-I',
+        value=0, dtype=int, read_only=True,
+        doc='Earlier cycles merged into the history by the last backfill'
+    )
+
+    # — Diagnostics, refreshed from the metrics registry every DIAG_INTERVAL s —
+    diag_commands = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:Cmds-I',
+        value=0, dtype=int, read_only=True,
+        doc='Commands sent to MASsoft'
+    )
+
+    diag_cmd_rtt = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:CmdRTT-I',
+        value=0.0, dtype=float, read_only=True,
+        doc='Mean command round trip over the last interval (ms)'
+    )
+
+    diag_rows_parsed = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:RowsParsed-I',
+        value=0, dtype=int, read_only=True,
+        doc='Data rows parsed'
+    )
+
+    diag_rows_dropped = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:RowsDropped-I',
+        value=0, dtype=int, read_only=True,
+        doc='Malformed data rows discarded'
+    )
+
+    diag_row_rate = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:RowRate-I',
+        value=0.0, dtype=float, read_only=True,
+        doc='Rows parsed per second over the last interval'
+    )
+
+    diag_parse_time = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:ParseTime-I',
+        value=0.0, dtype=float, read_only=True,
+        doc='Mean batch parse time over the last interval (ms)'
+    )
+
+    diag_publish_time = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:PublishTime-I',
+        value=0.0, dtype=float, read_only=True,
+        doc='Mean row publish time over the last interval (ms)'
+    )
+
+    diag_reconnects = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:Reconnects-I',
+        value=0, dtype=int, read_only=True,
+        doc='MASsoft links re-established'
+    )
+
+    diag_data_queue = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:DataQueue-I',
+        value=0, dtype=int, read_only=True,
+        doc='Live row batches held back until the backfill catches up'
+    )
+
+    diag_record_queue = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:RecordQueue-I',
+        value=0, dtype=int, read_only=True,
+        doc='Row batches waiting for the recorder'
+    )
+
+    diag_analysis_time = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:AnalysisTime-I',
+        value=0.0, dtype=float, read_only=True,
+        doc='Mean time from frame to analysis result over the last interval (ms)'
+    )
+
+    diag_analysis_dropped = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}:Diag:AnalysisDropped-I',
+        value=0, dtype=int, read_only=True,
+        doc='Frames dropped while the analysis workers were busy'
+    )
+
+    # — Full-spectrum waveform PVs, sized from -lLegends at run time —
+    mass_axis = pvproperty(
+        name='XF:08IDB-VA{{RGA:1}}Mass-Wfm',
+        value=[0.0], dtype=float, max_length=MAX_SPECTRUM_POINTS, read_only=True,
+        doc='Mass of every MID/scan point, in column order'
+    )
+
+    spectrum = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}P:Spectrum-I',
+        value=[0.0], dtype=float, max_length=MAX_SPECTRUM_POINTS, read_only=True,
+        doc='Intensities of the latest cycle, aligned with Mass-Wfm'
+    )
+
+    spectrum_time = pvproperty(
+        name='XF:08IDB-SE{{RGA:1}}P:Spectrum-TS',
+        value=0.0, dtype=float, read_only=True,
+        doc='Unix time of the latest Spectrum-I update'
+    )
+
+    # — MID-I & Mass PVs are built per experiment, see _build_mid_pvs —
+    # — A:<output>-I PVs are built from the configured analyses —
+
+    def __init__(self, *args, host=MAS_HOST, port=MAS_PORT, view=1, experiment=None,
+                 history_capacity=DEFAULT_CAPACITY, spill_dir=None,
+                 record_dir=RECORD_DIR, record_compression=None, metadata=None,
+                 analyses=None, shm_name=SHM_NAME, backfill=BACKFILL, **kwargs):
         super().__init__(*args, **kwargs)
-        self.client    = MASsoftClient()
-        self.client.initialize()
+        # All MASsoft I/O goes through the asyncio client: nothing blocks the loop
+        self.client    = AsyncMASsoftClient(host, port, history_capacity, spill_dir, metadata)
+        # MASsoft view streamed, and the experiment opened at startup (if any)
+        self.view = view
+        self.experiment = experiment
+        # Each acquisition is archived under record_dir (if set)
+        self.record_dir = record_dir
+        self.record_compression = record_compression
+        # Fetch the cycles of a run already under way when Acquire starts
+        self.backfill = backfill
+        # Local readers map the live history under this name (see ringbuffer.SharedHistory)
+        self.shm_name = shm_name
         self._running  = False
         self._task     = None
+        self._heartbeat = None
+        self._diagnostics = None
+        self._publisher = None
+        self._status_write = None
+        self.client.status.subscribe(self._on_status)
         self._mass_vals = []  # store legends
+        # MID-I / Mass channels in column order, and (data column, MID-I channel) pairs
+        self.mid_pvs   = []
+        self.mass_pvs  = []
+        self._column_pvs = []
+        self._build_mid_pvs([0.0] * DEFAULT_MID_COUNT)
+        # Derived quantities, computed in worker processes (see analysis.py)
+        if analyses is None and ANALYSIS_FILE:
+            analyses = load_analyses(ANALYSIS_FILE)
+        self._analysis = AnalysisStage(analyses, self._publish_analysis) if analyses else None
+        self.analysis_pvs = {}
+        for name, waveform in (self._analysis.outputs() if self._analysis else []):
+            if waveform:
+                pv = ChannelDouble(value=[0.0], max_length=MAX_SPECTRUM_POINTS, precision=4)
+            else:
+                pv = ChannelDouble(value=0.0, precision=4)
+            self.pvdb[f'{self.prefix}XF:08IDB-SE{{RGA:1}}A:{name}-I'] = pv
+            self.analysis_pvs[name] = pv
+
+    def _build_mid_pvs(self, mass_values):
+        """Create or resize the MID{n}-I / Mass:MID{n} PV set to match the
+        experiment's masses, and precompute the data column -> PV mapping."""
+        n = len(mass_values)
+        for idx in range(len(self.mid_pvs) + 1, n + 1):
+            mid = ChannelDouble(value=0.0, precision=4)
+            mass = ChannelDouble(value=0.0, precision=2, units='amu')
+            self.pvdb[f'{self.prefix}XF:08IDB-SE{{RGA:1}}P:MID{idx}-I'] = mid
+            self.pvdb[f'{self.prefix}XF:08IDB-VA{{RGA:1}}Mass:MID{idx}'] = mass
+            self.mid_pvs.append(mid)
+            self.mass_pvs.append(mass)
+        for idx in range(n + 1, len(self.mid_pvs) + 1):
+            del self.pvdb[f'{self.prefix}XF:08IDB-SE{{RGA:1}}P:MID{idx}-I']
+            del self.pvdb[f'{self.prefix}XF:08IDB-VA{{RGA:1}}Mass:MID{idx}']
+        del self.mid_pvs[n:], self.mass_pvs[n:]
+        # Data rows are Time, ms, then one column per mass
+        self._column_pvs = [(col, pv) for col, pv in enumerate(self.mid_pvs, start=2)]
+        self._mass_vals = list(mass_values)
+
+    @open_exp.shutdown
+    async def open_exp(self, instance, async_lib):
+        """Stop acquiring and release the MASsoft links and worker processes
+        when the server shuts down."""
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        for task in (self._heartbeat, self._diagnostics):
+            if task is not None:
+                task.cancel()
+        await self.client.shutdown()
+        self.close()
+
+    def close(self):
+        """Stop the analysis worker processes (safe to call more than once)."""
+        if self._analysis is not None:
+            self._analysis.shutdown()
+
+    @open_exp.startup
+    async def open_exp(self, instance, async_lib):
+        """Connect the MASsoft sockets once the server loop is running and
+        keep the command link alive (reconnecting with backoff if it drops)."""
+        try:
+            await self.client.initialize()
+        except OSError as e:
+            log.error(f"MASsoft not reachable at startup: {e}")
+        if self.experiment:
+            await self.experiment_name.write(self.experiment)
+            try:
+                await self.client.open_experiment(self.experiment)
+                await self._watch_status()
+            except (RuntimeError, ConnectionError, OSError) as e:
+                log.error(f"Could not open {self.experiment}: {e}")
+        self._heartbeat = asyncio.create_task(self.client.heartbeat())
+        self._diagnostics = asyncio.create_task(self._update_diagnostics())
+        if METRICS_PORT:
+            serve(METRICS_PORT)
 
     @open_exp.putter
     async def open_exp(self, instance, value):
@@ -77,10 +308,8 @@ class RGAIOC(PVGroup):
             fn = self.experiment_name.value
             if isinstance(fn, (list, tuple)):
                 fn = fn[0]
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None,
-                self.client.open_experiment_commands, fn
-            )
+            await self.client.open_experiment(fn)
+            await self._watch_status()
         return value
 
     @experiment_name.putter
@@ -92,106 +321,254 @@ class RGAIOC(PVGroup):
         """Triggered when someone writes to the START PV."""
         want_acquire = bool(int(value))
         if want_acquire and not self._running:
-            logging.info("Starting acquisition loop")
+            log.info("Starting acquisition loop")
             self._running = True
             # spawn background task
             self._task = asyncio.create_task(self._acquire_loop())
         elif not want_acquire and self._running:
-            logging.info("Stopping acquisition loop")
+            log.info("Stopping acquisition loop")
             self._running = False
             if self._task:
                 self._task.cancel()
         return value
 
     async def _acquire_loop(self):
-        """Read all channels once per second until stopped."""
+        """Publish every row pushed on the data hot-link until stopped."""
         try:
-            # Parses RGA data headers into PVs
-            headers, path = self.client.get_legends(1)
-            mass_values = [
-                float(h.split()[-1])
-                for h in headers
-                if 'mass' in h
-            ]
-            # print('Mass values: {}'.format(mass_values))
-            for idx, mass_val in enumerate(mass_values[:10], start=1):
-                # print(f'Mass {idx}: {mass_val}')
-                pv = getattr(self, f'mass{idx}')
+            if not self.client.current_file:
+                # Use whatever experiment MASsoft currently has open
+                await self.client.open_experiment()
+                await self._watch_status()
+            # Legends/scan parameters come from the metadata cache; the
+            # masses and column layout are precomputed there
+            meta = await self.client.get_metadata(self.view)
+            if not meta.ready:
+                raise RuntimeError(f"View {self.view} not ready: MASsoft sent no legends")
+            mass_values = meta.masses
+            if len(mass_values) > MAX_SPECTRUM_POINTS:
+                log.warning(
+                    f"{len(mass_values)} masses exceed MAX_SPECTRUM_POINTS; "
+                    f"waveforms are truncated to {MAX_SPECTRUM_POINTS}"
+                )
+            await self.mass_axis.write(mass_values[:MAX_SPECTRUM_POINTS])
+            self._build_mid_pvs(mass_values)
+            for pv, mass_val in zip(self.mass_pvs, mass_values):
                 await pv.write(mass_val)
-                logging.debug(f"Wrote {mass_val:.2f} to {pv.name}")
-
-            self.client.open_experiment_data(path)
-            while self._running:
-                print(self._running)
-                # print('Trying......')
-                try:
-                    raw_data = self.client.data_socket.send_command(f"-lData -v1")
-                    if raw_data != '0':
-                        lines = raw_data.strip().split('\r\n')
-                        # print(f'Lines: {lines}')
-                        for line in lines:
-                            if line.strip() == '0':
-                                # print("Ignoring first line with '0'.")
-                                continue
-                            values = line.split()[2:]
-                            # print(f'Values: {values}')
-                            # print(f'Length of values: {len(values)}')
-                            # print('Length of mass values: {}'.format(len(mass_values)))
-                            if len(values) == len(mass_values):
-                                # print('updating PVs')
-                                for idx, val in enumerate(values):
-                                    # print(f'Index {idx}: {val}')
-                                    pv = getattr(self, f'mid{idx+1}')
-                                    print(pv)
-                                    await pv.write(float(val))
-                                    logging.debug(f'Wrote {val} to {pv.name}')
-                except Exception as e:
-                    print(f"Caught an exception: {e}")
-                    if str(e).startswith('[Errno 32]'):
-                        self._running = 0
-
-                await asyncio.sleep(1.0)
+
+            # Time, ms and one column per mass, kept in a bounded history;
+            # in shared memory for local readers and the analysis workers.
+            # It stays readable after the acquisition, until the next one
+            analysis = self._analysis
+            history = self.client.new_history(meta.columns, shared=self.shm_name or analysis is not None)
+            if analysis is not None:
+                analysis.start(history, mass_values)
+            recorder = self._start_recorder(meta)
+
+            def store(rows, stamps):
+                history.extend(rows)
+                if recorder is not None:
+                    recorder.append(rows, stamps)
+
+            # Rows reach the history and recorder in cycle order, each once;
+            # a backfill merges earlier cycles ahead of the live ones
+            merger = RowMerger(store, backfilling=self.backfill)
+            backfill_task = None
+            if self.backfill:
+                backfill_task = asyncio.create_task(self._backfill(merger, meta))
+
+            # Backlogged rows coalesce to the newest; publishing runs apart
+            # from the stream so a slow CA write never holds up reading
+            self._publisher = publisher = RowPublisher(self._publish_row, self.max_rate.value)
+            publish_task = asyncio.create_task(publisher.run())
+
+            try:
+                async for frame in self.client.stream_data(view=self.view, schema=meta.schema):
+                    if frame.dropped:
+                        log.warning(
+                            f"Dropped {frame.dropped} malformed rows "
+                            f"({self.client.data_sock.framer.dropped} dropped so far)"
+                        )
+                    merger.live(frame.rows, time.time())
+                    if analysis is not None:
+                        analysis.offer(frame.arrival)
+                    publisher.offer(frame.rows, frame.arrival)
+                    # A read that finds data already buffered does not yield;
+                    # let the other sessions on this loop have their turn
+                    await asyncio.sleep(0)
+            except (ConnectionError, OSError) as e:
+                # stream_data resumes a dropped link itself; this is it giving up
+                log.error(f"Data hot-link ended: {e}")
+                # Show the last row received before the link went down
+                publish_task.cancel()
+                await asyncio.gather(publish_task, return_exceptions=True)
+                await publisher.flush()
+            finally:
+                publish_task.cancel()
+                log.info(f"Publisher: {publisher.stats()}")
+                if backfill_task is not None:
+                    # Stores the live rows it was holding back
+                    backfill_task.cancel()
+                    await asyncio.gather(backfill_task, return_exceptions=True)
+                log.info(f"Merged rows: {merger.stats()}")
+                if analysis is not None:
+                    await analysis.stop()
+                    log.info(f"Analysis: {analysis.stats()}")
+                history.flush()
+                if recorder is not None:
+                    # Joining the writer waits on disk I/O: keep it off the loop
+                    await asyncio.get_running_loop().run_in_executor(None, recorder.close)
+                # Drop the hot-link; the next acquisition starts on a fresh socket
+                self.client.data_sock.close()
         except asyncio.CancelledError:
-            logging.info("Acquisition loop cancelled")
+            log.info("Acquisition loop cancelled")
             return
+        except Exception as e:
+            log.exception(f"Acquisition failed: {e}")
+        # Ended on its own (setup error, lost link): Acquire must show it
+        self._running = False
+        await self.acquire.write(0)
+
+    async def _backfill(self, merger, meta):
+        """Fetch the cycles pushed before this acquisition and merge them."""
+        frames = self.client.fetch_cycles(self.view, schema=meta.schema)
+        try:
+            await merger.backfill(frames)
+        except RuntimeError as e:
+            log.error(f"Backfill not possible: {e}")
+        await self.backfilled.write(merger.backfilled)
+
+    async def _watch_status(self):
+        """Make sure the status hot-link is feeding RunState-I/Status-I."""
+        try:
+            await self.client.watch_status(self.view)
+        except (RuntimeError, ConnectionError, OSError) as e:
+            log.warning(f"Status hot-link not available: {e}")
+
+    def _on_status(self, old, new, raw):
+        # Called on the event loop by the client's status watcher
+        self._status_write = asyncio.ensure_future(self._publish_status(new, raw))
+
+    async def _publish_status(self, state, raw):
+        await self.run_state.write(state.value)
+        await self.status_text.write(raw[:40])
+
+    async def _publish_row(self, row, arrival):
+        """Write one cycle to the spectrum, MID-I and diagnostic PVs."""
+        started = time.perf_counter()
+        stamp = time.time()
+        # One CA update carries the whole spectrum of the cycle. The writes
+        # only queue updates for subscribers and rarely suspend, so they are
+        # awaited in turn: gathering them wraps every write in a task, which
+        # benchmarks/bench_acquisition.py measured at ~40% more CPU per row
+        # with 400 channels and no faster publication
+        await self.spectrum.write(row[2:2 + MAX_SPECTRUM_POINTS], timestamp=stamp)
+        await self.spectrum_time.write(stamp, timestamp=stamp)
+        for col, pv in self._column_pvs:
+            await pv.write(row[col], timestamp=stamp)
+        PUBLISH_SECONDS.observe(time.perf_counter() - started)
+        latency_ms = (asyncio.get_running_loop().time() - arrival) * 1e3
+        await self.latency.write(latency_ms)
+        if self.coalesced.value != self._publisher.coalesced:
+            await self.coalesced.write(self._publisher.coalesced)
+        log.debug(f"Row published {latency_ms:.3f} ms after arrival")
+
+    async def _publish_analysis(self, results, arrival):
+        """Write one cycle's analysis results to the A:<output>-I PVs."""
+        stamp = time.time()
+        for name, value in results.items():
+            if isinstance(value, np.ndarray):
+                value = value[:MAX_SPECTRUM_POINTS]
+            await self.analysis_pvs[name].write(value, timestamp=stamp)
+
+    async def _update_diagnostics(self):
+        """Copy the hot-path metrics to the Diag: PVs every DIAG_INTERVAL s.
+        Times are means over the last interval, so they track current load."""
+        timings = [
+            (self.diag_cmd_rtt, COMMAND_SECONDS),
+            (self.diag_parse_time, PARSE_SECONDS),
+            (self.diag_publish_time, PUBLISH_SECONDS),
+            (self.diag_analysis_time, ANALYSIS_SECONDS),
+        ]
+        totals = [
+            (self.diag_commands, COMMANDS),
+            (self.diag_rows_parsed, ROWS_PARSED),
+            (self.diag_rows_dropped, ROWS_DROPPED),
+            (self.diag_reconnects, RECONNECTS),
+            (self.diag_data_queue, HELD_BATCHES),
+            (self.diag_record_queue, RECORD_QUEUE_DEPTH),
+            (self.diag_analysis_dropped, ANALYSIS_DROPPED),
+        ]
+        seen = [(hist.count, hist.sum) for _, hist in timings]
+        rows = ROWS_PARSED.value
+        while True:
+            await asyncio.sleep(DIAG_INTERVAL)
+            for i, (pv, hist) in enumerate(timings):
+                count, total = hist.count, hist.sum
+                n = count - seen[i][0]
+                await pv.write((total - seen[i][1]) / n * 1e3 if n else 0.0)
+                seen[i] = (count, total)
+            await self.diag_row_rate.write((ROWS_PARSED.value - rows) / DIAG_INTERVAL)
+            rows = ROWS_PARSED.value
+            for pv, metric in totals:
+                if pv.value != metric.value:
+                    await pv.write(metric.value)
+
+    def _start_recorder(self, meta):
+        """Open a new on-disk recording for this acquisition, if enabled."""
+        if not self.record_dir:
+            return None
+        path = os.path.join(self.record_dir, time.strftime('rga_%Y%m%d_%H%M%S'))
+        attrs = {
+            'experiment': meta.path,
+            'view': meta.view,
+            'masses': meta.masses,
+            'scan_parameters': meta.scan_parameters,
+        }
+        log.info(f"Recording acquisition to {path}")
+        return ScanRecorder(path, meta.columns, attrs, compression=self.record_compression)
+
+    @max_rate.putter
+    async def max_rate(self, instance, value):
+        value = max(0.0, float(value))
+        if self._publisher is not None:
+            # Applies from the next publication of the running acquisition
+            self._publisher.max_rate = value
+        return value
 
     @run_exp.putter
     async def run_exp(self, instance, value):
         want = bool(int(value))
         if want:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, self.client.run_experiment)
+            # Start confirmation arrives later on the status link
+            await self.client.run_experiment(view=self.view, verify_timeout=0)
+            await self._watch_status()
 
         return value
 
     @abort_exp.putter
     async def abort_exp(self, instance, value):
         """Write 1 to abort the running experiment, always resets to 0."""
-        self.client.shutdown()
-        self.client.initialize()
-        self.client.command_socket.send_command('-f"%HIDEN_LastFile%"')
-        path = self.client.command_socket.send_command('-xFilename')
-        # print(f'Aborting experiment: {path}')
         want = bool(int(value))
         if want:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, self.client.abort_experiment)
+            await self.client.abort_experiment(reassociate=True)
         return value
 
     @close_exp.putter
     async def close_exp(self, instance, value):
-        self.client.command_socket.send_command('-f"%HIDEN_LastFile%"')
         want = bool(int(value))
         if want:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, self.client.close_experiment)
+            await self.client.close_experiment(reassociate=True)
         return value
 
 
 if __name__ == '__main__':
+    setup_logging()
     ioc_opts, run_opts = ioc_arg_parser(
         default_prefix='',  # PV names include the {{RGA:1}} macro literally
         desc='RGA MASsoft IOC'
     )
     ioc = RGAIOC(**ioc_opts)
-    run(ioc.pvdb, **run_opts)
+    try:
+        run(ioc.pvdb, **run_opts)
+    finally:
+        ioc.close()
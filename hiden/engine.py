@@ -0,0 +1,110 @@
+"""Serve several RGA acquisition sessions from one caproto IOC process.
+
+Each session is an (instrument, experiment, view) with its own PV prefix,
+described in a JSON file:
+
+    [
+      {"name": "RGA1", "host": "10.66.58.225", "experiment": "file1.exp", "view": 1},
+      {"name": "RGA2", "host": "10.66.58.226", "port": 5026, "view": 2,
+       "prefix": "XF:08IDB-RGA2:"}
+    ]
+
+    python hiden/engine.py --sessions sessions.json --list-pvs
+
+Every session gets its own RGAIOC, MASsoft sockets, metadata cache, status
+tracker and recording directory, so one instrument's state never leaks into
+another's; all of them run as tasks on the same event loop.  Socket I/O never
+blocks the loop, each session's reads time out on their own, and the
+acquisition loop yields after every batch, so a slow or flooding instrument
+cannot hold up the others.  The Diag: PVs of every session show the
+process-wide metrics.  With RGA_SHM_NAME set, a session's live history is
+published in shared memory as <RGA_SHM_NAME>_<name>.
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+
+from caproto.server import ioc_arg_parser, run
+
+from cap2 import RECORD_DIR, SHM_NAME, RGAIOC
+from logconfig import setup_logging
+from massoft_client_async import MAS_HOST, MAS_PORT
+from metadata import MetadataCache
+
+log = logging.getLogger('rga.engine')
+
+SessionSpec = collections.namedtuple(
+    'SessionSpec', 'name host port experiment view prefix',
+    defaults=(MAS_HOST, MAS_PORT, None, 1, None),
+)
+
+
+def load_sessions(path):
+    """Read session specs from a JSON list; prefix defaults to '<name>:'."""
+    with open(path) as f:
+        entries = json.load(f)
+    specs = []
+    for entry in entries:
+        spec = SessionSpec(**entry)
+        if spec.prefix is None:
+            spec = spec._replace(prefix=f'{spec.name}:')
+        specs.append(spec)
+    names = [spec.name for spec in specs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Session names must be unique: {names}")
+    return specs
+
+
+class AcquisitionEngine:
+    """One RGAIOC per session, all served from a single pvdb."""
+
+    def __init__(self, specs, record_dir=RECORD_DIR, shm_name=SHM_NAME, **ioc_kwargs):
+        self.sessions = {}
+        self.pvdb = {}
+        for spec in specs:
+            ioc = RGAIOC(
+                prefix=spec.prefix, host=spec.host, port=spec.port, view=spec.view,
+                experiment=spec.experiment, metadata=MetadataCache(),
+                record_dir=os.path.join(record_dir, spec.name) if record_dir else None,
+                shm_name=f'{shm_name}_{spec.name}' if shm_name else None,
+                **ioc_kwargs,
+            )
+            clash = self.pvdb.keys() & ioc.pvdb.keys()
+            if clash:
+                raise ValueError(f"Session {spec.name} reuses PV names: {sorted(clash)[:3]}...")
+            self.pvdb.update(ioc.pvdb)
+            # MID PVs are added/removed at run time: share the served dict
+            ioc.pvdb = self.pvdb
+            self.sessions[spec.name] = ioc
+            log.info(f"Session {spec.name}: {spec.host}:{spec.port} view {spec.view} as {spec.prefix}*")
+
+    def close(self):
+        """Stop every session's worker processes."""
+        for ioc in self.sessions.values():
+            ioc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--sessions', required=True, help='JSON file of session specs')
+    args, rest = parser.parse_known_args()
+    # The remaining arguments are the usual caproto IOC options
+    sys.argv = [sys.argv[0]] + rest
+    setup_logging()
+    ioc_opts, run_opts = ioc_arg_parser(
+        default_prefix='',  # every session brings its own prefix
+        desc='RGA MASsoft IOC for several instruments/views'
+    )
+    ioc_opts.pop('prefix', None)
+    engine = AcquisitionEngine(load_sessions(args.sessions), **ioc_opts)
+    try:
+        run(engine.pvdb, **run_opts)
+    finally:
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import logging
+
+log = logging.getLogger('massoft.framing')
+
+MESSAGE_TERMINATOR = b"\r\n"
+
+
+class LineFramer:
+    """Gather received bytes and split them into complete terminated records.
+
+    Bytes are received straight into a preallocated bytearray with
+    ``recv_into``; records are handed out as memoryview slices of that buffer,
+    so nothing is copied until the caller decodes a record.  Slices are only
+    valid until the next ``recv_from``/``feed`` call.
+    """
+
+    def __init__(self, terminator=MESSAGE_TERMINATOR, size=65536, max_record=1 << 22, name="Framer"):
+        if isinstance(terminator, str):
+            terminator = terminator.encode('utf-8')
+        self.terminator = terminator
+        self.max_record = max_record
+        self.name = name
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._head = 0          # start of the first unconsumed byte
+        self._tail = 0          # end of the received bytes
+        self._scan = 0          # where the next terminator search starts
+        self._split = False     # the record at _head spans more than one read
+        self._discarding = False
+        # Counters
+        self.framed = 0
+        self.reassembled = 0
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        """Number of received bytes not yet returned as a record."""
+        return self._tail - self._head
+
+    def _reserve(self, n):
+        """Make room for at least n more bytes after _tail."""
+        if len(self._buf) - self._tail >= n:
+            return
+        used = self._tail - self._head
+        if self._head and len(self._buf) - used >= n:
+            # Slide the partial record down to the start of the buffer
+            self._view[:used] = self._view[self._head:self._tail]
+        else:
+            if used + n > self.max_record:
+                self._drop_partial()
+                used = 0
+                if n <= len(self._buf):
+                    self._head = self._tail = self._scan = 0
+                    return
+            size = len(self._buf)
+            while size < used + n:
+                size *= 2
+            buf = bytearray(size)
+            buf[:used] = self._view[self._head:self._tail]
+            self._buf = buf
+            self._view = memoryview(buf)
+        self._scan -= self._head
+        self._head, self._tail = 0, used
+
+    def _drop_partial(self):
+        """Discard an oversized record up to its terminator."""
+        if not self._discarding:
+            log.warning(f"{self.name} dropping record longer than {self.max_record} bytes")
+            self.dropped += 1
+        self._discarding = True
+        self._head = self._tail = self._scan = 0
+        self._split = False
+
+    def _received(self, n):
+        if self._tail > self._head:
+            self._split = True
+        self._tail += n
+
+    def recv_from(self, sock, size=65536):
+        """Read once from sock into the buffer. Returns the byte count (0 on EOF)."""
+        self._reserve(size)
+        n = sock.recv_into(self._view[self._tail:], size)
+        if n:
+            self._received(n)
+        return n
+
+    def feed(self, data):
+        """Append bytes received elsewhere (e.g. from an asyncio reader)."""
+        n = len(data)
+        self._reserve(n)
+        self._view[self._tail:self._tail + n] = data
+        self._received(n)
+
+    def records(self):
+        """Yield each complete record (without terminator) as a memoryview."""
+        term = self.terminator
+        while True:
+            end = self._buf.find(term, self._scan, self._tail)
+            if end < 0:
+                # Keep the last len(term)-1 bytes in the search window
+                self._scan = max(self._head, self._tail - len(term) + 1)
+                return
+            start = self._head
+            self._head = self._scan = end + len(term)
+            if self._discarding:
+                self._discarding = False
+                continue
+            self.framed += 1
+            if self._split:
+                self.reassembled += 1
+                self._split = False
+            if self._head == self._tail:
+                # Buffer fully consumed: rewind so reads start at offset 0
+                self._head = self._tail = self._scan = 0
+                yield self._view[start:end]
+                return
+            yield self._view[start:end]
+
+    def lines(self):
+        """Return every complete record decoded to str."""
+        return [str(rec, 'utf-8') for rec in self.records()]
+
+    def mark_dropped(self, n=1):
+        """Record that a consumer discarded n records (e.g. malformed rows)."""
+        self.dropped += n
+
+    def stats(self):
+        return {
+            'framed': self.framed,
+            'reassembled': self.reassembled,
+            'dropped': self.dropped,
+            'pending_bytes': self.pending,
+        }
+
+    def reset(self):
+        """Forget any buffered bytes (used after a reconnect)."""
+        self._head = self._tail = self._scan = 0
+        self._split = False
+        self._discarding = False
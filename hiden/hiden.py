@@ -1,40 +1,54 @@
-import socket
+import os
 import time
 import pandas as pd
 
+from backoff import wait_ready
+from metadata import get_cache
+from pool import get_pool
+from ringbuffer import ColumnRingBuffer, DEFAULT_CAPACITY
+
 
 class HidenHPR20Interface:
-    def __init__(self, file_name = None, view = None):
+    def __init__(self, file_name = None, view = None, host = None, port = None,
+                 history_capacity = DEFAULT_CAPACITY, spill_dir = None, pool = None, metadata = None):
         self.file_name = file_name
         self.view = view
         # self.file_path = r'C:\Users\08id-user\Documents\Hiden Analytical\MASsoft\11'
         # self.full_path = os.path.join(self.file_path, self.file_name)
         self.full_path = "HIDEN_LastFile"
-        self.host = '10.66.58.225'
-        self.port = 5026
+        self.host = host or os.environ.get('MAS_HOST', '10.66.58.225')
+        self.port = port or int(os.environ.get('MAS_PORT', 5026))
         self.out_terminator = "\r\n"
         self.in_terminator = "\r\n"
+        # Connections are leased from a pool shared across the process
+        self.pool = pool or get_pool()
+        self.metadata = metadata or get_cache()
+        self.sock = None
         self.data_sock = None
+        # Bounded columnar history, created once the headers are known
+        self.history_capacity = history_capacity
+        self.spill_dir = spill_dir
+        self.history = None
 
 
-    # Establish a socket connection
-    def open_socket(self):
+    # Lease a connection from the pool (optionally already associated with file)
+    def open_socket(self, file = None):
+        if self.sock:
+            return
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((self.host, self.port))
+            self.sock = self.pool.acquire('command', self.host, self.port, file=file)
             print("Socket connected.")
-            # Send a dummy status check to clear any initial data
-            self.send_command('-xStatus')  # Ignore the first response
         except Exception as e:
             print(f"Failed to connect: {e}")
             self.sock = None
 
 
-    # Close the main socket connection
+    # Hand the connection back to the pool, where it stays warm
     def close_socket(self):
         if self.sock:
-            self.sock.close()
-            print("Socket closed.")
+            self.pool.release(self.sock)
+            self.sock = None
+            print("Socket released.")
         if self.data_sock:
             self.data_sock.close()
             print("Data socket closed.")
@@ -43,10 +57,9 @@ class HidenHPR20Interface:
     # Send a command through the socket
     def send_command(self, command):
         try:
-            self.sock.sendall((command + self.out_terminator).encode())
-            response = self.sock.recv(4096)
-            decoded_response = response.decode().strip()
-            return decoded_response
+            response = self.sock.send_command(command)
+            self.metadata.observe(command)
+            return response
         except Exception as e:
             print(f"Failed to send command: {e}")
             return None
@@ -56,8 +69,8 @@ class HidenHPR20Interface:
     def open_file(self):
         if self.sock:
             response = self.send_command(f'-f "{self.full_path}" -d20')
-            time.sleep(1)
-            response = self.send_command(f'-f "{self.full_path}" -d20')
+            # The name may now refer to another experiment
+            self.metadata.invalidate(self.full_path)
             print(f"File Open Response: {response}")
             if response == '1':  # File opened successfully
                 # response = self.send_command('-xGo -odt -d20')
@@ -83,150 +96,94 @@ class HidenHPR20Interface:
         if self.sock:
             response = self.send_command('-xFilename')
             print(f"Current Filename: {response}")
+            self.close_socket()
         else:
             print("Socket not connected.")
 
 
     def parse_data(self, view_num, data):
-        # Split the received data into lines
-        lines = data.strip().split('\n')
-        parsed_data = []
-        self.open_socket()
-        headers = self.data_headers(view_num)
-        time.sleep(1)
-        headers = self.data_headers(view_num)
-        for line in lines:
-            # Ignore the first line if it only contains '0'
-            if line.strip() == '0':
-                print("Ignoring first line with '0'.")
-                continue
-            values = line.split()
-            # Check if the number of parsed values is less than expected
-            if len(values) < len(headers):
-                print(f"Line skipped due to insufficient values: {line.strip()}")
-                continue  # Skip this line if it doesn't have enough values
-            # If line is valid, append to parsed_data
-            parsed_data.append(values)
+        meta = self.get_metadata(view_num)
+        # Parse the whole block at once; malformed rows are left out
+        frame = meta.schema.parse(data)
+        if frame.dropped:
+            print(f"Skipped {frame.dropped} malformed lines")
         # Convert parsed_data to a DataFrame, if there's data
-        if parsed_data:
-            df = pd.DataFrame(parsed_data, columns=headers)
+        if len(frame):
+            df = pd.DataFrame(frame.rows, columns=meta.columns)
             return df
         else:
             print("No data parsed.")
             return pd.DataFrame()  # Return an empty DataFrame if no data
 
 
+    # Legends and scan parameters, asked once per (file, view) and cached
+    def get_metadata(self, view_num):
+        def fetch():
+            # A link of its own: the caller may be holding self.sock
+            with self.pool.lease('command', self.host, self.port, file=self.full_path) as sock:
+                # Re-ask while MASsoft answers '0' (view not ready yet)
+                legends = wait_ready(lambda: sock.send_command(f"-lLegends -v{view_num} -d20"))
+                return legends, sock.send_command(f"-lScanParameters -v{view_num} -d20")
+        return self.metadata.load(self.full_path, view_num, fetch)
+
+
     def scan_parameters(self, view_num):
-        self.open_socket()
-        self.open_file()
-        try:
-            while True:
-                raw_data = self.send_command(f"-lScanParameters -v{view_num} -d20")
-                print(raw_data)
-                time.sleep(1)
-                raw_data = self.send_command(f"-lScanParameters -v{view_num} -d20")
-                print(raw_data)
-                if raw_data != '0':
-                    data_stripped = raw_data.replace("\r\n", "\t").split("\t")
-                    print(data_stripped)
-                    headers = data_stripped[:11]
-                    print(headers)
-                    rows = [data_stripped[i:i+11] for i in range(11, len(data_stripped), 11)]
-                    print(rows)
-                    data_dict = {header: [] for header in headers}
-                    for row in rows:
-                        for i, header in enumerate(headers):
-                            data_dict[header].append(row[i])
-                    print(data_dict)
-                    break
-                else:
-                    time.sleep(1)                
-        except KeyboardInterrupt:
-            print("Done.")
-        self.close_socket()
+        data_dict = self.get_metadata(view_num).scan_table()
+        print(data_dict)
         return data_dict
 
 
     def data_headers(self, view_num):
-        self.open_socket()
-        try:
-            while True:
-                raw_data = self.send_command(f"-lLegends -v{view_num} -d20")
-                time.sleep(1)
-                raw_data = self.send_command(f"-lLegends -v{view_num} -d20")
-                if raw_data != '0':
-                    data_stripped = raw_data.replace("\r\n", "\t").split("\t")
-                    break
-                else:
-                    time.sleep(1)                
-        except KeyboardInterrupt:
-            print("Done.")
-        self.close_socket()
-        return data_stripped
+        return self.get_metadata(view_num).legends
 
 
     def data_collecting_loop(self, view_num):
-        headers = self.data_headers(view_num)
-        print(f'Collecting {headers}')
+        meta = self.get_metadata(view_num)
+        print(f'Collecting {meta.columns}')
         self.open_socket()
         self.open_file()
-        parsed_data = []
+        self.history = ColumnRingBuffer(meta.columns, self.history_capacity, spill_dir=self.spill_dir)
+        cycle = 0
         while True:
             raw_data = self.send_command(f"-lData -v{view_num}")
             if raw_data != '0':
-                lines = raw_data.strip().split('\r\n')
-                print(f'Lines: {lines}')
-                for line in lines:
-                    if line.strip() == '0':
-                        print("Ignoring first line with '0'.")
-                        continue
-                    values = line.split()
-                    print(f'Values: {values}')
-                    if len(values) < len(headers):
-                        print(f"Line skipped due to insufficient values: {line.strip()}")
-                        continue
-                    parsed_data.append(values)
-
-                if parsed_data:
-                    # Convert parsed data to DataFrame
-                    df = pd.DataFrame(parsed_data, columns=headers)
-                    print(df)
+                frame = meta.schema.parse(raw_data, cycle)
+                cycle = frame.end_cycle
+                if frame.dropped:
+                    print(f"Skipped {frame.dropped} malformed lines")
+                self.history.extend(frame.rows)
+
+                if len(frame):
+                    # Show only the rows that just arrived
+                    print(frame)
+                    print(frame.rows)
             time.sleep(1)
 
     def data_collecting_loop2(self, view_num):
-        headers = self.data_headers(view_num)
+        meta = self.get_metadata(view_num)
+        headers = meta.columns
         print(f'Collecting {headers}')
         self.open_socket()
         self.open_file()
 
-        data_dict = {header: [] for header in headers}
+        self.history = ColumnRingBuffer(headers, self.history_capacity, spill_dir=self.spill_dir)
 
         try:
             while True:
                 raw_data = self.send_command(f"-lData -v{view_num}")
                 if raw_data and raw_data != '0':
-                    lines = raw_data.strip().split('\r\n')
+                    frame = meta.schema.parse(raw_data)
+                    if frame.dropped:
+                        print(f"Skipping {frame.dropped} lines (wrong length)")
 
-                    for line in lines:
-                        if line.strip() == '0':
-                            # skip the initial "0"
-                            continue
+                    self.history.extend(frame.rows)
 
-                        values = line.split()
-                        if len(values) != len(headers):
-                            print(f"Skipping line (wrong length): {line!r}")
-                            continue
-
-                        # CORRECTED LOOP:
-                        for header, val in zip(headers, values):
-                            data_dict[header].append(val)
-                            # verbose debug:
-                            print(f" Appended {val!r} to '{header}'")
-
-                    # show your current dict
-                    print("Current data_dict:")
-                    for hdr, col in data_dict.items():
-                        print(f"  {hdr}: {col}")
+                    # show the newest row
+                    latest = self.history.latest()
+                    if latest is not None:
+                        print(f"{len(self.history)} rows buffered, latest:")
+                        for hdr, val in zip(headers, latest):
+                            print(f"  {hdr}: {val}")
 
                 time.sleep(1)
 
@@ -234,8 +191,9 @@ class HidenHPR20Interface:
             print("Stopping data collection.")
         finally:
             self.close_socket()
+            self.history.flush()
 
-        return data_dict
+        return self.history.to_dict()
 
     # #WIP
     # # Monitor the status of the MSIU
@@ -0,0 +1,109 @@
+"""Logging set-up for the RGA clients and IOCs.
+
+Importing the client modules configures nothing; an entry point calls
+setup_logging() once.  Records are put on a queue by the logging call and
+written by a background thread, so acquisition never waits on the console
+or a log file.
+
+Loggers are named by subsystem, so levels can be set per subsystem:
+
+    massoft.client, massoft.async   MASsoft links (sync / asyncio client)
+    massoft.commands                per-command traces (DEBUG, sampled)
+    massoft.pool, massoft.framing   connection pool, line framing
+    rga.ioc, rga.publisher          caproto IOC and its PV publishing
+    rga.recorder, rga.metadata, ... data path
+
+Environment (defaults for setup_logging):
+
+    RGA_LOG_LEVEL=INFO                      root level
+    RGA_LOG_LEVELS=massoft.commands=DEBUG   per-subsystem levels, comma separated
+    RGA_LOG_SAMPLE=100                      keep 1 in N command traces
+    RGA_LOG_FILE=rga.log                    also write to this file
+"""
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_LEVEL = os.environ.get('RGA_LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('RGA_LOG_LEVELS', '')
+LOG_FILE = os.environ.get('RGA_LOG_FILE')
+COMMAND_SAMPLE = int(os.environ.get('RGA_LOG_SAMPLE', 1))
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+COMMAND_LOGGER = 'massoft.commands'
+
+_listener = None
+_handler = None
+
+
+class SampleFilter(logging.Filter):
+    """Let one record in every `every` through."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._seen = itertools.count()
+
+    def filter(self, record):
+        return next(self._seen) % self.every == 0
+
+
+def parse_levels(spec):
+    """'name=LEVEL,name=LEVEL' -> {name: level}."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, sep, level = item.partition('=')
+        if not sep:
+            raise ValueError(f"Expected name=LEVEL, got {item!r}")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=LOG_LEVEL, levels=LOG_LEVELS, filename=LOG_FILE, sample=COMMAND_SAMPLE):
+    """Route all logging through a queue to a writer thread (console, plus
+    `filename` if given). `levels` is a {logger: level} dict or a
+    'name=LEVEL,...' string; with sample > 1 only one in `sample` command
+    traces is kept. Calling it again replaces the previous set-up.
+    Returns the QueueListener."""
+    global _listener, _handler
+    stop_logging()
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if filename:
+        handlers.append(logging.FileHandler(filename))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _handler = logging.handlers.QueueHandler(records)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    if isinstance(levels, str):
+        levels = parse_levels(levels)
+    for name, name_level in levels.items():
+        logging.getLogger(name).setLevel(name_level)
+    commands = logging.getLogger(COMMAND_LOGGER)
+    for old in [f for f in commands.filters if isinstance(f, SampleFilter)]:
+        commands.removeFilter(old)
+    if sample > 1:
+        commands.addFilter(SampleFilter(sample))
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Write out whatever is still queued at exit
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Write out the queued records and detach the queue; later records fall
+    back to logging's last-resort stderr handler."""
+    global _listener, _handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    _listener = _handler = None
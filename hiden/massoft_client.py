@@ -4,22 +4,39 @@ import time
 import logging
 from contextlib import closing
 import os
+import queue
+import re
+import select
+import threading
 
-# Logger setup
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("massoft_client.log")]
-)
+from backoff import HOTLINK_COMMANDS, READY_TIMEOUT, LinkState, backoff_delays, wait_ready
+from framing import LineFramer
+from metadata import get_cache
+from metrics import (COMMANDS, COMMAND_SECONDS, COMMAND_TIMEOUTS, DATA_QUEUE_DEPTH, PARSE_SECONDS,
+                     RECONNECTS, ROWS_DROPPED, ROWS_PARSED)
+from parsing import CycleCounter
+from pool import get_pool
+from ringbuffer import ColumnRingBuffer, DEFAULT_CAPACITY
+from status import ACTIVE_STATES, STOPPED_STATES, StatusTracker
+
+# Logging is configured by the entry point (see logconfig.setup_logging)
+log = logging.getLogger('massoft.client')
+command_log = logging.getLogger('massoft.commands')
 
 # System Configuration
-MAS_HOST = '10.66.58.225'
-MAS_PORT = 5026
+MAS_HOST = os.environ.get('MAS_HOST', '10.66.58.225')
+MAS_PORT = int(os.environ.get('MAS_PORT', 5026))
 EXPERIMENT_DIRECTORY = r"C:\Users\08id-user\Documents\Hiden Analytical\MASsoft\11"
 EXPERIMENT_DIRECTORY_ENV = "%HIDEN_FilePath%" # Environment variable name for the experiment directory
 MOST_RECENT_FILE = "%HIDEN_LastFile%" # This environment variable name already includes the path
 TIME_PERSISTANCE = 20 # Time in seconds for the messages to keep trying waiting for success
 MESSAGE_TERMINATOR = "\r\n"
+DATA_QUEUE_SIZE = 64 # Row batches buffered between the data reader and its consumer
+MULTILINE_IDLE = 0.05 # s without a new line that ends a multi-line reply
+STREAM_RETRIES = 5 # Data link losses in a row (and connect attempts each) before stream_data gives up
+# Commands whose reply can span several lines (and TCP segments)
+MULTILINE_COMMANDS = ('-lLegends', '-lScanParameters', '-lData')
+_RETRY_FLAG = re.compile(r'\s-d\d+$')
 
 class MASsoftSocket:
     def __init__(self, host, port, name="GenericSocket", timeout=20):
@@ -28,65 +45,236 @@ class MASsoftSocket:
         self.name = name
         self.timeout = timeout
         self.sock = None
+        self.framer = LineFramer(MESSAGE_TERMINATOR, name=name)
+        self.state = LinkState()  # file association and hot-links to replay
 
     def connect(self):
-        """Establish or re-establish the socket connection."""
+        """Establish the socket connection (no-op if already connected)."""
         if self.sock:
-            try:
-                # Test current socket
-                self.sock.sendall(b'')
-                return
-            except Exception:
-                self.close()
+            return
         self.sock = socket.create_connection((self.host, self.port))
         self.sock.settimeout(self.timeout)
-        logging.info(f"{self.name} connected to {self.host}:{self.port}")
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.framer.reset()
+        log.info(f"{self.name} connected to {self.host}:{self.port}")
         try:
-            _ = self.sock.recv(4096)
+            self._read_lines()  # discard greeting
         except socket.timeout:
             pass
 
+    def _read_lines(self, idle=0.0):
+        """Block until at least one complete record is buffered, then return it
+        joined with the records that follow within `idle` s of each other
+        (the rest of a multi-line reply, which may come in several segments)."""
+        lines = self.framer.lines()
+        while not lines:
+            if not self.framer.recv_from(self.sock):
+                raise ConnectionError(f"{self.name} closed by peer.")
+            lines = self.framer.lines()
+        while select.select([self.sock], [], [], idle)[0]:
+            if not self.framer.recv_from(self.sock):
+                break
+            lines += self.framer.lines()
+        # A record cut across segments is still arriving: it belongs to this reply
+        while self.framer.pending:
+            if not self.framer.recv_from(self.sock):
+                break
+            lines += self.framer.lines()
+        return MESSAGE_TERMINATOR.join(lines)
+
+    def _read_line(self):
+        """Block until one complete record is buffered and return it, leaving
+        any later records for the next read."""
+        while True:
+            for record in self.framer.records():
+                return str(record, 'utf-8')
+            if not self.framer.recv_from(self.sock):
+                raise ConnectionError(f"{self.name} closed by peer.")
+
+    def reconnect(self, attempts=None):
+        """Re-establish a dead link with jittered exponential backoff, then
+        replay its file association and hot-links. With `attempts`, the last
+        connection error is raised after that many tries."""
+        self.close()
+        for attempt, delay in enumerate(backoff_delays(), start=1):
+            try:
+                self.connect()
+                break
+            except OSError as e:
+                if attempts is not None and attempt >= attempts:
+                    raise
+                log.warning(f"{self.name} reconnect failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+        self.state.reconnects += 1
+        RECONNECTS.inc()
+        for command in self.state.replay_commands():
+            # Hot-link replies belong to whoever consumes the link
+            hotlink = command.split()[0] in HOTLINK_COMMANDS
+            try:
+                self._exchange(command, expect_response=not hotlink)
+            except socket.timeout:
+                COMMAND_TIMEOUTS.inc()
+                log.warning(f"{self.name} no reply to replayed {command}")
+        log.info(f"{self.name} reconnected, replayed {self.state.replay_commands()}")
+
+    @staticmethod
+    def _format(command):
+        # Append retry delay (unless the caller gave one) and CRLF
+        message = command.strip()
+        if not _RETRY_FLAG.search(message):
+            message += f' -d{TIME_PERSISTANCE}'
+        return message + MESSAGE_TERMINATOR
+
+    def _exchange(self, command, expect_response=True):
+        """Send one command and read its reply; raises socket.timeout if
+        none comes within the socket timeout."""
+        message = self._format(command)
+        COMMANDS.inc()
+        sent = time.perf_counter()
+        self.sock.sendall(message.encode('utf-8'))
+        if expect_response:
+            multiline = command.split()[0] in MULTILINE_COMMANDS
+            resp = self._read_lines(MULTILINE_IDLE if multiline else 0.0).strip()
+            COMMAND_SECONDS.observe(time.perf_counter() - sent)
+            if command_log.isEnabledFor(logging.DEBUG):
+                command_log.debug(f"{self.name} | {message.strip()} => {resp}")
+            return resp
+        return ''
+
     def send_command(self, command, expect_response=True):
         if not self.sock:
             raise RuntimeError(f"{self.name} not connected.")
-        # Append retry delay and CRLF
-        message = command.strip() + f' -d{TIME_PERSISTANCE}{MESSAGE_TERMINATOR}'
+        self.state.record(command.strip())
+        try:
+            return self._exchange(command, expect_response)
+        except socket.timeout:
+            self._resync(command)
+            return ''
+        except (ConnectionError, OSError) as e:
+            log.warning(f"{self.name} link lost ({e}); reconnecting")
+        self.reconnect()
+        if command.split()[0] in HOTLINK_COMMANDS:
+            return ''  # already re-issued by the replay
+        try:
+            return self._exchange(command, expect_response)
+        except socket.timeout:
+            self._resync(command)
+            return ''
+
+    def _resync(self, command):
+        """A reply did not come in time: it may still arrive and be taken
+        for the next command's, so the link is replaced."""
+        COMMAND_TIMEOUTS.inc()
+        log.warning(f"{self.name} response timeout for: {command.strip()}; reconnecting")
+        self.reconnect()
+
+    def ping(self):
+        """Send -xStatus without reconnecting; True if MASsoft answered."""
+        if not self.sock:
+            return False
+        try:
+            return bool(self._exchange('-xStatus'))
+        except OSError:
+            return False
+
+    def send_commands(self, commands):
+        """Pipeline several single-line commands in one write and return their
+        replies in send order, so they cost one round trip instead of one each."""
+        if not self.sock:
+            raise RuntimeError(f"{self.name} not connected.")
+        for command in commands:
+            self.state.record(command.strip())
+        message = ''.join(self._format(command) for command in commands)
+        COMMANDS.inc(len(commands))
+        sent = time.perf_counter()
         self.sock.sendall(message.encode('utf-8'))
-        if expect_response:
+        replies = []
+        for command in commands:
             try:
-                resp = self.sock.recv(4096).decode('utf-8').strip()
+                resp = self._read_line().strip()
             except socket.timeout:
-                logging.warning(f"{self.name} response timeout for: {message.strip()}")
-                return ''
-            logging.info(f"{self.name} | {message.strip()} => {resp}")
-            return resp
-        return ''
+                self._resync(command)
+                break
+            COMMAND_SECONDS.observe(time.perf_counter() - sent)
+            if command_log.isEnabledFor(logging.DEBUG):
+                command_log.debug(f"{self.name} | {command.strip()} => {resp}")
+            replies.append(resp)
+        return replies + [''] * (len(commands) - len(replies))
 
     def receive(self):
         if not self.sock:
             raise RuntimeError(f"{self.name} not connected.")
         try:
-            return self.sock.recv(4096).decode('utf-8').strip()
+            return self._read_lines().strip()
         except socket.timeout:
             return ''
 
+    def iter_lines(self, stop_event, poll_interval=0.5):
+        """Yield (arrival_time, lines) for each read that completed lines pushed
+        on this socket. Runs until stop_event is set; arrival_time is
+        time.monotonic() at recv."""
+        if not self.sock:
+            raise RuntimeError(f"{self.name} not connected.")
+        self.sock.settimeout(poll_interval)
+        try:
+            # Rows already buffered by an earlier command reply come first
+            arrival = time.monotonic()
+            while not stop_event.is_set():
+                lines = self.framer.lines()
+                if lines:
+                    yield arrival, lines
+                try:
+                    if not self.framer.recv_from(self.sock):
+                        raise ConnectionError(f"{self.name} closed by peer.")
+                except socket.timeout:
+                    continue
+                arrival = time.monotonic()
+        finally:
+            if self.sock:
+                self.sock.settimeout(self.timeout)
+
     def close(self):
         if self.sock:
             self.sock.close()
-            logging.info(f"{self.name} closed.")
+            self.sock = None
+            log.info(f"{self.name} closed.")
 
 class MASsoftClient:
-    def __init__(self, host=MAS_HOST, port=MAS_PORT):
-        self.command_socket = MASsoftSocket(host, port, name="CommandSocket")
-        self.status_socket  = MASsoftSocket(host, port, name="StatusSocket")
-        self.data_socket    = MASsoftSocket(host, port, name="DataSocket")
+    def __init__(self, host=MAS_HOST, port=MAS_PORT, history_capacity=DEFAULT_CAPACITY, spill_dir=None,
+                 pool=None, metadata=None):
+        self.host = host
+        self.port = port
+        # Links are leased from a pool shared by every client in the process
+        self.pool = pool or get_pool()
+        self.metadata = metadata or get_cache()
+        self.command_socket = None
+        self.status_socket  = None
+        self.data_socket    = None
         self.current_file = MOST_RECENT_FILE
+        self.history_capacity = history_capacity
+        self.spill_dir = spill_dir
+        self.history = None  # ColumnRingBuffer, created once legends are known
+        # Experiment state, kept current by the -lStatus watcher thread
+        self.status = StatusTracker()
+        # A run started on our file, from anywhere, may have changed its scan set-up
+        self.status.subscribe(self._observe_state)
+        self._status_thread = None
+        self._status_stop = threading.Event()
+        self._run_mark = None  # status.transitions when the last run was started
+
+    def _observe_state(self, old, new, raw):
+        self.metadata.observe_state(old, new, raw, self.current_file)
+
+    def new_history(self, columns):
+        """Start a fresh bounded history buffer for the given legend columns."""
+        self.history = ColumnRingBuffer(columns, self.history_capacity, spill_dir=self.spill_dir)
+        return self.history
 
     def initialize(self):
-        """Connect all sockets."""
-        self.command_socket.connect()
-        self.status_socket.connect()
-        self.data_socket.connect()
+        """Lease connected command/status/data links from the pool."""
+        self.command_socket = self.pool.acquire('command', self.host, self.port)
+        self.status_socket  = self.pool.acquire('status', self.host, self.port)
+        self.data_socket    = self.pool.acquire('data', self.host, self.port)
 
     def open_experiment_commands(self, file_name=None):
         """Open and associate an experiment file.
@@ -146,7 +334,7 @@ class MASsoftClient:
             full_path = str(PureWindowsPath(EXPERIMENT_DIRECTORY) / file_name)
 
         # 2) Send to MASsoft
-        resp = self.status_socket_socket.send_command(f'-f"{full_path}"')
+        resp = self.status_socket.send_command(f'-f"{full_path}"')
         if resp =='0':
             raise RuntimeError(f"Failed to open experiment file: {full_path}")
 
@@ -156,97 +344,230 @@ class MASsoftClient:
 
     def run_experiment(self, new_file_name = None, mode = "-Odt"):
         """Start the experiment."""        
+        self._run_mark = self.status.transitions
         resp = self.command_socket.send_command(f'-xGo {mode}')
+        self.metadata.observe('-xGo')
         if resp == '0':
             raise RuntimeError("Experiment failed to start.")
         if not resp:
-            logging.warning("Assuming experiment started despite no response.")
+            log.warning("Assuming experiment started despite no response.")
 
     def associate_status_link(self, view=1):
         """Set up a hot-link for status updates."""
         if not self.current_file:
             raise RuntimeError("No file opened.")
-        self.open_experiment_status()
-        self.status_socket.send_command(f'-lStatus -v{view}')
+        path = self.query_filename()
+        # Association and hot-link in one round trip; the hot-link reply is
+        # the current status
+        resp, status = self.status_socket.send_commands([f'-f"{path}"', f'-lStatus -v{view}'])
+        if resp == '0':
+            raise RuntimeError(f"Failed to open experiment file: {path}")
+        self.status.update(status)
+
+    def watch_status(self, view=1, poll_interval=0.5):
+        """Keep one -lStatus hot-link open and feed every status MASsoft
+        pushes into self.status from a background thread (started once;
+        stopped by shutdown()). A dropped link is re-established and the
+        hot-link replayed."""
+        if self._status_thread is not None and self._status_thread.is_alive():
+            return
+        self.associate_status_link(view)
+        self._status_stop.clear()
+
+        def read():
+            stop = self._status_stop
+            while not stop.is_set():
+                try:
+                    for _, lines in self.status_socket.iter_lines(stop, poll_interval):
+                        for line in lines:
+                            self.status.update(line)
+                except (ConnectionError, OSError) as e:
+                    if stop.is_set():
+                        break
+                    log.warning(f"Status link lost ({e}); reconnecting")
+                    self.status_socket.reconnect()
+
+        self._status_thread = threading.Thread(target=read, name="MASsoftStatusWatcher", daemon=True)
+        self._status_thread.start()
+
+    def stop_watching_status(self):
+        if self._status_thread is not None:
+            self._status_stop.set()
+            self._status_thread.join()
+            self._status_thread = None
 
     def monitor_until_stopped(self, timeout=120):
-        """
-        Listen for status updates until a 'Stopped...' status arrives.
-        Requires associate_status_link() to be called first.
-        """
-        if not self.current_file:
-            raise RuntimeError("No file opened.")
-        self.associate_status_link()
-        start = time.time()
-        while time.time() - start < timeout:
-            status = self.status_socket.receive()
-            if status:
-                logging.info(f"Status: {status}")
-                if status.lower().startswith('stopped'):
-                    return True
-            time.sleep(1)
-        raise TimeoutError(f"Did not stop within {timeout}s.")
-
-    def get_data(self, view=1):
-        """Retrieve scan data via a new data socket."""
+        """Block until MASsoft reports the run stopped (or aborted); returns
+        True. The status hot-link pushes the change, so this returns within
+        milliseconds of the stop."""
         if not self.current_file:
             raise RuntimeError("No file opened.")
-        headers = self.get_legends(view=view)
-        data = []
-        while True:
-            raw_data = self.data_socket.send_command(f"-lData -v{view}")
-            if raw_data != '0':
-                lines = raw_data.strip().split('\r\n')
-                # print(f'Lines: {lines}')
-                for line in lines:
-                    if line.strip() == '0':
-                        # print("Ignoring first line with '0'.")
-                        continue
-                    values = line.split()
-                    # print(f'Values: {values}')
-                    if len(values) < len(headers):
-                        # print(f"Line skipped due to insufficient values: {line.strip()}")
-                        continue
-                    data.append(values)
-                    # print(f"Data appended: {values}")
-            time.sleep(1)            
+        self.watch_status()
+        try:
+            self.status.wait_for(STOPPED_STATES, timeout, after=self._run_mark)
+        except TimeoutError:
+            raise TimeoutError(f"Did not stop within {timeout}s.") from None
+        return True
 
+    def wait_until_running(self, timeout=30):
+        """Block until the run started by run_experiment() is reported active."""
+        self.watch_status()
+        return self.status.wait_for(ACTIVE_STATES, timeout, after=self._run_mark)
 
-    def get_legends(self, view=1):
-        """Retrieve column legends via a temporary socket."""
-        path = self.command_socket.send_command("-xFilename")
-        time.sleep(1)
-        path = self.command_socket.send_command("-xFilename")
-        self.command_socket.send_command(f'-f"{path}"')
+    def get_data(self, view=1, stop_event=None):
+        """Collect scan data into the bounded history until stop_event is set
+        (or Ctrl-C), then return the history."""
+        if not self.current_file:
+            raise RuntimeError("No file opened.")
+        history = self.new_history(self.get_metadata(view).columns)
         try:
-            while True:
-                raw_data = self.command_socket.send_command(f"-lLegends -v{view}")
-                if raw_data != '0':
-                    legend = raw_data.replace("\r\n", "\t").split("\t")
-                    break
-                else:
-                    time.sleep(1)                
+            for rows in self.iter_data(view, stop_event=stop_event):
+                history.extend(rows)
         except KeyboardInterrupt:
-            print("Done.")
-        return legend, path
-
-    def get_legends_data(self, view=1):
-        """Retrieve column legends via a temporary socket."""
-        path = self.data_socket.send_command("-xFilename")
-        time.sleep(1)
-        path = self.data_socket.send_command("-xFilename")
-        self.command_socket.send_command(f'-f"{path}"')
+            log.info("Data collection interrupted.")
+        history.flush()
+        return history
+
+    def iter_data(self, view=1, records=False, maxsize=DATA_QUEUE_SIZE, stop_event=None, poll_interval=0.5):
+        """Yield each batch of valid rows from the data hot-link as it arrives,
+        as a (rows, columns) float64 array, or with records=True as a
+        structured array of meta.schema.record_dtype (time, ms and an
+        intensities vector; a view, not a copy, see ScanFrame.records).
+
+        A reader thread parses into a queue of at most `maxsize` batches; when
+        the consumer falls behind the reader stops reading and TCP pushes back
+        on MASsoft, so memory stays bounded however long the run. Leaving the
+        loop (break, close(), an exception) or setting stop_event stops the
+        reader and drops the hot-link."""
+        meta = self.get_metadata(view)
+        batches = queue.Queue(maxsize)
+        stop = threading.Event()
+
+        def put(item):
+            # Blocks while the queue is full (backpressure) but not past stop
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=poll_interval)
+                    return
+                except queue.Full:
+                    pass
+
+        def read():
+            try:
+                for frame in self.stream_data(stop, view, meta.schema, poll_interval):
+                    if len(frame):
+                        put(frame)
+            except Exception as e:
+                put(e)
+            finally:
+                put(None)
+
+        reader = threading.Thread(target=read, name="MASsoftDataReader", daemon=True)
+        reader.start()
         try:
-            while True:
-                raw_data = self.command_socket.send_command(f"-lLegends -v{view}")
-                if raw_data != '0':
-                    legend = raw_data.replace("\r\n", "\t").split("\t")
-                    break
-                else:
-                    time.sleep(1)
-        except KeyboardInterrupt:
-            print("Done.")
-        return legend_data
+            while stop_event is None or not stop_event.is_set():
+                try:
+                    item = batches.get(timeout=poll_interval)
+                except queue.Empty:
+                    continue
+                DATA_QUEUE_DEPTH.set(batches.qsize())
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item.records if records else item.rows
+        finally:
+            stop.set()
+            reader.join()
+            # The hot-link lives as long as the session: end both
+            self.data_socket.close()
+            self.data_socket.state.hotlinks.clear()
+
+    def start_data_hotlink(self, view=1, start=None):
+        """Open the -lData hot-link once (at cycle `start` if given); MASsoft
+        then pushes each new row on the data socket as soon as it is produced."""
+        if not self.current_file:
+            raise RuntimeError("No file opened.")
+        if self.data_socket.sock is None:
+            # Closed after an earlier stream: reconnect with its association
+            self.data_socket.reconnect()
+        hotlink = f"-lData -v{view}" if start is None else f"-lData -v{view} -c{start}"
+        self.data_socket.send_command(hotlink, expect_response=False)
+
+    def stream_data(self, stop_event, view=1, schema=None, poll_interval=0.5, start=None,
+                    retries=STREAM_RETRIES):
+        """Consume the data hot-link (opened at cycle `start` if given),
+        yielding a parsing.ScanFrame for each batch of rows received together
+        (schema defaults to the view's). Malformed rows are left out of the
+        frame and counted as dropped on the data socket's framer.
+
+        If the link drops, it is re-established with backoff and the hot-link
+        resumed (-c) at the cycle after the last one received, as far as
+        parsing.CycleCounter can tell; rows received before may come again
+        and are told apart by their ms (see backfill.RowMerger). After
+        `retries` losses without a row in between, or as many failed
+        connection attempts, the error is raised."""
+        schema = schema or self.get_metadata(view).schema
+        self.start_data_hotlink(view=view, start=start)
+        counter = CycleCounter(start or 0)
+        losses = 0
+        while not stop_event.is_set():
+            try:
+                for arrival, lines in self.data_socket.iter_lines(stop_event, poll_interval):
+                    started = time.perf_counter()
+                    frame = schema.parse(lines, counter.cycle, arrival)
+                    PARSE_SECONDS.observe(time.perf_counter() - started)
+                    if frame.end_cycle == counter.cycle:
+                        continue
+                    counter.advance(frame)
+                    losses = 0
+                    ROWS_PARSED.inc(len(frame))
+                    if frame.dropped:
+                        ROWS_DROPPED.inc(frame.dropped)
+                        self.data_socket.framer.mark_dropped(frame.dropped)
+                    yield frame
+            except (ConnectionError, OSError) as e:
+                losses += 1
+                if losses > retries:
+                    log.error(f"Data link lost {losses} times without a row; giving up")
+                    raise
+                log.warning(f"Data link lost at cycle {counter.cycle} ({e}); resuming")
+                self.data_socket.state.hotlinks['-lData'] = f'-lData -v{view} -c{counter.cycle}'
+                self.data_socket.reconnect(attempts=retries)
+
+    def get_metadata(self, view=1, path=None, timeout=READY_TIMEOUT):
+        """Return the ExperimentMetadata (legends, scan parameters, column
+        index, masses, dtype) of a file's view. MASsoft is only asked on a
+        cache miss; path defaults to the file opened on the command socket,
+        which is only asked for when it was not opened by name."""
+        path = path or self.current_file
+        if path == MOST_RECENT_FILE:
+            path = self.current_file = self.query_filename()
+
+        def fetch():
+            self.command_socket.send_command(f'-f"{path}"')
+            legends = wait_ready(lambda: self.command_socket.send_command(f"-lLegends -v{view}"),
+                                 timeout=timeout)
+            return legends, self.command_socket.send_command(f"-lScanParameters -v{view}")
+
+        meta = self.metadata.load(path, view, fetch)
+        if not meta.legends:
+            raise TimeoutError(f"No legends for view {view} within {timeout}s.")
+        return meta
+
+    def get_legends(self, view=1, timeout=READY_TIMEOUT):
+        """Retrieve column legends, re-asking while MASsoft answers '0'."""
+        meta = self.get_metadata(view, timeout=timeout)
+        return meta.legends, meta.path
+
+    def get_scan_parameters(self, view=1):
+        """Return the -lScanParameters table as a list of {header: value} rows
+        (one per scan/MID line). Returns [] if MASsoft has none for the view."""
+        return self.get_metadata(view).scan_parameters
+
+    def get_legends_data(self, view=1, timeout=READY_TIMEOUT):
+        """Retrieve column legends for the file associated with the data socket."""
+        return self.get_metadata(view, self.query_filename_data(), timeout).legends
 
     def query_filename(self):
         """Return the filename currently associated with the command socket."""
@@ -265,6 +586,7 @@ class MASsoftClient:
     def close_experiment(self):
         """Close the experiment file."""
         resp = self.command_socket.send_command('-xClose')
+        self.metadata.observe('-xClose')
         if resp == '0':
             raise RuntimeError("Close failed.")
         
@@ -275,16 +597,19 @@ class MASsoftClient:
             raise RuntimeError("Abort failed.")
 
     def shutdown(self):
-        """Close all sockets."""
-        self.command_socket.close()
-        self.status_socket.close()
-        self.data_socket.close()
+        """Hand the links back to the pool (hot-linked ones are closed)."""
+        self.stop_watching_status()
+        for sock in (self.command_socket, self.status_socket, self.data_socket):
+            if sock is not None:
+                self.pool.release(sock)
+        self.command_socket = self.status_socket = self.data_socket = None
 
 # Example IPython Usage:
+# from logconfig import setup_logging; setup_logging()
 # from massoft_client import MASsoftClient
 # client = MASsoftClient(); client.initialize()
 # client.open_experiment('file56.exp')
-# client.run_experiment(); client.associate_status_link()
+# client.watch_status(); client.run_experiment()
 # client.monitor_until_stopped(timeout=300)
 # print(client.query_filename())
 # data = client.get_data(); legends = client.get_legends()
@@ -1,6 +1,26 @@
 import asyncio
+import collections
+import contextlib
 import logging
 import os
+import socket
+import time
+from pathlib import PureWindowsPath
+
+import numpy as np
+
+from backoff import HOTLINK_COMMANDS, READY_TIMEOUT, LinkState, await_ready, backoff_delays
+from framing import LineFramer
+from metadata import MetadataCache, get_cache
+from metrics import (COMMANDS, COMMAND_SECONDS, COMMAND_TIMEOUTS, DATA_QUEUE_DEPTH, PARSE_SECONDS,
+                     RECONNECTS, ROWS_BACKFILLED, ROWS_DROPPED, ROWS_PARSED)
+from parsing import CycleCounter
+from ringbuffer import ColumnRingBuffer, DEFAULT_CAPACITY
+from status import ACTIVE_STATES, STOPPED_STATES, StatusTracker
+
+# Logging is configured by the entry point (see logconfig.setup_logging)
+log = logging.getLogger('massoft.async')
+command_log = logging.getLogger('massoft.commands')
 
 try:
     import nest_asyncio
@@ -8,48 +28,223 @@ try:
 except ImportError:
     pass
 
-# Logger setup
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("massoft_async.log")]
-)
-
 # Configuration
-MAS_HOST = '10.66.58.225'
-MAS_PORT = 5026
+MAS_HOST = os.environ.get('MAS_HOST', '10.66.58.225')
+MAS_PORT = int(os.environ.get('MAS_PORT', 5026))
 EXPERIMENT_DIRECTORY = r"C:\Users\08id-user\Documents\Hiden Analytical\MASsoft\11"
+MOST_RECENT_FILE = "%HIDEN_LastFile%"
 RETRY_DELAY = 20  # appended as -d20
+COMMAND_TIMEOUT = RETRY_DELAY + 5.0  # s for a reply, outlasting MASsoft's -d retry window
+MULTILINE_IDLE = 0.05  # s without a new line that ends a multi-line reply
+DATA_QUEUE_SIZE = 64  # row batches buffered between the data reader and its consumer
+BACKFILL_CHUNK = 4096  # rows per batch handed out by fetch_cycles (parsed on the loop)
+BACKFILL_IDLE = 1.0  # s without new rows that ends a fetch_cycles transfer
+STREAM_RETRIES = 5  # data link losses in a row (and connect attempts each) before stream_data gives up
 
 class AsyncMASsoftSocket:
-    def __init__(self, name: str):
+    """One MASsoft connection with a pipelined command channel.
+
+    Commands are written as soon as they are submitted; each returns a future
+    and replies are matched to commands in send order, so several commands
+    cost one round trip instead of one each. Multi-line replies have no
+    terminator, so a multi-line command waits for the pipeline to drain and
+    holds it until its reply goes idle.
+    """
+
+    def __init__(self, name: str, host: str = MAS_HOST, port: int = MAS_PORT):
         self.name = name
+        self.host = host
+        self.port = port
         self.reader: asyncio.StreamReader = None
         self.writer: asyncio.StreamWriter = None
+        self.framer = LineFramer(name=name)
+        self.state = LinkState()  # file association and hot-links to replay
+        self._pending = collections.deque()  # (future, multiline) awaiting replies, in send order
+        self._reader_task = None
+        self._gate = asyncio.Lock()  # held by a multi-line exchange
+        self._reconnecting = asyncio.Lock()
+        self._generation = 0  # bumped per connection
 
     async def connect(self):
         if self.writer and not self.writer.is_closing():
             return
-        self.reader, self.writer = await asyncio.open_connection(MAS_HOST, MAS_PORT)
-        logging.info(f"{self.name} connected to {MAS_HOST}:{MAS_PORT}")
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        sock = self.writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.framer.reset()
+        self._generation += 1
+        log.info(f"{self.name} connected to {self.host}:{self.port}")
         # discard greeting line
-        await self.reader.readline()
+        try:
+            await asyncio.wait_for(self.reader.readline(), timeout=5.0)
+        except asyncio.TimeoutError:
+            pass
+
+    async def reconnect(self, generation: int = None, attempts: int = None):
+        """Re-establish a dead link with jittered exponential backoff, then
+        replay its file association and hot-links. If `generation` is given
+        and the link has been re-established since, nothing is done. With
+        `attempts`, the last connection error is raised after that many tries."""
+        async with self._reconnecting:
+            if generation is not None and generation != self._generation:
+                return
+            self.close()
+            for attempt, delay in enumerate(backoff_delays(), start=1):
+                try:
+                    await self.connect()
+                    break
+                except OSError as e:
+                    if attempts is not None and attempt >= attempts:
+                        raise
+                    log.warning(f"{self.name} reconnect failed ({e}); retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+            self.state.reconnects += 1
+            RECONNECTS.inc()
+            replies = []
+            for cmd in self.state.replay_commands():
+                # Hot-link replies belong to whoever consumes the link
+                hotlink = cmd.split()[0] in HOTLINK_COMMANDS
+                replies.append(await self._submit(cmd, expect_response=not hotlink))
+            try:
+                await asyncio.wait_for(asyncio.gather(*replies), timeout=5.0)
+            except asyncio.TimeoutError:
+                log.warning(f"{self.name} no reply to replayed association")
+            log.info(f"{self.name} reconnected, replayed {self.state.replay_commands()}")
 
-    async def send_command(self, cmd: str, expect_response: bool = True) -> str:
+    async def submit(self, cmd: str, expect_response: bool = True, multiline: bool = False) -> asyncio.Future:
+        """Send a command without waiting for its reply. Returns a future
+        resolving to the reply text ('' when no reply is expected)."""
         await self.connect()
+        self.state.record(cmd.strip())
+        return await self._submit(cmd, expect_response, multiline)
+
+    async def _submit(self, cmd, expect_response=True, multiline=False):
+        future = asyncio.get_running_loop().create_future()
+        if multiline:
+            await self._gate.acquire()
+            future.add_done_callback(lambda _: self._gate.release())
+            try:
+                while self._pending:
+                    await asyncio.wait([self._pending[-1][0]])
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+        elif self._gate.locked():
+            async with self._gate:
+                pass
         full_cmd = f"{cmd.strip()} -d{RETRY_DELAY}\r\n"
+        COMMANDS.inc()
+        if expect_response:
+            loop = asyncio.get_running_loop()
+            sent = loop.time()
+
+            def timed(f):
+                if not f.cancelled() and f.exception() is None:
+                    COMMAND_SECONDS.observe(loop.time() - sent)
+            future.add_done_callback(timed)
+            self._pending.append((future, multiline))
+            if self._reader_task is None or self._reader_task.done():
+                self._reader_task = asyncio.get_running_loop().create_task(self._read_replies())
+        else:
+            future.set_result('')
         self.writer.write(full_cmd.encode('utf-8'))
-        await self.writer.drain()
-        if not expect_response:
-            return ''
         try:
-            line = await asyncio.wait_for(self.reader.readline(), timeout=5.0)
-            resp = line.decode('utf-8').strip()
-            logging.info(f"{self.name} | Cmd: {full_cmd.strip()} | Resp: {resp}")
+            await self.writer.drain()
+        except (ConnectionError, OSError) as e:
+            self._fail_pending(e)
+            raise
+        return future
+
+    async def _read_replies(self):
+        """Resolve pending futures, oldest first, until none are left."""
+        try:
+            while self._pending:
+                line = await self.reader.readline()
+                if not line:
+                    raise ConnectionError(f"{self.name} closed by peer")
+                future, multiline = self._pending[0]
+                resp = line.decode('utf-8').strip()
+                if multiline and resp not in ('', '0'):
+                    lines = [resp]
+                    while True:
+                        try:
+                            line = await asyncio.wait_for(self.reader.readline(), timeout=MULTILINE_IDLE)
+                        except asyncio.TimeoutError:
+                            break
+                        if not line:
+                            break
+                        lines.append(line.decode('utf-8').rstrip('\r\n'))
+                    resp = '\r\n'.join(lines)
+                self._pending.popleft()
+                if not future.done():
+                    future.set_result(resp)
+        except (ConnectionError, OSError) as e:
+            self._fail_pending(e)
+        except asyncio.CancelledError:
+            self._fail_pending(ConnectionError(f"{self.name} closed"))
+
+    def _fail_pending(self, exc):
+        while self._pending:
+            future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(exc)
+
+    async def send_command(self, cmd: str, expect_response: bool = True,
+                           multiline: bool = False, timeout: float = COMMAND_TIMEOUT) -> str:
+        """Send a command and wait for its reply ('' on timeout). `timeout`
+        also covers waiting for a multi-line exchange to release the
+        pipeline. A lost link is re-established and the command sent once more."""
+        for attempt in range(2):
+            generation = self._generation
+            try:
+                resp = await asyncio.wait_for(self._exchange(cmd, expect_response, multiline), timeout)
+            except asyncio.TimeoutError:
+                await self._resync(cmd, generation)
+                return ''
+            except (ConnectionError, OSError) as e:
+                if attempt:
+                    raise
+                log.warning(f"{self.name} link lost ({e}); reconnecting")
+                await self.reconnect(generation)
+                if cmd.split()[0] in HOTLINK_COMMANDS:
+                    return ''  # already re-issued by the replay
+                continue
+            if expect_response and command_log.isEnabledFor(logging.DEBUG):
+                command_log.debug(f"{self.name} | Cmd: {cmd.strip()} | Resp: {resp}")
             return resp
+
+    async def _exchange(self, cmd, expect_response=True, multiline=False):
+        future = await self.submit(cmd, expect_response, multiline)
+        # shield: the reply stays queued in send order if the wait is cut short
+        return await asyncio.shield(future)
+
+    async def _resync(self, cmd, generation):
+        """A reply did not come in time: it may still arrive and be taken for
+        a later command's, and a multi-line command still holds the pipeline.
+        Pending replies are failed (releasing it) and the link replaced."""
+        COMMAND_TIMEOUTS.inc()
+        log.warning(f"{self.name} response timeout for: {cmd.strip()}; reconnecting")
+        await self.reconnect(generation)
+
+    async def send_commands(self, cmds, timeout: float = COMMAND_TIMEOUT) -> list:
+        """Pipeline several single-line commands; return their replies in
+        order ('' for each if they do not all come within `timeout`)."""
+        generation = self._generation
+
+        async def exchange():
+            futures = [await self.submit(cmd) for cmd in cmds]
+            return await asyncio.gather(*futures)
+
+        try:
+            replies = await asyncio.wait_for(exchange(), timeout)
         except asyncio.TimeoutError:
-            logging.warning(f"{self.name} response timeout for: {full_cmd.strip()}")
-            return ''
+            await self._resync(' / '.join(cmds), generation)
+            return [''] * len(cmds)
+        if command_log.isEnabledFor(logging.DEBUG):
+            for cmd, resp in zip(cmds, replies):
+                command_log.debug(f"{self.name} | Cmd: {cmd.strip()} | Resp: {resp}")
+        return list(replies)
 
     async def receive(self) -> str:
         await self.connect()
@@ -59,17 +254,66 @@ class AsyncMASsoftSocket:
         except asyncio.TimeoutError:
             raise
 
+    async def send_command_lines(self, cmd: str) -> str:
+        """Send a command whose reply may span several lines (legends, scan
+        parameters); lines are gathered until the link goes idle."""
+        return await self.send_command(cmd, multiline=True)
+
+    async def iter_lines(self, read_size: int = 65536):
+        """Yield (arrival_time, lines) for each read that completes pushed lines."""
+        await self.connect()
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await self.reader.read(read_size)
+            if not chunk:
+                raise ConnectionError(f"{self.name} closed by peer")
+            arrival = loop.time()
+            self.framer.feed(chunk)
+            lines = self.framer.lines()
+            if lines:
+                yield arrival, lines
+
     def close(self):
+        if self._reader_task and not self._reader_task.done():
+            self._reader_task.cancel()
+        self._fail_pending(ConnectionError(f"{self.name} closed"))
         if self.writer and not self.writer.is_closing():
             self.writer.close()
-            logging.info(f"{self.name} closed")
+            log.info(f"{self.name} closed")
 
 class AsyncMASsoftClient:
-    def __init__(self):
-        self.cmd_sock  = AsyncMASsoftSocket("CmdSocket")
-        self.stat_sock = AsyncMASsoftSocket("StatSocket")
-        self.data_sock = AsyncMASsoftSocket("DataSocket")
+    def __init__(self, host: str = MAS_HOST, port: int = MAS_PORT,
+                 history_capacity: int = DEFAULT_CAPACITY, spill_dir: str = None,
+                 metadata: MetadataCache = None):
+        self.cmd_sock  = AsyncMASsoftSocket("CmdSocket", host, port)
+        self.stat_sock = AsyncMASsoftSocket("StatSocket", host, port)
+        self.data_sock = AsyncMASsoftSocket("DataSocket", host, port)
+        # Bulk transfers of earlier cycles, apart from the live hot-link
+        self.backfill_sock = AsyncMASsoftSocket("BackfillSocket", host, port)
         self.current_file: str = ""
+        self.metadata = metadata or get_cache()
+        self.history_capacity = history_capacity
+        self.spill_dir = spill_dir
+        self.history: ColumnRingBuffer = None
+        # Experiment state, kept current by the -lStatus watcher task
+        self.status = StatusTracker()
+        # A run started on our file, from anywhere, may have changed its scan set-up
+        self.status.subscribe(self._observe_state)
+        self._status_task = None
+        self._run_mark = None  # status.transitions when the last run was started
+
+    def _observe_state(self, old, new, raw):
+        self.metadata.observe_state(old, new, raw, self.current_file or None)
+
+    def new_history(self, columns, shared=False):
+        """Start a fresh bounded history buffer for the given legend columns
+        (in shared memory if `shared` -- True or the block name -- for readers
+        in other processes). The previous shared buffer is freed."""
+        if self.history is not None:
+            self.history.close()
+        self.history = ColumnRingBuffer(columns, self.history_capacity, spill_dir=self.spill_dir,
+                                        shared=shared)
+        return self.history
 
     async def initialize(self):
         await asyncio.gather(
@@ -78,8 +322,15 @@ class AsyncMASsoftClient:
             self.data_sock.connect()
         )
 
-    async def open_experiment(self, file_name: str):
-        path = os.path.join(EXPERIMENT_DIRECTORY, file_name)
+    async def open_experiment(self, file_name: str = None):
+        """Open an experiment file; with no name, re-open the one MASsoft
+        currently has associated."""
+        if file_name is None:
+            path = await self.query_filename()
+        elif file_name == MOST_RECENT_FILE:
+            path = file_name
+        else:
+            path = str(PureWindowsPath(EXPERIMENT_DIRECTORY) / file_name)
         resp = await self.cmd_sock.send_command(f'-f"{path}"')
         if resp in ('0', ''):
             raise RuntimeError(f"Failed to open experiment file: {path}")
@@ -88,65 +339,259 @@ class AsyncMASsoftClient:
     async def run_experiment(self, mode: str = '-Odt', view: int = 1, verify_timeout: int = 30):
         if not self.current_file:
             raise RuntimeError("No experiment file opened")
+        self._run_mark = self.status.transitions
         resp = await self.cmd_sock.send_command(f'-xGo {mode}')
+        self.metadata.observe('-xGo')
         if resp == '0':
             raise RuntimeError("MASsoft returned failure to -xGo")
-        # link status socket
-        await self.stat_sock.send_command(f'-f"{self.current_file}"')
-        await self.stat_sock.send_command(f'-lStatus -v{view}')
-        # wait for actual start
-        deadline = asyncio.get_event_loop().time() + verify_timeout
-        while asyncio.get_event_loop().time() < deadline:
+        if not verify_timeout:
+            return
+        # wait for actual start, as pushed on the status hot-link
+        await self.watch_status(view)
+        try:
+            await self.status.until(ACTIVE_STATES, verify_timeout, after=self._run_mark)
+        except TimeoutError:
+            raise TimeoutError(f"No start detected within {verify_timeout}s") from None
+        log.info("Experiment confirmed running")
+
+    async def watch_status(self, view: int = 1):
+        """Keep one -lStatus hot-link open on the status link and feed every
+        status MASsoft pushes into self.status (started once; a dropped link
+        is re-established and the hot-link replayed)."""
+        if self._status_task is not None and not self._status_task.done():
+            return
+        if not self.current_file:
+            raise RuntimeError("No experiment file opened")
+        # Association and hot-link in one round trip; the hot-link reply is
+        # the current status
+        opened, status = await self.stat_sock.send_commands(
+            [f'-f"{self.current_file}"', f'-lStatus -v{view}'])
+        if opened in ('0', ''):
+            raise RuntimeError(f"Failed to open experiment file: {self.current_file}")
+        self.status.update(status)
+        self._status_task = asyncio.get_running_loop().create_task(self._read_status())
+
+    async def _read_status(self):
+        while True:
             try:
-                status = (await self.stat_sock.receive()).lower()
-            except asyncio.TimeoutError:
-                continue
-            logging.info(f"Startup Status: {status}")
-            if 'startingactive' in status or 'scanningactive' in status:
-                logging.info("Experiment confirmed running")
-                return
-        raise TimeoutError(f"No start detected within {verify_timeout}s")
+                async for _, lines in self.stat_sock.iter_lines():
+                    for line in lines:
+                        self.status.update(line)
+            except (ConnectionError, OSError) as e:
+                log.warning(f"Status link lost ({e}); reconnecting")
+                await self.stat_sock.reconnect()
 
     async def monitor_until_stopped(self, timeout: int = 120):
+        """Return once MASsoft reports the run stopped (or aborted); the
+        status hot-link pushes the change, so this wakes within milliseconds."""
         if not self.current_file:
             raise RuntimeError("No experiment file opened")
-        deadline = asyncio.get_event_loop().time() + timeout
-        while asyncio.get_event_loop().time() < deadline:
-            try:
-                status = await asyncio.wait_for(self.stat_sock.receive(), timeout=1.0)
-            except asyncio.TimeoutError:
-                continue
-            logging.info(f"Status Update: {status}")
-            if status.lower().startswith('stopped'):
-                return
-        raise TimeoutError(f"Did not stop within {timeout}s")
+        await self.watch_status()
+        try:
+            await self.status.until(STOPPED_STATES, timeout, after=self._run_mark)
+        except TimeoutError:
+            raise TimeoutError(f"Did not stop within {timeout}s") from None
 
     async def get_data(self, view: int = 1, cycles: int = None, time_fmt: bool = False, ms_fmt: bool = False):
+        """Every row from cycle `cycles` (0 if None) until MASsoft has sent
+        nothing new for BACKFILL_IDLE s, as one (rows, columns) array."""
+        chunks = []
+        async with contextlib.aclosing(self.fetch_cycles(view, cycles or 0, time_fmt=time_fmt,
+                                                         ms_fmt=ms_fmt)) as frames:
+            async for frame in frames:
+                chunks.append(frame.rows)
+        return np.concatenate(chunks) if chunks else np.empty((0, 0))
+
+    async def fetch_cycles(self, view: int = 1, start: int = 0, schema=None,
+                           chunk_rows: int = BACKFILL_CHUNK, idle: float = BACKFILL_IDLE,
+                           time_fmt: bool = False, ms_fmt: bool = False):
+        """Yield the rows of cycles `start` onwards as ScanFrames of about
+        `chunk_rows` rows (schema defaults to the view's), on a link of their own so the live hot-link is
+        not disturbed. MASsoft sends the backlog in one go; it is read in
+        large blocks and parsed a batch at a time; rows are handed out
+        within MULTILINE_IDLE s of arriving, so once the backlog is drained
+        new rows follow as they come. Ends once nothing new
+        has arrived for `idle` s (stop iterating to end it earlier, preferably
+        with contextlib.aclosing()). Malformed rows are left out."""
+        if not self.current_file:
+            raise RuntimeError("No experiment file opened")
+        schema = schema or (await self.get_metadata(view)).schema
+        sock = self.backfill_sock
+        await sock.send_command(f'-f"{self.current_file}"')
+        await sock.send_command(f'-lData -v{view} -c{start} -t{int(time_fmt)} -m{int(ms_fmt)}',
+                                expect_response=False)
+        lines = sock.iter_lines(read_size=1 << 20)
+        loop = asyncio.get_running_loop()
+        # One read stays outstanding across timeouts: cancelling it would end iter_lines
+        next_read = asyncio.ensure_future(lines.__anext__())
+        pending, fetched, cycle, last = [], 0, start, loop.time()
+        flush_at = None  # rows are handed out at most MULTILINE_IDLE s after they arrive
+        try:
+            while True:
+                # A long backlog can take MASsoft a while to start sending
+                wait = (flush_at if pending else last + (idle if fetched or flush_at else
+                                                         max(idle, READY_TIMEOUT))) - loop.time()
+                done, _ = await asyncio.wait({next_read}, timeout=max(0.0, wait))
+                if done:
+                    _, received = next_read.result()
+                    next_read = asyncio.ensure_future(lines.__anext__())
+                    if not pending:
+                        flush_at = loop.time() + MULTILINE_IDLE
+                    pending.extend(received)
+                    last = loop.time()
+                    if len(pending) < chunk_rows and last < flush_at:
+                        continue
+                elif not pending:
+                    break
+                frame = self._parse_backfill(schema, pending, cycle, time_fmt, ms_fmt)
+                pending, cycle = [], frame.end_cycle
+                fetched += len(frame)
+                if len(frame):
+                    yield frame
+        finally:
+            log.info(f"Fetched {fetched} rows from cycle {start}")
+            next_read.cancel()
+            await asyncio.gather(next_read, return_exceptions=True)
+            await lines.aclose()
+            # One transfer per link: a new fetch starts on a fresh socket
+            sock.close()
+            sock.state.hotlinks.clear()
+
+    @staticmethod
+    def _parse_backfill(schema, lines, cycle, time_fmt, ms_fmt):
+        frame = schema.parse(lines, cycle, time.monotonic(), time_fmt, ms_fmt)
+        if frame.dropped:
+            ROWS_DROPPED.inc(frame.dropped)
+            log.warning(f"Backfill: {frame.dropped} malformed rows skipped")
+        ROWS_BACKFILLED.inc(len(frame))
+        return frame
+
+    async def stream_data(self, view: int = 1, schema=None, start: int = None,
+                          retries: int = STREAM_RETRIES):
+        """Open the -lData hot-link once (at cycle `start` if given, else
+        wherever MASsoft is) and yield a parsing.ScanFrame for each batch of
+        rows MASsoft pushes, as it arrives (schema defaults to the view's).
+        Malformed rows are left out of the frame and counted as dropped on
+        the data socket's framer.
+
+        If the link drops, it is re-established with backoff and the hot-link
+        resumed (-c) at the cycle after the last one received, as far as
+        parsing.CycleCounter can tell; rows received before may come again
+        and are told apart by their ms (see backfill.RowMerger). After
+        `retries` losses without a row in between, or as many failed
+        connection attempts, the error is raised."""
         if not self.current_file:
             raise RuntimeError("No experiment file opened")
+        schema = schema or (await self.get_metadata(view)).schema
         await self.data_sock.send_command(f'-f"{self.current_file}"')
-        cmd = f'-lData -v{view}'
-        if cycles is not None: cmd += f' -c{cycles}'
-        cmd += f' -t{1 if time_fmt else 0}'
-        cmd += f' -m{1 if ms_fmt else 0}'
-        await self.data_sock.send_command(cmd)
-        results = []
+        hotlink = f'-lData -v{view}' if start is None else f'-lData -v{view} -c{start}'
+        await self.data_sock.send_command(hotlink, expect_response=False)
+        counter = CycleCounter(start or 0)
+        losses = 0
         while True:
             try:
-                line = await self.data_sock.receive()
-            except asyncio.TimeoutError:
-                break
-            parts = line.split()
-            if len(parts) < 2:
-                continue
-            results.append(parts if (time_fmt or ms_fmt) else [float(p) for p in parts])
-        return results
+                async for arrival, lines in self.data_sock.iter_lines():
+                    started = time.perf_counter()
+                    frame = schema.parse(lines, counter.cycle, arrival)
+                    PARSE_SECONDS.observe(time.perf_counter() - started)
+                    if frame.end_cycle == counter.cycle:
+                        continue
+                    counter.advance(frame)
+                    losses = 0
+                    ROWS_PARSED.inc(len(frame))
+                    if frame.dropped:
+                        ROWS_DROPPED.inc(frame.dropped)
+                        self.data_sock.framer.mark_dropped(frame.dropped)
+                    yield frame
+            except (ConnectionError, OSError) as e:
+                losses += 1
+                if losses > retries:
+                    log.error(f"Data link lost {losses} times without a row; giving up")
+                    raise
+                log.warning(f"Data link lost at cycle {counter.cycle} ({e}); resuming")
+                self.data_sock.state.hotlinks['-lData'] = f'-lData -v{view} -c{counter.cycle}'
+                await self.data_sock.reconnect(attempts=retries)
 
-    async def get_legends(self, view: int = 1):
+    async def aiter_data(self, view: int = 1, records: bool = False, maxsize: int = DATA_QUEUE_SIZE):
+        """Yield each batch of valid rows from the data hot-link as it arrives,
+        as a (rows, columns) float64 array, or with records=True as a
+        structured array of meta.schema.record_dtype (time, ms and an
+        intensities vector; a view, not a copy, see ScanFrame.records).
+
+        A reader task parses into a queue of at most `maxsize` batches; when
+        the consumer falls behind the reader stops reading and TCP pushes back
+        on MASsoft, so memory stays bounded however long the run. Leaving the
+        loop, aclose() or cancelling the consumer stops the reader and drops
+        the hot-link (wrap in contextlib.aclosing() to do so immediately)."""
+        meta = await self.get_metadata(view)
+        batches = asyncio.Queue(maxsize)
+
+        async def read():
+            try:
+                async for frame in self.stream_data(view, meta.schema):
+                    if len(frame):
+                        await batches.put(frame)
+            except Exception as e:
+                await batches.put(e)
+
+        reader = asyncio.get_running_loop().create_task(read())
+        try:
+            while True:
+                item = await batches.get()
+                DATA_QUEUE_DEPTH.set(batches.qsize())
+                if isinstance(item, Exception):
+                    raise item
+                yield item.records if records else item.rows
+        finally:
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+            # The hot-link lives as long as the session: end both
+            self.data_sock.close()
+            self.data_sock.state.hotlinks.clear()
+
+    async def heartbeat(self, interval: float = 5.0, timeout: float = COMMAND_TIMEOUT):
+        """Poll -xStatus on the command link so a dead connection is noticed
+        (and re-established) while nothing else is being sent. A missing
+        reply -- or a pipeline held by a lost multi-line reply -- makes
+        send_command replace the link."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.cmd_sock.send_command('-xStatus', timeout=timeout):
+                    log.warning("No reply to heartbeat; command link replaced")
+            except (ConnectionError, OSError) as e:
+                log.warning(f"Heartbeat failed: {e}")
+
+    async def get_metadata(self, view: int = 1, timeout: float = READY_TIMEOUT):
+        """Return the ExperimentMetadata (legends, scan parameters, column
+        index, masses, dtype) of the open file's view. MASsoft is only asked
+        on a cache miss, re-asking while it answers '0' (view not ready yet)
+        for up to `timeout` seconds; an unready view is not cached."""
         if not self.current_file:
             raise RuntimeError("No experiment file opened")
-        resp = await self.cmd_sock.send_command(f'-lLegends -v{view}')
-        return [item.strip('"') for item in resp.split()]
+
+        async def fetch():
+            legends = await await_ready(
+                lambda: self.cmd_sock.send_command_lines(f'-lLegends -v{view}'), timeout=timeout)
+            params = await self.cmd_sock.send_command_lines(f'-lScanParameters -v{view}')
+            return legends, params
+
+        return await self.metadata.aload(self.current_file, view, fetch)
+
+    async def get_legends(self, view: int = 1, timeout: float = READY_TIMEOUT):
+        """Return the view's column legends ([] if not ready within `timeout`)."""
+        return (await self.get_metadata(view, timeout)).legends
+
+    async def get_scan_parameters(self, view: int = 1, timeout: float = READY_TIMEOUT):
+        """Return the -lScanParameters table as a list of {header: value} rows."""
+        return (await self.get_metadata(view, timeout)).scan_parameters
+
+    async def get_status(self):
+        """Return MASsoft's current status string (e.g. 'ScanningActive')."""
+        return await self.cmd_sock.send_command('-xStatus')
 
     async def query_filename(self):
         resp = await self.cmd_sock.send_command('-xFilename')
@@ -154,15 +599,36 @@ class AsyncMASsoftClient:
             raise RuntimeError("Failed to retrieve filename")
         return resp
 
-    async def close_experiment(self):
-        resp = await self.cmd_sock.send_command('-xClose')
+    async def abort_experiment(self, reassociate: bool = False):
+        """Abort the running experiment. With reassociate, the most recent
+        file is re-associated first, pipelined in the same round trip."""
+        resp = await self._with_association('-xAbort', reassociate)
+        if resp == '0':
+            raise RuntimeError("Failed to abort experiment")
+
+    async def close_experiment(self, reassociate: bool = False):
+        resp = await self._with_association('-xClose', reassociate)
+        self.metadata.observe('-xClose')
         if resp != '1':
             raise RuntimeError("Failed to close experiment file")
 
+    async def _with_association(self, cmd: str, reassociate: bool):
+        if not reassociate:
+            return await self.cmd_sock.send_command(cmd)
+        opened, resp = await self.cmd_sock.send_commands([f'-f"{MOST_RECENT_FILE}"', cmd])
+        if opened in ('0', ''):
+            raise RuntimeError(f"Failed to open experiment file: {MOST_RECENT_FILE}")
+        self.current_file = MOST_RECENT_FILE
+        return resp
+
     async def shutdown(self):
+        if self._status_task is not None:
+            self._status_task.cancel()
+            self._status_task = None
         self.cmd_sock.close()
         self.stat_sock.close()
         self.data_sock.close()
+        self.backfill_sock.close()
 
 async def main_workflow():
     client = AsyncMASsoftClient()
@@ -186,4 +652,5 @@ async def main_workflow():
     await client.shutdown()
 
 # In Jupyter/IPython, simply do:
+# from logconfig import setup_logging; setup_logging()
 # await main_workflow()
@@ -0,0 +1,174 @@
+import logging
+import threading
+
+from parsing import RowSchema
+from status import ACTIVE_STATES
+
+log = logging.getLogger('rga.metadata')
+
+LAST_FILE = "%HIDEN_LastFile%"  # MASsoft's name for the most recently opened file
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def parse_legends(raw):
+    """Split a -lLegends reply into column names."""
+    if not raw or raw == '0':
+        return []
+    return [item.strip().strip('"') for item in raw.replace('\r\n', '\t').split('\t')]
+
+
+def parse_scan_parameters(raw):
+    """Split a -lScanParameters reply into a list of {header: value} rows."""
+    if not raw or raw == '0':
+        return []
+    lines = [line.split('\t') for line in raw.split('\r\n') if line.strip()]
+    headers = [h.strip() for h in lines[0]]
+    return [dict(zip(headers, (v.strip() for v in line))) for line in lines[1:]]
+
+
+class ExperimentMetadata:
+    """Legends and scan parameters of one (experiment file, view), with the
+    lookups the data path needs precomputed once.
+
+    ready        -- MASsoft sent the legends (a view not ready yet has none)
+    columns      -- Time, ms, then one name per mass column
+    index        -- {column name: position in a data row}
+    masses       -- mass of each MID column (from the legends, or the scan
+                    parameter Start values when the legends carry none)
+    mass_columns -- data row positions of those masses
+    schema       -- parsing.RowSchema that turns received blocks into ScanFrames
+    dtype        -- the schema's record dtype (time, ms, intensities vector)
+    """
+
+    def __init__(self, path, view, legends, scan_parameters):
+        self.path = path
+        self.view = view
+        self.legends = list(legends)
+        self.scan_parameters = list(scan_parameters)
+        masses = [float(h.split()[-1]) for h in self.legends if 'mass' in h]
+        if not masses:
+            masses = [float(row['Start']) for row in self.scan_parameters if 'Start' in row]
+        elif self.scan_parameters and len(self.scan_parameters) != len(masses):
+            log.warning(
+                f"Legends list {len(masses)} masses but scan parameters "
+                f"list {len(self.scan_parameters)} scans"
+            )
+        self.masses = masses
+        # Rows always start with Time and ms, whether or not the legends say so
+        self.columns = (self.legends[:2] or ['Time', 'ms']) + [f'mass {m:.2f}' for m in masses]
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.mass_columns = list(range(2, 2 + len(masses)))
+        self.schema = RowSchema(self.columns, masses)
+        self.dtype = self.schema.record_dtype
+
+    @property
+    def ready(self):
+        return bool(self.legends)
+
+    @property
+    def n_columns(self):
+        return len(self.columns)
+
+    def scan_table(self):
+        """Scan parameters as {header: [value per scan]}."""
+        table = {}
+        for row in self.scan_parameters:
+            for header, value in row.items():
+                table.setdefault(header, []).append(value)
+        return table
+
+
+class MetadataCache:
+    """ExperimentMetadata keyed by (experiment path, view).
+
+    Entries are dropped when an experiment is (re)started or closed, since
+    either can change the scan set-up; a different file is a different key.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Counters
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, view):
+        with self._lock:
+            meta = self._entries.get((path, view))
+            if meta is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return meta
+
+    def put(self, meta):
+        with self._lock:
+            self._entries[(meta.path, meta.view)] = meta
+        return meta
+
+    def load(self, path, view, fetch):
+        """Return the cached entry, or build one from fetch() ->
+        (legends reply, scan parameters reply) and cache it."""
+        meta = self.get(path, view)
+        if meta is None:
+            legends, params = fetch()
+            meta = self._build(path, view, legends, params)
+        return meta
+
+    async def aload(self, path, view, fetch):
+        """load() with fetch a coroutine function."""
+        meta = self.get(path, view)
+        if meta is None:
+            legends, params = await fetch()
+            meta = self._build(path, view, legends, params)
+        return meta
+
+    def _build(self, path, view, legends, params):
+        legends = parse_legends(legends)
+        if not legends:
+            # Nothing to cache: the view is not ready yet
+            return ExperimentMetadata(path, view, [], parse_scan_parameters(params))
+        return self.put(ExperimentMetadata(path, view, legends, parse_scan_parameters(params)))
+
+    def invalidate(self, path=None):
+        """Forget the entries of one experiment file (all files if None)."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == path]:
+                    del self._entries[key]
+
+    def observe(self, command):
+        """Drop cached metadata once `command` starts or closes an experiment.
+        The file may be cached under another name (%HIDEN_LastFile% or its
+        full path), so every entry goes."""
+        word = command.split()[0] if command.split() else ''
+        if word in ('-xGo', '-xClose'):
+            self.invalidate()
+
+    def observe_state(self, old, new, raw=None, path=None):
+        """Status subscriber (the client passes the file its status link is
+        associated with): drop that file's entries when a run starts,
+        including runs started from the MASsoft GUI or another client, which
+        observe() never sees. Entries cached as LAST_FILE go too, as that now
+        names the file that started. Without a path every entry goes."""
+        if new in ACTIVE_STATES and old not in ACTIVE_STATES:
+            self.invalidate(path)
+            if path is not None:
+                self.invalidate(LAST_FILE)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_cache():
+    """Return the process-wide metadata cache."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = MetadataCache()
+        return _default_cache
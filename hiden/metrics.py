@@ -0,0 +1,214 @@
+"""In-process counters, gauges and histograms for the acquisition hot path.
+
+Updates are a lock and an addition, cheap enough to sit on every command and
+every received batch.  The process-wide registry (get_registry()) is read by
+the IOC's diagnostic PVs and can be served as Prometheus text with serve():
+
+    RGA_METRICS_PORT=9108 python hiden/cap2.py
+    curl http://127.0.0.1:9108/metrics
+"""
+import bisect
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger('rga.metrics')
+
+METRICS_PORT = int(os.environ.get('RGA_METRICS_PORT', 0))  # 0 = no endpoint
+# Histogram upper bounds in seconds, from sub-millisecond parses to slow round trips
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_default_registry = None
+_default_lock = threading.Lock()
+_servers = {}  # (host, port) -> running server
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, doc):
+        self.name = name
+        self.doc = doc
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def samples(self):
+        return [(self.name, '', self.value)]
+
+
+class Gauge:
+    """A value that goes up and down; with `fn` it is read when sampled."""
+    kind = 'gauge'
+
+    def __init__(self, name, doc, fn=None):
+        self.name = name
+        self.doc = doc
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self.fn() if self.fn else self._value
+
+    def samples(self):
+        return [(self.name, '', self.value)]
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their count and sum."""
+    kind = 'histogram'
+
+    def __init__(self, name, doc, buckets=TIME_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q (None if empty)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        with self._lock:
+            counts, total, sum_ = list(self.counts), self.count, self.sum
+        samples, seen = [], 0
+        for bound, n in zip(self.buckets, counts):
+            seen += n
+            samples.append((f'{self.name}_bucket', f'{{le="{bound}"}}', seen))
+        samples.append((f'{self.name}_bucket', '{le="+Inf"}', total))
+        samples.append((f'{self.name}_sum', '', sum_))
+        samples.append((f'{self.name}_count', '', total))
+        return samples
+
+
+class Registry:
+    """Metrics by name; asking twice for a name returns the same metric."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name, doc):
+        return self._get(Counter, name, doc)
+
+    def gauge(self, name, doc, fn=None):
+        return self._get(Gauge, name, doc, fn)
+
+    def histogram(self, name, doc, buckets=TIME_BUCKETS):
+        return self._get(Histogram, name, doc, buckets)
+
+    def snapshot(self):
+        """{sample name (with labels): value} for every metric."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {name + labels: value for metric in metrics for name, labels, value in metric.samples()}
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.doc}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+def get_registry():
+    """Return the process-wide metrics registry."""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = Registry()
+        return _default_registry
+
+
+def serve(port=METRICS_PORT, host='127.0.0.1', registry=None):
+    """Serve the registry as Prometheus text on http://host:port/metrics from
+    a daemon thread. Returns the server (call shutdown() to stop it); asking
+    again for a port already being served returns that server."""
+    registry = registry or get_registry()
+    if port and (host, port) in _servers:
+        return _servers[(host, port)]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # one line per scrape is noise
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    _servers[(host, server.server_address[1])] = server
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    log.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+# — Hot-path metrics shared by the sync and asyncio clients and the IOC —
+_registry = get_registry()
+COMMANDS = _registry.counter('massoft_commands_total', 'Commands sent to MASsoft')
+COMMAND_TIMEOUTS = _registry.counter('massoft_command_timeouts_total', 'Commands that got no reply in time')
+COMMAND_SECONDS = _registry.histogram('massoft_command_seconds', 'Command round-trip time')
+RECONNECTS = _registry.counter('massoft_reconnects_total', 'MASsoft links re-established')
+ROWS_PARSED = _registry.counter('rga_rows_parsed_total', 'Data rows parsed from the hot-link')
+ROWS_DROPPED = _registry.counter('rga_rows_dropped_total', 'Malformed data rows discarded')
+ROWS_BACKFILLED = _registry.counter('rga_rows_backfilled_total', 'Rows of earlier cycles fetched in bulk')
+PARSE_SECONDS = _registry.histogram('rga_parse_seconds', 'Time to parse one received batch')
+PUBLISH_SECONDS = _registry.histogram('rga_publish_seconds', 'Time to write one row to the PVs')
+DATA_QUEUE_DEPTH = _registry.gauge('rga_data_queue_depth', 'Row batches waiting for the data consumer')
+HELD_BATCHES = _registry.gauge('rga_held_batches', 'Live row batches held back while a backfill catches up')
+RECORD_QUEUE_DEPTH = _registry.gauge('rga_record_queue_depth', 'Row batches waiting for the recorder')
+ANALYSIS_SECONDS = _registry.histogram('rga_analysis_seconds', 'Time from sending a frame to its analysis result')
+ANALYSIS_DROPPED = _registry.counter('rga_analysis_dropped_total', 'Frames dropped while the analysis workers were busy')
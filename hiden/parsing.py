@@ -0,0 +1,234 @@
+import collections
+import logging
+
+import numpy as np
+
+log = logging.getLogger('rga.parsing')
+
+# data: (rows, columns) float64, NaN-filled where mask is False
+# mask: True for rows that had the expected column count and parsed cleanly
+ParsedBlock = collections.namedtuple('ParsedBlock', 'data mask')
+
+
+def clock_to_seconds(text):
+    """Convert 'HH:MM:SS[.fff]' (as sent with -t1/-m1) to seconds since midnight."""
+    h, m, s = text.split(':')
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def _split_lines(raw):
+    if isinstance(raw, str):
+        raw = raw.split('\n')
+    return [line for line in (l.strip() for l in raw) if line and line != '0']
+
+
+def _loadtxt(lines, delimiter, usecols):
+    """Parse rows with NumPy's C reader; None if any value is not numeric."""
+    try:
+        return np.loadtxt(lines, dtype=np.float64, delimiter=delimiter,
+                          comments=None, usecols=usecols, ndmin=2)
+    except ValueError:
+        return None
+
+
+def parse_block(raw, n_columns=None, time_fmt=False, ms_fmt=False):
+    """Parse a received block of -lData rows into a 2-D float64 array.
+
+    raw       -- the reply text (CRLF-separated rows) or a list of row strings
+    n_columns -- expected column count (Time, ms and one per legend); taken from
+                 the first row when None
+    time_fmt  -- column 0 is 'HH:MM:SS' (-t1), converted to seconds
+    ms_fmt    -- column 1 is 'HH:MM:SS.mmm' (-m1), converted to seconds
+
+    Rows of the wrong length or with unparsable values are reported through
+    the mask instead of raising; the '0' acknowledgement line is ignored.
+    """
+    lines = _split_lines(raw)
+    if not lines:
+        return ParsedBlock(np.empty((0, n_columns or 0)), np.zeros(0, dtype=bool))
+    if '\t' in lines[0]:
+        delimiter = '\t'
+        widths = [line.count('\t') + 1 for line in lines]
+    else:
+        delimiter = None
+        widths = [len(line.split()) for line in lines]
+    if n_columns is None:
+        n_columns = widths[0]
+    mask = np.fromiter((w == n_columns for w in widths), dtype=bool, count=len(lines))
+    valid = np.flatnonzero(mask)
+    # Leading clock-format columns are skipped by the C reader and converted below
+    lead = 2 if ms_fmt else (1 if time_fmt else 0)
+    usecols = range(lead, n_columns)
+    if not lead and len(valid) == len(lines):
+        # The usual case, a clean block: the reader's array is the result
+        values = _loadtxt(lines, delimiter, usecols)
+        if values is not None:
+            return ParsedBlock(values, mask)
+    data = np.full((len(lines), n_columns), np.nan)
+    if not valid.size:
+        return ParsedBlock(data, mask)
+
+    good = [lines[i] for i in valid]
+    values = _loadtxt(good, delimiter, usecols)
+    if values is not None:
+        data[valid, lead:] = values
+    else:
+        # Some row has a non-numeric token: isolate it row by row
+        for i, line in zip(valid, good):
+            try:
+                data[i, lead:] = [float(v) for v in line.split(delimiter)[lead:]]
+            except ValueError:
+                mask[i] = False
+    clock = (time_fmt, ms_fmt)
+    for i in (np.flatnonzero(mask) if lead else ()):
+        fields = lines[i].split(delimiter, lead)
+        try:
+            for col in range(lead):
+                data[i, col] = clock_to_seconds(fields[col]) if clock[col] else float(fields[col])
+        except ValueError:
+            mask[i] = False
+            data[i] = np.nan
+    if not mask.all():
+        log.debug(f"parse_block: {int((~mask).sum())} of {len(lines)} rows malformed")
+    return ParsedBlock(data, mask)
+
+
+class RowSchema:
+    """Layout of the data rows of one (experiment file, view), derived once
+    from its legends (see metadata.ExperimentMetadata.schema).
+
+    Rows are float64 arrays of Time, ms, then one intensity per mass;
+    `record_dtype` views such a (rows, columns) array, without copying, as
+    one record per cycle with `time`, `ms` and an `intensities` vector.
+    """
+    __slots__ = ('columns', 'masses', 'dtype', 'record_dtype')
+
+    time_column = 0
+    ms_column = 1
+    first_mass = 2
+
+    def __init__(self, columns, masses, dtype=np.float64):
+        self.columns = tuple(columns)
+        self.masses = np.asarray(masses, dtype=np.float64)
+        self.dtype = np.dtype(dtype)
+        self.record_dtype = np.dtype([
+            ('time', self.dtype), ('ms', self.dtype),
+            ('intensities', self.dtype, (max(0, len(self.columns) - self.first_mass),)),
+        ])
+
+    @property
+    def n_columns(self):
+        return len(self.columns)
+
+    def parse(self, raw, first_cycle=0, arrival=None, time_fmt=False, ms_fmt=False):
+        """Parse a received block into a ScanFrame of its valid rows; the
+        first line is cycle `first_cycle`."""
+        # Without legends (view not ready) the first row sets the width
+        block = parse_block(raw, self.n_columns or None, time_fmt=time_fmt, ms_fmt=ms_fmt)
+        return ScanFrame.from_block(self, block, first_cycle, arrival)
+
+
+class ScanFrame:
+    """A batch of consecutive scan cycles as received: the canonical form in
+    which rows travel from the clients to the history, recorder and PVs.
+
+    rows        -- (n, columns) float64 array of the valid rows (a view of
+                   the parsed block when every row was valid)
+    first_cycle -- cycle number of the block's first line, counted from the
+                   -c cycle the transfer started at (see CycleCounter)
+    arrival     -- loop/monotonic time the block was received
+    dropped     -- malformed rows left out
+
+    time, ms and intensities are column views; records is the rows viewed
+    through schema.record_dtype.  cycles is only built when asked for.
+    """
+    __slots__ = ('schema', 'rows', 'first_cycle', 'arrival', 'dropped', '_valid')
+
+    def __init__(self, schema, rows, first_cycle=0, arrival=None, dropped=0, valid=None):
+        self.schema = schema
+        self.rows = rows
+        self.first_cycle = first_cycle
+        self.arrival = arrival
+        self.dropped = dropped
+        self._valid = valid  # row positions in the block, None if contiguous
+
+    @classmethod
+    def from_block(cls, schema, block, first_cycle=0, arrival=None):
+        valid = int(block.mask.sum())
+        if valid == len(block.mask):
+            return cls(schema, block.data, first_cycle, arrival)
+        return cls(schema, block.data[block.mask], first_cycle, arrival,
+                   len(block.mask) - valid, np.flatnonzero(block.mask))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return f'<ScanFrame cycles {self.first_cycle}-{self.end_cycle - 1}, {len(self)} rows>'
+
+    @property
+    def end_cycle(self):
+        """Cycle number following this block (where a resumed link starts)."""
+        return self.first_cycle + len(self.rows) + self.dropped
+
+    @property
+    def cycles(self):
+        """Cycle number of every row."""
+        if self._valid is None:
+            return np.arange(self.first_cycle, self.first_cycle + len(self.rows))
+        return self.first_cycle + self._valid
+
+    @property
+    def time(self):
+        return self.rows[:, self.schema.time_column]
+
+    @property
+    def ms(self):
+        return self.rows[:, self.schema.ms_column]
+
+    @property
+    def intensities(self):
+        """(n, masses) view of the intensity columns."""
+        return self.rows[:, self.schema.first_mass:]
+
+    @property
+    def records(self):
+        """The rows as a structured array of schema.record_dtype (a view)."""
+        rows = np.ascontiguousarray(self.rows, dtype=self.schema.dtype)
+        return rows.view(self.schema.record_dtype)[:, 0]
+
+    def latest(self):
+        """The last row (a view), or None for an empty frame."""
+        return self.rows[-1] if len(self.rows) else None
+
+
+class CycleCounter:
+    """Cycle number of the next line on a -lData link: where a resumed link
+    picks up (-c).
+
+    Rows carry no cycle number, so lines are counted from the cycle the link
+    started at -- the -c it was opened with, else 0. Without -c MASsoft
+    starts at its current cycle, which makes the count a lower bound: a
+    link resumed from it sends rows already received again, and
+    backfill.RowMerger drops them by their ms. A new run (ms going back)
+    restarts the count.
+    """
+    __slots__ = ('cycle', 'last_ms')
+
+    def __init__(self, start=0):
+        self.cycle = start
+        self.last_ms = -np.inf
+
+    def advance(self, frame):
+        """Count the lines of `frame`, parsed from cycle self.cycle."""
+        ms = frame.ms
+        if not len(ms):
+            self.cycle = frame.end_cycle
+            return
+        back = np.flatnonzero(np.diff(ms, prepend=self.last_ms) < 0)
+        if back.size:
+            # A new run numbers its cycles from 0
+            self.cycle = len(ms) - int(back[-1])
+        else:
+            self.cycle = frame.end_cycle
+        self.last_ms = ms[-1]
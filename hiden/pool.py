@@ -0,0 +1,206 @@
+import collections
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger('massoft.pool')
+
+POOL_MAX_PER_HOST = 6     # MASsoft sessions one process may hold per host
+POOL_IDLE_TIMEOUT = 300.0  # s an unused link is kept open
+POOL_KEEPALIVE = 30.0      # s between -xStatus pings on idle links
+POOL_ACQUIRE_TIMEOUT = 10.0  # s acquire() waits for a link to be freed at the cap
+
+ROLES = ('command', 'status', 'data')
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+class MASsoftPool:
+    """Shared, capped set of MASsoft connections, leased out by role.
+
+    Links are keyed by (host, port, role) and handed back warm after use, so
+    callers skip the connect/greeting/association round trips.  At most
+    max_per_host connections are open per host; when the cap is reached an
+    idle link of another role is recycled, otherwise acquire() waits.
+
+    Links that carry a hot-link (-lData/-lStatus) keep receiving pushed data,
+    so they are closed on release instead of being reused.
+    """
+
+    def __init__(self, socket_class=None, host=None, port=None, max_per_host=POOL_MAX_PER_HOST,
+                 idle_timeout=POOL_IDLE_TIMEOUT, keepalive=POOL_KEEPALIVE,
+                 acquire_timeout=POOL_ACQUIRE_TIMEOUT):
+        # Imported here: massoft_client itself uses the pool
+        from massoft_client import MAS_HOST, MAS_PORT, MASsoftSocket
+        self.socket_class = socket_class or MASsoftSocket
+        self.host = host or MAS_HOST
+        self.port = port or MAS_PORT
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.acquire_timeout = acquire_timeout
+        self._idle = collections.defaultdict(list)  # (host, port, role) -> [(sock, released_at)]
+        self._open = collections.Counter()          # (host, port) -> open connections
+        self._leased = {}                           # sock -> (host, port, role)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._keeper = None
+        # Counters
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def acquire(self, role='command', host=None, port=None, file=None, timeout=None):
+        """Lease a connected link for `role`, associated with `file` if given
+        (the -f path as MASsoft expects it). While the host is at its
+        connection cap, waits up to `timeout` seconds (the pool's
+        acquire_timeout if None) for a link to be freed, then raises TimeoutError."""
+        if role not in ROLES:
+            raise ValueError(f"Unknown role {role!r}; expected one of {ROLES}")
+        host = host or self.host
+        port = port or self.port
+        key, hostkey = (host, port, role), (host, port)
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        sock = None
+        with self._cond:
+            while sock is None:
+                if self._closed:
+                    raise RuntimeError("Pool is closed.")
+                if self._idle[key]:
+                    sock, _ = self._idle[key].pop()
+                    self.reused += 1
+                elif self._open[hostkey] < self.max_per_host:
+                    self._open[hostkey] += 1
+                elif self._evict_idle(hostkey):
+                    self._open[hostkey] += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"All {self.max_per_host} MASsoft connections to {host}:{port} are leased "
+                            f"and none was freed within {timeout}s; shut down an unused client "
+                            f"or raise max_per_host.")
+                    self._cond.wait(remaining)
+                    continue
+                if sock is None:
+                    sock = self.socket_class(host, port, name=f"{role.capitalize()}Socket")
+                    self.created += 1
+            self._leased[sock] = key
+        self._ensure_keeper()
+        try:
+            sock.connect()
+            if file is not None:
+                command = f'-f"{file}"'
+                if sock.state.association != command:
+                    if sock.send_command(command) == '0':
+                        raise RuntimeError(f"Failed to open experiment file: {file}")
+        except BaseException:
+            self.discard(sock)
+            raise
+        return sock
+
+    def release(self, sock):
+        """Return a leased link; hot-linked or dead links are closed instead."""
+        if self._closed or sock.sock is None or sock.state.hotlinks:
+            self.discard(sock)
+            return
+        with self._cond:
+            key = self._leased.pop(sock)
+            self._idle[key].append((sock, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, sock):
+        """Close a leased link and give its slot back."""
+        sock.close()
+        sock.state.hotlinks.clear()
+        with self._cond:
+            self._leased.pop(sock, None)
+            self._open[(sock.host, sock.port)] -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self, role='command', host=None, port=None, file=None, timeout=None):
+        """Context manager around acquire()/release(). A link left by an
+        exception may still have a reply in flight, so it is discarded."""
+        sock = self.acquire(role, host, port, file, timeout)
+        try:
+            yield sock
+        except BaseException:
+            self.discard(sock)
+            raise
+        self.release(sock)
+
+    def _evict_idle(self, hostkey):
+        """Close the longest-idle link of any role on this host (lock held)."""
+        # The oldest link of each role is at the front of its idle list
+        candidates = [
+            (links[0][1], key) for key, links in self._idle.items()
+            if key[:2] == hostkey and links
+        ]
+        if not candidates:
+            return False
+        _, key = min(candidates)
+        sock, _ = self._idle[key].pop(0)
+        sock.close()
+        self._open[hostkey] -= 1
+        self.evicted += 1
+        return True
+
+    def _ensure_keeper(self):
+        if self.keepalive and (self._keeper is None or not self._keeper.is_alive()):
+            self._keeper = threading.Thread(target=self._keep_warm, name="MASsoftPoolKeeper", daemon=True)
+            self._keeper.start()
+
+    def _keep_warm(self):
+        """Ping idle links so they stay open; close those unused too long."""
+        while not self._closed:
+            time.sleep(self.keepalive)
+            now = time.monotonic()
+            with self._cond:
+                due = []
+                for key, links in self._idle.items():
+                    due.extend((key, sock, released) for sock, released in links)
+                    links.clear()
+            for key, sock, released in due:
+                if now - released > self.idle_timeout:
+                    log.info(f"Closing {sock.name} to {sock.host}:{sock.port} after idling")
+                    self.discard(sock)
+                    continue
+                if sock.ping():
+                    with self._cond:
+                        self._idle[key].append((sock, released))
+                        self._cond.notify()
+                else:
+                    self.discard(sock)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'open': dict(self._open),
+                'idle': sum(len(links) for links in self._idle.values()),
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+            }
+
+    def close(self):
+        """Close every idle link; leased links are closed when released."""
+        with self._cond:
+            self._closed = True
+            idle = [sock for links in self._idle.values() for sock, _ in links]
+            self._idle.clear()
+            self._cond.notify_all()
+        for sock in idle:
+            self.discard(sock)
+
+
+def get_pool():
+    """Return the process-wide pool shared by every client and IOC."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None or _default_pool._closed:
+            _default_pool = MASsoftPool()
+        return _default_pool
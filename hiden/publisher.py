@@ -0,0 +1,74 @@
+import asyncio
+import logging
+
+log = logging.getLogger('rga.publisher')
+
+
+class RowPublisher:
+    """Publish the newest data row, decoupled from how fast rows arrive.
+
+    offer() only stores the last row of a batch and wakes the publishing
+    task, so a backlog from MASsoft is coalesced to its latest row instead of
+    replaying every stale cycle.  Rows replaced before they were published
+    (earlier rows of a batch, or a pending row overtaken by the next batch)
+    are counted in `coalesced`.  With max_rate set, publications are spaced
+    at least 1/max_rate seconds apart; rows arriving in between coalesce.
+
+    publish -- coroutine function publish(row, arrival) writing one row's PVs
+    max_rate -- maximum publications per second (None or 0 for no limit)
+    """
+
+    def __init__(self, publish, max_rate=None):
+        self.publish = publish
+        self.max_rate = max_rate
+        self._pending = None
+        self._wake = asyncio.Event()
+        # Counters
+        self.offered = 0
+        self.published = 0
+        self.coalesced = 0
+
+    def offer(self, rows, arrival):
+        """Queue the last of `rows` (received at loop time `arrival`)."""
+        if not len(rows):
+            return
+        self.offered += len(rows)
+        self.coalesced += len(rows) - 1
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = (rows[-1], arrival)
+        self._wake.set()
+
+    async def run(self):
+        """Publish pending rows until cancelled."""
+        loop = asyncio.get_running_loop()
+        next_allowed = 0.0
+        while True:
+            await self._wake.wait()
+            delay = next_allowed - loop.time()
+            if delay > 0:
+                # Rate limited: whatever arrives meanwhile replaces the pending row
+                await asyncio.sleep(delay)
+            self._wake.clear()
+            row, arrival = self._pending
+            self._pending = None
+            if self.max_rate:
+                next_allowed = loop.time() + 1.0 / self.max_rate
+            try:
+                await self.publish(row, arrival)
+            except Exception as e:
+                log.error(f"Failed to publish row: {e}")
+                continue
+            self.published += 1
+
+    async def flush(self):
+        """Publish the pending row now, if any (e.g. when the stream ends)."""
+        if self._pending is not None:
+            row, arrival = self._pending
+            self._pending = None
+            self._wake.clear()
+            await self.publish(row, arrival)
+            self.published += 1
+
+    def stats(self):
+        return {'offered': self.offered, 'published': self.published, 'coalesced': self.coalesced}
@@ -0,0 +1,336 @@
+"""Append-only, chunked, columnar on-disk store for RGA scan rows.
+
+A recording is a directory laid out like a Zarr group, using only NumPy:
+
+    run_dir/
+      meta.json            columns, chunk size, compression, attributes,
+                           committed row count, complete flag
+      <column>/<n>.npy     chunk n of that column (.npy.z when compressed)
+
+Column 0 is ``timestamp`` (epoch seconds the row was received), followed by
+one column per legend.  Chunk files and meta.json are written to a temporary
+name and renamed into place, and meta.json is only updated after the chunks
+it counts, so a reader never sees a torn file and the recording can be read
+while the run is still in progress.
+
+meta.json also carries the first timestamp of every chunk, a sparse index
+that lets `Recording` find a time window with two binary searches and hand
+back memory-mapped views of the (uncompressed) chunks.
+"""
+import collections
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from metrics import RECORD_QUEUE_DEPTH
+
+log = logging.getLogger('rga.recorder')
+
+DEFAULT_CHUNK_ROWS = 4096     # rows per chunk file
+DEFAULT_FLUSH_INTERVAL = 1.0  # s between flushes of the open (partial) chunk
+RECORD_QUEUE_SIZE = 1024      # row batches waiting for the writer thread
+TIMESTAMP_COLUMN = 'timestamp'
+META_FILE = 'meta.json'
+MAX_MAPPED_CHUNKS = 256       # chunk files a Recording keeps mapped (one fd each)
+
+
+def _column_dir(name):
+    """Directory name for a column (legends may contain '/' or spaces)."""
+    return name.replace('/', '_').replace(os.sep, '_')
+
+
+def _atomic_write(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _chunk_path(root, column, index, compression):
+    suffix = '.npy.z' if compression == 'zlib' else '.npy'
+    return os.path.join(root, _column_dir(column), f'{index}{suffix}')
+
+
+class ScanRecorder:
+    """Write scan rows to a chunked columnar store on a background thread.
+
+    append() only queues the rows, so it never blocks the acquisition loop;
+    if the writer falls RECORD_QUEUE_SIZE batches behind, further batches are
+    counted in `dropped` and logged rather than stalling the caller.
+
+    path        -- directory of the recording (created)
+    columns     -- legend names, one per data column (timestamp is added)
+    attrs       -- JSON-serialisable attributes (scan parameters, file, view)
+    compression -- None or 'zlib'
+    """
+
+    def __init__(self, path, columns, attrs=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 compression=None, flush_interval=DEFAULT_FLUSH_INTERVAL, queue_size=RECORD_QUEUE_SIZE,
+                 level=1):
+        if compression not in (None, 'zlib'):
+            raise ValueError(f"Unsupported compression {compression!r}")
+        self.path = path
+        self.columns = [TIMESTAMP_COLUMN] + list(columns)
+        self.attrs = dict(attrs or {})
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.level = level
+        self.flush_interval = flush_interval
+        self._chunk = np.empty((chunk_rows, len(self.columns)), dtype=np.float64)
+        self._fill = 0      # rows in the open chunk
+        self._index = 0     # number of the open chunk
+        self._written = 0   # rows in the open chunk already on disk
+        self._starts = []   # first timestamp of every chunk (sparse index)
+        self.rows = 0       # rows committed to meta.json
+        self.dropped = 0
+        self._behind = False
+        self._queue = queue.Queue(queue_size)
+        for column in self.columns:
+            os.makedirs(os.path.join(path, _column_dir(column)), exist_ok=True)
+        self._write_meta(complete=False)
+        self._thread = threading.Thread(target=self._run, name="ScanRecorder", daemon=True)
+        self._thread.start()
+
+    def append(self, rows, timestamp=None):
+        """Queue a (n, columns) block of rows received at `timestamp` (a
+        scalar or one value per row; now if None)."""
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.ndim == 1:
+            rows = rows[np.newaxis]
+        if rows.shape[1] != len(self.columns) - 1:
+            raise ValueError(f"Expected (n, {len(self.columns) - 1}) rows, got {rows.shape}")
+        stamps = np.broadcast_to(time.time() if timestamp is None else timestamp, (len(rows),))
+        try:
+            self._queue.put_nowait(np.column_stack((stamps, rows)))
+            self._behind = False
+            RECORD_QUEUE_DEPTH.set(self._queue.qsize())
+        except queue.Full:
+            self.dropped += len(rows)
+            if not self._behind:
+                # Once per stall: the writer may stay behind for many batches
+                log.warning(f"Recorder {self.path} is behind; dropping rows ({self.dropped} so far)")
+            self._behind = True
+
+    def close(self):
+        """Write everything queued, mark the recording complete and stop the writer."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                block = self._queue.get(timeout=max(0.0, next_flush - time.monotonic()))
+            except queue.Empty:
+                block = False
+            if block is None:
+                break
+            if block is not False:
+                try:
+                    self._add(block)
+                except OSError as e:
+                    log.error(f"Recorder {self.path} write failed: {e}")
+            if time.monotonic() >= next_flush:
+                self._flush()
+                next_flush = time.monotonic() + self.flush_interval
+        self._flush()
+        self._write_meta(complete=True)
+        log.info(f"Recorded {self.rows} rows to {self.path}")
+
+    def _add(self, block):
+        pos = 0
+        while pos < len(block):
+            if self._fill == 0:
+                self._starts.append(float(block[pos, 0]))
+            n = min(len(block) - pos, self.chunk_rows - self._fill)
+            self._chunk[self._fill:self._fill + n] = block[pos:pos + n]
+            self._fill += n
+            pos += n
+            if self._fill == self.chunk_rows:
+                self._write_chunk()
+                self._index += 1
+                self._fill = self._written = 0
+                self._write_meta(complete=False)
+
+    def _flush(self):
+        """Write the open chunk if it grew since it was last written."""
+        if self._fill > self._written:
+            self._write_chunk()
+            self._written = self._fill
+            self._write_meta(complete=False)
+
+    def _write_chunk(self):
+        for col, name in enumerate(self.columns):
+            values = np.ascontiguousarray(self._chunk[:self._fill, col])
+            path = _chunk_path(self.path, name, self._index, self.compression)
+            if self.compression == 'zlib':
+                _atomic_write(path, zlib.compress(values.tobytes(), self.level))
+            else:
+                tmp = path + '.tmp'
+                with open(tmp, 'wb') as f:
+                    np.save(f, values)
+                os.replace(tmp, path)
+
+    def _write_meta(self, complete):
+        self.rows = self._index * self.chunk_rows + self._fill
+        meta = {
+            'columns': self.columns,
+            'chunk_rows': self.chunk_rows,
+            'compression': self.compression,
+            'dtype': np.dtype(np.float64).str,
+            'rows': self.rows,
+            'chunk_starts': self._starts,
+            'complete': complete,
+            'attrs': self.attrs,
+        }
+        _atomic_write(os.path.join(self.path, META_FILE), json.dumps(meta, indent=1).encode('utf-8'))
+
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+
+def read_column(path, column, meta=None):
+    """Return every committed value of one column of a recording."""
+    meta = meta or read_meta(path)
+    rows, chunk_rows = meta['rows'], meta['chunk_rows']
+    parts = []
+    for index in range((rows + chunk_rows - 1) // chunk_rows):
+        n = min(chunk_rows, rows - index * chunk_rows)
+        chunk_path = _chunk_path(path, column, index, meta['compression'])
+        if meta['compression'] == 'zlib':
+            with open(chunk_path, 'rb') as f:
+                values = np.frombuffer(zlib.decompress(f.read()), dtype=meta['dtype'])
+        else:
+            values = np.load(chunk_path)
+        # The open chunk may already hold rows newer than meta.json counts
+        parts.append(values[:n])
+    return np.concatenate(parts) if parts else np.empty(0, dtype=meta['dtype'])
+
+
+def read_recording(path):
+    """Load a (possibly still running) recording as (columns, data, attrs),
+    data being a (rows, columns) float64 array."""
+    meta = read_meta(path)
+    columns = meta['columns']
+    data = np.column_stack([read_column(path, c, meta) for c in columns]) if meta['rows'] else \
+        np.empty((0, len(columns)))
+    return columns, data, meta['attrs']
+
+
+class Recording:
+    """Random access to a recording without loading it.
+
+    Rows are located by time with a binary search over the chunk start
+    timestamps, then one over the timestamps of a single chunk, so seeking
+    costs O(log n) whatever the length of the run.  Uncompressed chunks are
+    memory-mapped: a slice that lies within one chunk is a read-only view of
+    the file, and only slices spanning chunks are copied when joined.
+    zlib-compressed chunks are decompressed on every read.
+
+    Call refresh() to see rows written since the recording was opened.
+    """
+
+    def __init__(self, path, max_mapped=MAX_MAPPED_CHUNKS):
+        self.path = path
+        self.max_mapped = max_mapped
+        self._maps = collections.OrderedDict()  # (column, chunk) -> memmap, LRU order
+        self._full = 0                          # chunks complete when last refreshed
+        self.refresh()
+
+    def refresh(self):
+        """Re-read meta.json to pick up rows written since the last call."""
+        meta = read_meta(self.path)
+        self.columns = meta['columns']
+        self.attrs = meta['attrs']
+        self.chunk_rows = meta['chunk_rows']
+        self.compression = meta['compression']
+        self.dtype = np.dtype(meta['dtype'])
+        self.complete = meta['complete']
+        self.rows = meta['rows']
+        # Chunks that were still open have been rewritten since they were mapped
+        for key in [key for key in self._maps if key[1] >= self._full]:
+            del self._maps[key]
+        self._full = self.rows // self.chunk_rows
+        n_chunks = -(-self.rows // self.chunk_rows)
+        starts = meta.get('chunk_starts')
+        if starts is None or len(starts) < n_chunks:
+            # Written before the index was kept: read the first stamp of each chunk
+            starts = [self._chunk(TIMESTAMP_COLUMN, i)[0] for i in range(n_chunks)]
+        self.chunk_starts = np.asarray(starts[:n_chunks], dtype=np.float64)
+        self.mass_columns = {
+            float(name.split()[-1]): name for name in self.columns if name.startswith('mass ')
+        }
+
+    def __len__(self):
+        return self.rows
+
+    def _chunk(self, column, index):
+        """Valid rows of chunk `index` of `column`."""
+        n = min(self.chunk_rows, self.rows - index * self.chunk_rows)
+        path = _chunk_path(self.path, column, index, self.compression)
+        if self.compression == 'zlib':
+            with open(path, 'rb') as f:
+                return np.frombuffer(zlib.decompress(f.read()), dtype=self.dtype)[:n]
+        key = (column, index)
+        values = self._maps.get(key)
+        if values is None:
+            values = self._maps[key] = np.load(path, mmap_mode='r')
+            if len(self._maps) > self.max_mapped:
+                self._maps.popitem(last=False)
+        else:
+            self._maps.move_to_end(key)
+        return values[:n]
+
+    def locate(self, t):
+        """Row number of the first row stamped at or after `t`."""
+        # Last chunk starting before t: any earlier row is stamped before t
+        index = int(np.searchsorted(self.chunk_starts, t, side='left')) - 1
+        if index < 0:
+            return 0
+        stamps = self._chunk(TIMESTAMP_COLUMN, index)
+        return index * self.chunk_rows + int(np.searchsorted(stamps, t, side='left'))
+
+    def column(self, name, first=0, last=None):
+        """Rows [first, last) of one column; a view of the mapped chunk when
+        the range lies within one (uncompressed) chunk."""
+        last = self.rows if last is None else min(last, self.rows)
+        parts = []
+        for index in range(first // self.chunk_rows, -(-last // self.chunk_rows)):
+            base = index * self.chunk_rows
+            parts.append(self._chunk(name, index)[max(first - base, 0):last - base])
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.dtype)
+
+    def select(self, start=None, stop=None, masses=None, columns=None):
+        """Return {column: values} for the rows stamped in [start, stop)
+        (either end open if None), for the given masses and/or column names
+        (all columns if neither is given). The timestamp column is always
+        included."""
+        names = list(columns or [])
+        for mass in masses or []:
+            name = self.mass_columns.get(round(float(mass), 2))
+            if name is None:
+                raise ValueError(f"No column for mass {mass} in {self.path}")
+            names.append(name)
+        if not names:
+            names = self.columns[1:]
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown} in {self.path}")
+        first = 0 if start is None else self.locate(start)
+        last = self.rows if stop is None else max(first, self.locate(stop))
+        return {name: self.column(name, first, last) for name in [TIMESTAMP_COLUMN] + names}
+
+    def close(self):
+        """Drop the mappings (views already handed out stay valid)."""
+        self._maps.clear()
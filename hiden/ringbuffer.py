@@ -0,0 +1,388 @@
+import json
+import logging
+import os
+import sys
+import time
+import weakref
+
+import numpy as np
+
+log = logging.getLogger('rga.history')
+
+DEFAULT_CAPACITY = 10000  # rows kept in memory
+
+# A shared history block is a header of uint64 fields, the layout (columns,
+# dtype) as JSON, then the (columns, 2 * capacity) data array
+SHM_MAGIC = 0x52474148495354  # 'RGAHIST'
+MAGIC, SEQ, COUNT, CAPACITY, CLOSED, PID, LAYOUT_LEN, DATA_OFFSET = range(8)
+HEADER_FIELDS = 8
+HEADER_BYTES = 128
+
+
+def _bounds(count, capacity, n):
+    """(start, stop) slots of the newest n rows when `count` rows were appended."""
+    size = min(count, capacity)
+    n = size if n is None else min(n, size)
+    end = count % capacity + capacity if count else capacity
+    return end - n, end
+
+
+def _attach(name):
+    """Map an existing shared memory block without handing it to this
+    process's resource tracker, which would unlink it when we exit."""
+    from multiprocessing import resource_tracker, shared_memory
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # Attaching registered the block; take back only that registration, and
+    # not in the process that created it (the tracker keeps one per name)
+    header = np.ndarray(HEADER_FIELDS, np.uint64, buffer=shm.buf) if shm.size >= HEADER_BYTES else None
+    if header is None or header[MAGIC] != SHM_MAGIC or int(header[PID]) != os.getpid():
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    del header
+    return shm
+
+
+def _owner_alive(pid):
+    if os.name != 'posix':
+        return True  # a Windows block only outlives its last handle
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _create_shared(name, columns, shape, dtype):
+    """Create a shared history block; a block of the same name left by a
+    process that no longer exists is replaced."""
+    from multiprocessing import shared_memory
+    dtype = np.dtype(dtype)
+    layout = json.dumps({'columns': columns, 'dtype': dtype.str}).encode()
+    offset = -(-(HEADER_BYTES + len(layout)) // 64) * 64
+    size = offset + int(np.prod(shape)) * dtype.itemsize
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        stale = _attach(name)
+        pid = int(np.ndarray(HEADER_FIELDS, np.uint64, buffer=stale.buf)[PID]) if stale.size >= HEADER_BYTES else 0
+        stale.close()
+        if pid and _owner_alive(pid):
+            raise FileExistsError(f"Shared history {name} is in use by process {pid}") from None
+        log.warning(f"Replacing shared history {name} left by process {pid}")
+        stale = shared_memory.SharedMemory(name=name)
+        stale.unlink()
+        stale.close()
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    header = np.ndarray(HEADER_FIELDS, np.uint64, buffer=shm.buf)
+    header[:] = 0
+    shm.buf[HEADER_BYTES:HEADER_BYTES + len(layout)] = layout
+    header[CAPACITY] = shape[1] // 2
+    header[PID] = os.getpid()
+    header[LAYOUT_LEN] = len(layout)
+    header[DATA_OFFSET] = offset
+    header[MAGIC] = SHM_MAGIC
+    data = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+    return shm, header, data
+
+
+def _release(shm):
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ColumnRingBuffer:
+    """Fixed-capacity, NumPy-backed columnar history of scan rows.
+
+    One contiguous column per legend.  Every row is written twice, at slot i
+    and slot i + capacity, so the newest n rows of any column are always a
+    contiguous slice: appends are O(1) and windows are zero-copy views.
+    Memory is 2 * capacity * len(columns) * itemsize, whatever the run length.
+
+    If spill_dir is given, rows are saved there as .npy chunks of shape
+    (rows, columns) before they are overwritten, so nothing is lost on long runs.
+
+    With `shared` (True, or the block name to use) the buffer lives in shared
+    memory (shm_name) and any process on the host can read it in place with
+    SharedHistory.  Appends bump a sequence number to odd, write the rows,
+    publish the new row count and bump it back to even (a seqlock), so
+    readers never see a partly written row.  close() marks the block closed
+    and frees it; it is also freed when the buffer is garbage collected or
+    the process exits.
+    """
+
+    def __init__(self, columns, capacity=DEFAULT_CAPACITY, dtype=np.float64,
+                 spill_dir=None, spill_chunk=None, shared=False):
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.capacity = capacity
+        shape = (len(self.columns), 2 * capacity)
+        self._shm = self._header = None
+        if shared:
+            name = shared if isinstance(shared, str) else None
+            self._shm, self._header, self._data = _create_shared(name, self.columns, shape, dtype)
+            self._data.fill(np.nan)
+            self._finalizer = weakref.finalize(self, _release, self._shm)
+        else:
+            self._data = np.full(shape, np.nan, dtype=dtype)
+        self._count = 0      # rows ever appended
+        self._spilled = 0    # rows ever written to spill_dir
+        self.spill_dir = spill_dir
+        self.spill_chunk = spill_chunk or max(1, capacity // 4)
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total(self):
+        """Number of rows appended since creation (including evicted ones)."""
+        return self._count
+
+    def append(self, row):
+        """Append one row (a sequence with one value per column)."""
+        if self.spill_dir is not None and self._count - self._spilled >= self.capacity:
+            self._spill()
+        self._begin()
+        slot = self._count % self.capacity
+        self._data[:, slot] = row
+        self._data[:, slot + self.capacity] = row
+        self._count += 1
+        self._commit()
+
+    def extend(self, rows):
+        """Append a (n, columns) block of rows."""
+        rows = np.asarray(rows, dtype=self._data.dtype)
+        if rows.ndim != 2 or rows.shape[1] != len(self.columns):
+            raise ValueError(f"Expected (n, {len(self.columns)}) rows, got {rows.shape}")
+        n = len(rows)
+        self._begin()
+        try:
+            if self.spill_dir is None and n > self.capacity:
+                # Only the newest `capacity` rows can be kept
+                self._count += n - self.capacity
+                rows = rows[-self.capacity:]
+                n = self.capacity
+            pos = 0
+            while pos < n:
+                if self.spill_dir is not None and self._count - self._spilled >= self.capacity:
+                    self._spill()
+                slot = self._count % self.capacity
+                step = min(n - pos, self.capacity - slot)
+                if self.spill_dir is not None:
+                    step = min(step, self.capacity - (self._count - self._spilled))
+                block = rows[pos:pos + step].T
+                self._data[:, slot:slot + step] = block
+                self._data[:, slot + self.capacity:slot + self.capacity + step] = block
+                self._count += step
+                pos += step
+        finally:
+            # Publish the rows written so far even if a spill failed, so
+            # readers are never left spinning on an odd sequence number
+            self._commit()
+
+    def _begin(self):
+        if self._header is not None:
+            self._header[SEQ] += 1  # odd: rows being written
+
+    def _commit(self):
+        if self._header is not None:
+            self._header[COUNT] = self._count
+            self._header[SEQ] += 1
+
+    def _spill(self):
+        """Save the oldest unspilled rows to disk before they are overwritten."""
+        n = min(self.spill_chunk, self._count - self._spilled)
+        start = self._spilled
+        slot = start % self.capacity
+        chunk = self._data[:, slot:slot + n].T
+        path = os.path.join(self.spill_dir, f'rows_{start:012d}.npy')
+        np.save(path, np.ascontiguousarray(chunk))
+        log.debug(f"Spilled rows {start}-{start + n - 1} to {path}")
+        self._spilled += n
+
+    def flush(self):
+        """Spill every buffered row not yet on disk (e.g. at the end of a run)."""
+        if self.spill_dir is None:
+            return
+        while self._spilled < self._count:
+            self._spill()
+
+    def _bounds(self, n):
+        return _bounds(self._count, self.capacity, n)
+
+    @property
+    def shm_name(self):
+        """Name of the shared memory block holding the data (None if not shared)."""
+        return self._shm.name if self._shm is not None else None
+
+    def window(self, n=None):
+        """Zero-copy (n, columns) view of the newest n rows (all buffered rows if None)."""
+        start, end = self._bounds(n)
+        return self._data[:, start:end].T
+
+    def column(self, name, n=None):
+        """Zero-copy contiguous view of the newest n values of one column."""
+        start, end = self._bounds(n)
+        return self._data[self.index[name], start:end]
+
+    def latest(self):
+        """View of the most recent row, or None if nothing has been appended."""
+        if not self._count:
+            return None
+        return self.window(1)[0]
+
+    def to_frame(self, n=None):
+        """Copy the newest n rows into a pandas DataFrame."""
+        import pandas as pd
+        return pd.DataFrame(self.window(n), columns=self.columns)
+
+    def to_dict(self, n=None):
+        """Copy the newest n rows into {column: list of values}."""
+        return {name: self.column(name, n).tolist() for name in self.columns}
+
+    def clear(self):
+        self._begin()
+        self._count = self._spilled = 0
+        self._data.fill(np.nan)
+        self._commit()
+
+    def close(self):
+        """Mark the shared memory block closed for readers and free it; a
+        shared buffer is unusable afterwards."""
+        if self._shm is None:
+            return
+        self._header[CLOSED] = 1
+        self._data = self._header = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # A view of the data is still referenced somewhere; the mapping
+            # goes when it does, the name is released now
+            log.warning(f"Views of shared history {self._shm.name} still in use")
+        self._finalizer()
+        self._shm = None
+
+
+class SharedHistory:
+    """Read-only view of a ColumnRingBuffer that another process on this
+    host publishes in shared memory, e.g. the caproto IOC's live history.
+
+        history = SharedHistory('rga_history')
+        count, rows = history.snapshot(100)   # zero-copy (100, columns) view
+        ...
+        if history.valid(count, len(rows)):   # rows were not overwritten meanwhile
+            ...
+
+    Readers add no load on the writer or on MASsoft.  snapshot() reads the
+    row count under the writer's seqlock, so every row it returns is
+    completely written; the rows stay in place until capacity - n more rows
+    are appended, which valid() checks afterwards.  window(), column() and
+    latest() return consistent copies.  When the writer starts a new history
+    under the same name, `closed` becomes True; reopen() maps the new one.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._shm = self._header = self._data = None
+        self.reopen()
+
+    def reopen(self):
+        """(Re)map the block currently published under this name."""
+        self.close()
+        shm = _attach(self.name)
+        header = np.ndarray(HEADER_FIELDS, np.uint64, buffer=shm.buf)
+        if header[MAGIC] != SHM_MAGIC:
+            del header
+            shm.close()
+            raise ValueError(f"{self.name} is not a shared RGA history")
+        layout = json.loads(bytes(shm.buf[HEADER_BYTES:HEADER_BYTES + int(header[LAYOUT_LEN])]))
+        self.columns = layout['columns']
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.capacity = int(header[CAPACITY])
+        self._data = np.ndarray((len(self.columns), 2 * self.capacity), dtype=layout['dtype'],
+                                buffer=shm.buf, offset=int(header[DATA_OFFSET]))
+        self._data.flags.writeable = False
+        self._header, self._shm = header, shm
+
+    @property
+    def closed(self):
+        """True once the writer has closed (or replaced) this block."""
+        return self._header is None or bool(self._header[CLOSED])
+
+    @property
+    def total(self):
+        """Rows appended by the writer so far, read under the seqlock."""
+        header = self._header
+        while True:
+            seq = header[SEQ]
+            if not seq % 2:
+                count = int(header[COUNT])
+                if header[SEQ] == seq:
+                    return count
+            time.sleep(0)  # the writer is mid-append; that takes microseconds
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def snapshot(self, n=None):
+        """(count, rows): zero-copy (n, columns) view of the newest n rows
+        (all buffered rows if None), and the row count they end at."""
+        count = self.total
+        start, end = _bounds(count, self.capacity, n)
+        return count, self._data[:, start:end].T
+
+    def valid(self, count, n):
+        """True if the n rows of a snapshot taken at `count` are still in place."""
+        return not self.closed and self.total - count <= self.capacity - n
+
+    def window(self, n=None):
+        """Consistent copy of the newest n rows, as an (n, columns) array."""
+        while True:
+            count, rows = self.snapshot(n)
+            rows = rows.copy()
+            if self.valid(count, len(rows)):
+                return rows
+
+    def column(self, name, n=None):
+        """Consistent copy of the newest n values of one column."""
+        return self.window(n)[:, self.index[name]]
+
+    def latest(self):
+        """Copy of the most recent row, or None if nothing has been appended."""
+        rows = self.window(1)
+        return rows[0] if len(rows) else None
+
+    def wait(self, after, timeout=None, poll=0.01):
+        """Wait until more than `after` rows have been appended; returns the
+        row count (still `after` or less if `timeout` s passed first)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            count = self.total
+            if count > after or self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return count
+            time.sleep(poll)
+
+    def close(self):
+        """Unmap the block (views from snapshot() must not be used afterwards)."""
+        if self._shm is None:
+            return
+        shm, self._shm = self._shm, None
+        self._header = self._data = None
+        try:
+            shm.close()
+        except BufferError:
+            pass  # snapshot views still alive; unmapped when they go
+
+
+def load_spilled(spill_dir):
+    """Concatenate every chunk in spill_dir, in order, into one (rows, columns) array."""
+    names = sorted(f for f in os.listdir(spill_dir) if f.startswith('rows_') and f.endswith('.npy'))
+    if not names:
+        return np.empty((0, 0))
+    return np.concatenate([np.load(os.path.join(spill_dir, f)) for f in names])
@@ -0,0 +1,356 @@
+"""Stand-in MASsoft server for offline testing and benchmarking.
+
+Speaks the subset of the MASsoft remote-control protocol used by the clients
+and IOCs in this directory.  Run it locally and point the clients at it:
+
+    python simulator.py --channels 10 --rate 5
+    MAS_HOST=127.0.0.1 python cap2.py
+
+Protocol notes (as simulated):
+  * every command is a CRLF-terminated line; a trailing ``-d<n>`` retry flag is
+    accepted and ignored, replies are ``1``/``0`` or the requested text;
+  * ``-lData`` and ``-lStatus`` create hot-links: the reply carries everything
+    not yet sent on that connection (``0`` if nothing), then new rows/states
+    are pushed as they are produced;
+  * data rows are ``Time ms v1 ... vN``; Time is elapsed seconds (``-t1``:
+    wall clock ``HH:MM:SS``), ms is elapsed milliseconds (``-m1``: wall clock
+    ``HH:MM:SS.mmm``); ``-c<n>`` starts a data link at cycle n.
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import math
+import random
+import re
+import socket
+import time
+
+DEFAULT_FILE = r"C:\Users\08id-user\Documents\Hiden Analytical\MASsoft\11\file1.exp"
+COMMON_MASSES = [2.0, 4.0, 14.0, 16.0, 18.0, 28.0, 32.0, 40.0, 44.0, 12.0]
+SCAN_PARAMETER_HEADERS = [
+    'Scan', 'Input', 'Start', 'Stop', 'Step', 'Accuracy',
+    'Dwell', 'Settle', 'Mode', 'Units', 'Range',
+]
+GREETING = "MASsoft Simulator"
+
+ScanRow = collections.namedtuple('ScanRow', 'cycle elapsed wall produced values')
+
+_FILE_RE = re.compile(r'-f\s*(?:"([^"]*)"|(\S+))')
+_OPTION_RE = re.compile(r'\s-([vctmd])(\d+)')
+
+
+def default_masses(channels):
+    """Return `channels` mass values, starting with the usual residual gases."""
+    masses = COMMON_MASSES[:channels]
+    extra = 50.0
+    while len(masses) < channels:
+        masses.append(extra)
+        extra += 1.0
+    return masses
+
+
+class _Session:
+    """Per-connection state: file association and active hot-links."""
+
+    def __init__(self, server, writer):
+        self.server = server
+        self.writer = writer
+        self.file = None
+        self.data_link = None     # (view, next cycle, time_fmt, ms_fmt)
+        self.status_link = False
+        self.outbox = asyncio.Queue()
+
+    def send(self, text):
+        # Latency is counted from when the reply is produced, so pipelined
+        # replies overlap their delays like they would on a real link
+        server = self.server
+        due = time.monotonic() + server.latency + server.random.uniform(0.0, server.jitter)
+        self.outbox.put_nowait((due, text))
+
+    async def write_loop(self):
+        """Deliver queued messages in order, with injected delay and fragmentation."""
+        server = self.server
+        while True:
+            due, text = await self.outbox.get()
+            if text is None:
+                return
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            payload = (text + "\r\n").encode('utf-8')
+            if server.fragment:
+                pos = 0
+                while pos < len(payload):
+                    size = server.random.randint(1, server.fragment)
+                    self.writer.write(payload[pos:pos + size])
+                    await self.writer.drain()
+                    await asyncio.sleep(server.fragment_delay)
+                    pos += size
+            else:
+                self.writer.write(payload)
+                await self.writer.drain()
+
+
+class MASsoftSimulator:
+    """Asyncio MASsoft stand-in with configurable MID scan and link impairments.
+
+    channels    -- number of MID masses in the simulated experiment
+    cycle_rate  -- scan cycles (data rows) produced per second
+    latency     -- fixed delay in seconds added before every reply/push
+    jitter      -- extra uniformly distributed delay in seconds
+    fragment    -- if >0, split each message into random chunks of at most this many bytes
+    fragment_delay -- seconds between those chunks (separate TCP segments)
+    drop        -- commands (e.g. '-lLegends') that are never answered
+    """
+
+    def __init__(self, host='127.0.0.1', port=5026, channels=10, cycle_rate=1.0,
+                 latency=0.0, jitter=0.0, fragment=0, fragment_delay=0.0, masses=None, seed=None,
+                 drop=()):
+        self.host = host
+        self.port = port
+        self.masses = list(masses) if masses else default_masses(channels)
+        self.cycle_rate = cycle_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.fragment_delay = fragment_delay
+        self.drop = set(drop)
+        self.random = random.Random(seed)
+        self.current_file = DEFAULT_FILE
+        self.state = 'Stopped'
+        self.rows = []
+        self.commands = 0
+        self._sessions = set()
+        self._server = None
+        self._scan_task = None
+        self._t0 = None
+
+    # — Server lifecycle —
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info(f"MASsoft simulator listening on {self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self.stop_scan('Stopped')
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for session in list(self._sessions):
+            session.writer.close()
+
+    # — Scan engine —
+    def start_scan(self):
+        if self._scan_task and not self._scan_task.done():
+            return
+        self.rows = []
+        self._t0 = time.monotonic()
+        self._set_state('StartingActive')
+        self._scan_task = asyncio.get_running_loop().create_task(self._scan_loop())
+
+    def stop_scan(self, state):
+        if self._scan_task:
+            self._scan_task.cancel()
+            self._scan_task = None
+        self._set_state(state)
+
+    async def _scan_loop(self):
+        period = 1.0 / self.cycle_rate
+        base = [1e-9 * (1.0 + (i % 7)) for i in range(len(self.masses))]
+        self._set_state('ScanningActive')
+        next_time = time.monotonic()
+        cycle = 0
+        while True:
+            next_time += period
+            await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+            now = time.monotonic()
+            phase = 2 * math.pi * cycle / 60.0
+            values = [
+                b * (1.0 + 0.2 * math.sin(phase + i) + 0.02 * self.random.gauss(0, 1))
+                for i, b in enumerate(base)
+            ]
+            # Stamped with the cycle's own time: cycles caught up after a
+            # stall keep distinct, evenly spaced timestamps
+            row = ScanRow(cycle, next_time - self._t0, time.time(), now, values)
+            self.rows.append(row)
+            cycle += 1
+            for session in self._sessions:
+                if session.data_link is not None:
+                    self._push_rows(session)
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        for session in self._sessions:
+            if session.status_link:
+                session.send(state)
+
+    # — Formatting —
+    def legends(self):
+        return "\t".join(['Time', 'ms'] + [f'mass {m:.2f}' for m in self.masses])
+
+    def scan_parameters(self):
+        lines = ["\t".join(SCAN_PARAMETER_HEADERS)]
+        for idx, mass in enumerate(self.masses, start=1):
+            lines.append("\t".join([
+                str(idx), 'mass', f'{mass:.2f}', f'{mass:.2f}', '0', '5',
+                '100', '100', 'MID', 'amu', '1E-07',
+            ]))
+        return "\r\n".join(lines)
+
+    @staticmethod
+    def format_row(row, time_fmt=False, ms_fmt=False):
+        if time_fmt:
+            stamp = time.strftime('%H:%M:%S', time.localtime(row.wall))
+        else:
+            stamp = f'{row.elapsed:.3f}'
+        if ms_fmt:
+            ms = time.strftime('%H:%M:%S', time.localtime(row.wall)) + f'.{int(row.wall * 1e3) % 1000:03d}'
+        else:
+            ms = str(int(row.elapsed * 1e3))
+        return "\t".join([stamp, ms] + [f'{v:.4E}' for v in row.values])
+
+    def _push_rows(self, session):
+        view, start, time_fmt, ms_fmt = session.data_link
+        rows = self.rows[start:]
+        if rows:
+            session.data_link = (view, len(self.rows), time_fmt, ms_fmt)
+            session.send("\r\n".join(self.format_row(r, time_fmt, ms_fmt) for r in rows))
+        return len(rows)
+
+    # — Command handling —
+    async def _handle(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = _Session(self, writer)
+        self._sessions.add(session)
+        writer_task = asyncio.get_running_loop().create_task(session.write_loop())
+        session.send(GREETING)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8').strip()
+                if command:
+                    self.commands += 1
+                    self._dispatch(session, command)
+            # Let queued replies go out before closing
+            session.send(None)
+            await writer_task
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._sessions.discard(session)
+            writer_task.cancel()
+            writer.close()
+
+    def _dispatch(self, session, command):
+        logging.debug(f"Simulator <= {command}")
+        options = {k: int(v) for k, v in _OPTION_RE.findall(' ' + command)}
+        word = command.split()[0]
+        if word in self.drop:
+            return
+        if word.startswith('-f'):
+            match = _FILE_RE.match(command)
+            path = (match.group(1) or match.group(2)) if match else ''
+            if not path:
+                session.send('0')
+                return
+            if 'HIDEN_' in path:
+                path = self.current_file
+            self.current_file = session.file = path
+            session.send('1')
+        elif word == '-xFilename':
+            session.send(session.file or self.current_file)
+        elif word == '-xStatus':
+            session.send(self.state)
+        elif word == '-xGo':
+            if session.file is None:
+                session.send('0')
+                return
+            self.start_scan()
+            session.send('1')
+        elif word == '-xAbort':
+            self.stop_scan('StoppedAborted')
+            session.send('1')
+        elif word == '-xClose':
+            self.stop_scan('Stopped')
+            session.file = None
+            session.data_link = None
+            session.status_link = False
+            session.send('1')
+        elif word == '-lLegends':
+            session.send(self.legends() if session.file else '0')
+        elif word == '-lScanParameters':
+            session.send(self.scan_parameters() if session.file else '0')
+        elif word == '-lStatus':
+            if session.file is None:
+                session.send('0')
+                return
+            session.status_link = True
+            session.send(self.state)
+        elif word == '-lData':
+            if session.file is None:
+                session.send('0')
+                return
+            if 'c' in options:
+                start = options['c']
+            elif session.data_link is not None:
+                start = session.data_link[1]
+            else:
+                start = 0
+            session.data_link = (options.get('v', 1), start,
+                                 bool(options.get('t')), bool(options.get('m')))
+            if not self._push_rows(session):
+                session.send('0')
+        else:
+            session.send('0')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local MASsoft protocol simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5026)
+    parser.add_argument('--channels', type=int, default=10, help='number of MID masses')
+    parser.add_argument('--rate', type=float, default=1.0, help='scan cycles per second')
+    parser.add_argument('--latency', type=float, default=0.0, help='reply delay (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra delay (s)')
+    parser.add_argument('--fragment', type=int, default=0, help='max bytes per TCP write (0 = off)')
+    parser.add_argument('--fragment-delay', type=float, default=0.0, help='seconds between fragments')
+    parser.add_argument('--drop', nargs='*', default=(), help='commands never answered')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--autostart', action='store_true', help='start scanning immediately')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    sim = MASsoftSimulator(
+        args.host, args.port, channels=args.channels, cycle_rate=args.rate,
+        latency=args.latency, jitter=args.jitter, fragment=args.fragment,
+        fragment_delay=args.fragment_delay, seed=args.seed, drop=args.drop,
+    )
+
+    async def _run():
+        await sim.start()
+        if args.autostart:
+            sim.start_scan()
+        await sim.serve_forever()
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import asyncio
+import enum
+import logging
+import threading
+import time
+
+log = logging.getLogger('massoft.status')
+
+
+class RunState(enum.Enum):
+    """Experiment state, from MASsoft's status strings (StartingActive,
+    ScanningActive, Stopped, StoppedAborted, ...)."""
+    UNKNOWN = 'Unknown'
+    STARTING = 'Starting'
+    SCANNING = 'Scanning'
+    PAUSED = 'Paused'
+    STOPPING = 'Stopping'
+    STOPPED = 'Stopped'
+    ABORTED = 'Aborted'
+
+
+ACTIVE_STATES = frozenset({RunState.STARTING, RunState.SCANNING, RunState.PAUSED})
+STOPPED_STATES = frozenset({RunState.STOPPED, RunState.ABORTED})
+
+# Transitions MASsoft is expected to make; anything else is still applied
+# (MASsoft is the authority, and pushes can be missed across a reconnect)
+# but logged
+TRANSITIONS = {
+    RunState.UNKNOWN: frozenset(RunState),
+    RunState.STARTING: frozenset({RunState.SCANNING, RunState.PAUSED}) | STOPPED_STATES | {RunState.STOPPING},
+    RunState.SCANNING: frozenset({RunState.PAUSED, RunState.STOPPING}) | STOPPED_STATES,
+    RunState.PAUSED: frozenset({RunState.SCANNING, RunState.STOPPING}) | STOPPED_STATES,
+    RunState.STOPPING: STOPPED_STATES,
+    RunState.STOPPED: frozenset({RunState.STARTING, RunState.SCANNING, RunState.ABORTED}),
+    RunState.ABORTED: frozenset({RunState.STARTING, RunState.SCANNING, RunState.STOPPED}),
+}
+
+_PREFIXES = (
+    ('starting', RunState.STARTING),
+    ('scanning', RunState.SCANNING),
+    ('paus', RunState.PAUSED),
+    ('stopping', RunState.STOPPING),
+    ('aborting', RunState.STOPPING),
+)
+
+
+def parse_status(raw):
+    """Map a MASsoft status string to a RunState; None for command
+    acknowledgements ('1'/'0') and empty lines, which carry no state."""
+    text = raw.strip().lower()
+    if text in ('', '0', '1'):
+        return None
+    if text.startswith('stopped'):
+        return RunState.ABORTED if 'abort' in text else RunState.STOPPED
+    for prefix, state in _PREFIXES:
+        if text.startswith(prefix):
+            return state
+    return RunState.UNKNOWN
+
+
+def _states(states):
+    return frozenset([states]) if isinstance(states, RunState) else frozenset(states)
+
+
+class StatusTracker:
+    """Current RunState of an experiment, fed by the -lStatus hot-link.
+
+    Changes are pushed to subscribers (callback(old, new, raw), called on the
+    thread that fed the update) and wake anyone blocked in wait_for() or
+    awaiting until(), so a stop is seen as soon as MASsoft reports it.
+
+    `transitions` counts state changes; pass a count taken earlier as
+    `after` to wait for a state entered since then (e.g. a stop that follows
+    this run's start rather than the previous run's).
+    """
+
+    def __init__(self):
+        self.state = RunState.UNKNOWN
+        self.raw = ''
+        self.changed = time.monotonic()
+        self._subscribers = []
+        self._cond = threading.Condition()
+        self._waiters = []  # (loop, future, states, after) of until() calls
+        # Counters
+        self.transitions = 0
+        self.unexpected = 0
+
+    def subscribe(self, callback):
+        """Call callback(old, new, raw) on every state change. Returns a
+        function that unsubscribes it."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def update(self, raw):
+        """Feed one status string; returns the resulting state."""
+        state = parse_status(raw)
+        if state is None:
+            return self.state
+        with self._cond:
+            old, self.raw = self.state, raw.strip()
+            if state == old:
+                return state
+            if state not in TRANSITIONS[old]:
+                self.unexpected += 1
+                log.warning(f"Unexpected status change {old.value} -> {state.value} ({self.raw})")
+            self.state = state
+            self.changed = time.monotonic()
+            self.transitions += 1
+            self._cond.notify_all()
+            woken = [w for w in self._waiters if self._matches(w[2], w[3])]
+            self._waiters = [w for w in self._waiters if w not in woken]
+        log.info(f"Status: {self.raw} ({old.value} -> {state.value})")
+        for loop, future, _, _ in woken:
+            loop.call_soon_threadsafe(_resolve, future, state)
+        for callback in list(self._subscribers):
+            try:
+                callback(old, state, self.raw)
+            except Exception:
+                log.exception(f"Status subscriber {callback!r} failed")
+        return state
+
+    def _matches(self, states, after):
+        return self.state in states and (after is None or self.transitions > after)
+
+    def wait_for(self, states, timeout=None, after=None):
+        """Block until the state is one of `states`; returns it. Raises
+        TimeoutError after `timeout` seconds."""
+        states = _states(states)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._matches(states, after), timeout):
+                raise TimeoutError(f"Status still {self.state.value} after {timeout}s")
+            return self.state
+
+    async def until(self, states, timeout=None, after=None):
+        """Awaitable wait_for()."""
+        states = _states(states)
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._matches(states, after):
+                return self.state
+            waiter = (loop, loop.create_future(), states, after)
+            self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Status still {self.state.value} after {timeout}s") from None
+        finally:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+
+def _resolve(future, state):
+    if not future.done():
+        future.set_result(state)
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hiden'))
+
+from simulator import MASsoftSimulator  # noqa: E402
+
+
+class SimulatorThread:
+    """A MASsoftSimulator on its own event loop in a daemon thread."""
+
+    def __init__(self, **kwargs):
+        self.sim = MASsoftSimulator(port=0, seed=0, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.sim.start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+        self._ready.wait()
+        self.port = self.sim._server.sockets[0].getsockname()[1]
+        return self
+
+    def disconnect(self):
+        """Close every client connection, as a dropped link would."""
+        def close():
+            for session in list(self.sim._sessions):
+                session.writer.close()
+        self.loop.call_soon_threadsafe(close)
+
+    def stop(self):
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _close(self):
+        await self.sim.close()
+        # Let the connection handlers finish before the loop goes away
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture
+def simulator(request):
+    """Simulator with the impairments given by @pytest.mark.simulator(**kwargs)."""
+    marker = request.node.get_closest_marker('simulator')
+    sim = SimulatorThread(**(marker.kwargs if marker else {})).start()
+    yield sim
+    sim.stop()
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'simulator(**kwargs): MASsoftSimulator options for the simulator fixture')
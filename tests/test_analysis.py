@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+import analysis
+from analysis import Analysis, AnalysisStage, GasRatio, PartialPressure, load_analyses
+from metrics import ANALYSIS_DROPPED
+from ringbuffer import ColumnRingBuffer
+
+MASSES = [28.0, 32.0, 44.0]
+COLUMNS = ['Time', 'ms'] + [f'{m:.2f}' for m in MASSES]
+
+
+class Slow(Analysis):
+    """Sums the newest row, slowly enough that frames pile up behind it."""
+
+    def outputs(self):
+        return ['Sum']
+
+    def compute(self, intensities, masses):
+        time.sleep(0.3)
+        return {'Sum': float(intensities[-1].sum())}
+
+
+def history(cycles):
+    buf = ColumnRingBuffer(COLUMNS, capacity=16, shared=True)
+    buf.extend([row(cycle) for cycle in range(cycles)])
+    return buf
+
+
+def row(cycle):
+    return [cycle * 0.1, cycle * 100.0] + [cycle + 1.0] * len(MASSES)
+
+
+def test_partial_pressure_and_ratio():
+    masses = np.array(MASSES)
+    intensities = np.array([[2.0, 1.0, 4.0], [4.0, 1.0, 4.0]])
+    pressure = PartialPressure(sensitivity={28: 2.0}, background={44.1: 1.0}, window=2)
+    result = pressure.compute(intensities, masses)
+    np.testing.assert_allclose(result['PartialP'], [1.5, 1.0, 3.0])
+    assert result['TotalP'] == pytest.approx(5.5)
+    assert GasRatio('N2_O2', 28, 32).compute(intensities, masses) == {'N2_O2': 3.0}
+    assert np.isnan(GasRatio('Ar', 40, 32).compute(intensities, masses)['Ar'])
+
+
+def test_incomplete_analysis_fails_on_load(tmp_path, monkeypatch):
+    class NoCompute(Analysis):
+        def outputs(self):
+            return ['X']
+
+    monkeypatch.setitem(analysis.ANALYSES, 'NoCompute', NoCompute)
+    config = tmp_path / 'analysis.json'
+    config.write_text(json.dumps([{'type': 'NoCompute'}]))
+    with pytest.raises(TypeError, match='compute'):
+        load_analyses(str(config))
+
+
+def test_load_analyses_rejects_duplicate_outputs(tmp_path):
+    config = tmp_path / 'analysis.json'
+    config.write_text(json.dumps([{'type': 'GasRatio', 'name': 'R', 'numerator': 28, 'denominator': 32},
+                                  {'type': 'GasRatio', 'name': 'R', 'numerator': 44, 'denominator': 32}]))
+    with pytest.raises(ValueError, match='unique'):
+        load_analyses(str(config))
+
+
+def test_busy_workers_keep_only_the_newest_frame():
+    async def run():
+        published = []
+
+        async def publish(results, arrival):
+            published.append((results, arrival))
+
+        buf = history(5)
+        stage = AnalysisStage([Slow()], publish, workers=1)
+        dropped = ANALYSIS_DROPPED.value
+        try:
+            stage.start(buf, MASSES)
+            for arrival in range(5):
+                stage.offer(float(arrival))
+            waiting = stage._pending.arrival
+            deadline = time.monotonic() + 30
+            while stage._in_flight and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            await stage.stop()
+            return published, waiting, stage.stats(), ANALYSIS_DROPPED.value - dropped
+        finally:
+            stage.shutdown()
+            buf.close()
+
+    published, waiting, stats, dropped = asyncio.run(run())
+    # The first frame was sent, three were replaced while it ran, the last waited
+    assert waiting == 4.0
+    assert stats['submitted'] == 2
+    assert stats['dropped'] == dropped == 3
+    # Both frames saw the same newest row; the second result is not newer
+    assert stats['published'] == 1
+    assert stats['discarded'] == 1
+    assert published == [({'Sum': 15.0}, 0.0)]
@@ -0,0 +1,91 @@
+import asyncio
+
+import numpy as np
+
+from backfill import RowMerger
+from parsing import RowSchema, ScanFrame
+
+SCHEMA = RowSchema(['Time', 'ms', 'mass 28.00'], [28.0])
+
+
+def rows(first, last):
+    """Cycles first..last-1, 10 ms apart."""
+    cycles = np.arange(first, last, dtype=float)
+    return np.column_stack((cycles / 100, cycles * 10, cycles))
+
+
+def frames(*ranges, fail=False):
+    async def gen():
+        for first, last in ranges:
+            yield ScanFrame(SCHEMA, rows(first, last), first)
+            await asyncio.sleep(0)
+        if fail:
+            raise ConnectionError("link lost")
+    return gen()
+
+
+class Store:
+    def __init__(self):
+        self.rows = []
+        self.stamps = []
+
+    def __call__(self, rows, stamps):
+        self.rows.append(rows)
+        self.stamps.append(np.broadcast_to(stamps, (len(rows),)))
+
+    def cycles(self):
+        return np.concatenate(self.rows)[:, 2].astype(int).tolist()
+
+    def all_stamps(self):
+        return np.concatenate(self.stamps)
+
+
+def test_live_rows_stored_in_order_without_duplicates():
+    store = Store()
+    merger = RowMerger(store)
+    merger.live(rows(0, 5), 1.0)
+    merger.live(rows(3, 8), 2.0)  # replayed after a reconnect
+    assert store.cycles() == list(range(8))
+    assert merger.duplicates == 2
+
+
+def test_backfill_merged_ahead_of_held_live_rows():
+    store = Store()
+    merger = RowMerger(store, backfilling=True)
+    merger.live(rows(50, 53), 100.0)
+    merger.live(rows(53, 55), 100.1)
+    assert store.rows == []  # held until the backfill catches up
+    backfilled = asyncio.run(merger.backfill(frames((0, 20), (20, 40), (40, 60))))
+    assert backfilled == 50
+    assert store.cycles() == list(range(55))
+    assert merger.duplicates == 0
+    assert merger.stats() == {'stored': 55, 'backfilled': 50, 'duplicates': 0}
+
+
+def test_backfilled_stamps_estimated_from_ms():
+    store = Store()
+    merger = RowMerger(store, backfilling=True)
+    merger.live(rows(10, 11), 100.0)
+    asyncio.run(merger.backfill(frames((0, 10))))
+    stamps = store.all_stamps()
+    np.testing.assert_allclose(stamps, 100.0 - (10 - np.arange(11)) * 0.01)
+    assert (np.diff(stamps) > 0).all()
+
+
+def test_failed_backfill_still_stores_held_rows():
+    store = Store()
+    merger = RowMerger(store, backfilling=True)
+    merger.live(rows(30, 32), 1.0)
+    asyncio.run(merger.backfill(frames((0, 10), fail=True)))
+    assert store.cycles() == list(range(10)) + [30, 31]
+    # Later live rows go straight through
+    merger.live(rows(32, 33), 2.0)
+    assert store.cycles()[-1] == 32
+
+
+def test_backfill_without_live_rows():
+    store = Store()
+    merger = RowMerger(store)
+    asyncio.run(merger.backfill(frames((0, 5), (3, 9))))
+    assert store.cycles() == list(range(9))
+    assert merger.duplicates == 2
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+from conftest import SimulatorThread
+from engine import AcquisitionEngine, SessionSpec, load_sessions
+
+
+def test_load_sessions(tmp_path):
+    path = tmp_path / 'sessions.json'
+    path.write_text(json.dumps([{'name': 'RGA1', 'host': 'h1'},
+                                {'name': 'RGA2', 'host': 'h2', 'view': 2, 'prefix': 'X:'}]))
+    specs = load_sessions(str(path))
+    assert [spec.prefix for spec in specs] == ['RGA1:', 'X:']
+    assert specs[1].view == 2
+    path.write_text(json.dumps([{'name': 'RGA1'}, {'name': 'RGA1'}]))
+    with pytest.raises(ValueError, match='unique'):
+        load_sessions(str(path))
+
+
+def test_sessions_need_their_own_prefix():
+    with pytest.raises(ValueError, match='reuses PV names'):
+        AcquisitionEngine([SessionSpec('A', prefix='P:'), SessionSpec('B', prefix='P:')], record_dir=None)
+
+
+async def acquire_both(engine, until):
+    for ioc in engine.sessions.values():
+        await ioc.client.open_experiment('file1.exp')
+        await ioc.client.run_experiment(verify_timeout=0)
+    for ioc in engine.sessions.values():
+        await ioc.acquire.write(1)
+    try:
+        deadline = time.monotonic() + 10
+        while not until():
+            assert time.monotonic() < deadline, "timed out"
+            await asyncio.sleep(0.02)
+    finally:
+        for ioc in engine.sessions.values():
+            await ioc.acquire.write(0)
+            await asyncio.gather(ioc._task, return_exceptions=True)
+            await ioc.client.shutdown()
+        engine.close()
+
+
+@pytest.mark.simulator(channels=3, cycle_rate=20)
+def test_sessions_acquire_concurrently_and_apart(simulator):
+    # The second instrument answers every command 0.3 s late
+    slow = SimulatorThread(channels=5, cycle_rate=20, latency=0.3).start()
+    try:
+        engine = AcquisitionEngine([
+            SessionSpec('fast', host='127.0.0.1', port=simulator.port, prefix='fast:'),
+            SessionSpec('slow', host='127.0.0.1', port=slow.port, prefix='slow:'),
+        ], record_dir=None, shm_name=None)
+        fast_ioc, slow_ioc = engine.sessions['fast'], engine.sessions['slow']
+        fast_rows = []
+
+        def published(ioc):
+            return ioc._publisher.published if ioc._publisher is not None else 0
+
+        def until():
+            if not slow_ioc._publisher:
+                # Still waiting on the slow instrument's legends
+                fast_rows.append(published(fast_ioc))
+            return published(fast_ioc) >= 5 and published(slow_ioc) >= 5
+
+        asyncio.run(acquire_both(engine, until))
+    finally:
+        slow.stop()
+
+    # Each session has its own masses under its own prefix
+    assert len(fast_ioc.mid_pvs) == 3 and len(slow_ioc.mid_pvs) == 5
+    assert 'fast:XF:08IDB-SE{RGA:1}P:MID3-I' in engine.pvdb
+    assert 'fast:XF:08IDB-SE{RGA:1}P:MID4-I' not in engine.pvdb
+    assert 'slow:XF:08IDB-SE{RGA:1}P:MID5-I' in engine.pvdb
+    np.testing.assert_allclose(fast_ioc.mass_axis.value, simulator.sim.masses, atol=0.005)
+    np.testing.assert_allclose(slow_ioc.mass_axis.value, slow.sim.masses, atol=0.005)
+    # The fast instrument kept publishing while the slow one was set up
+    assert max(fast_rows) >= 3
@@ -0,0 +1,61 @@
+from framing import LineFramer
+
+
+def test_records_in_one_read():
+    framer = LineFramer()
+    framer.feed(b'1\r\nfile1.exp\r\n')
+    assert framer.lines() == ['1', 'file1.exp']
+    assert framer.pending == 0
+    assert framer.framed == 2
+
+
+def test_record_split_across_reads():
+    framer = LineFramer()
+    framer.feed(b'0.100\t100\t1.0E-')
+    assert framer.lines() == []
+    assert framer.pending == len(b'0.100\t100\t1.0E-')
+    framer.feed(b'09\r\n')
+    assert framer.lines() == ['0.100\t100\t1.0E-09']
+    assert framer.reassembled == 1
+
+
+def test_terminator_split_across_reads():
+    framer = LineFramer()
+    framer.feed(b'Stopped\r')
+    assert framer.lines() == []
+    framer.feed(b'\nScanningActive\r\n')
+    assert framer.lines() == ['Stopped', 'ScanningActive']
+
+
+def test_partial_record_kept_after_complete_ones():
+    framer = LineFramer()
+    framer.feed(b'a\r\nb\r\nc')
+    assert framer.lines() == ['a', 'b']
+    framer.feed(b'd\r\n')
+    assert framer.lines() == ['cd']
+
+
+def test_buffer_grows_for_long_records():
+    framer = LineFramer(size=16)
+    record = b'x' * 100
+    for i in range(0, len(record), 7):
+        framer.feed(record[i:i + 7])
+    framer.feed(b'\r\n')
+    assert framer.lines() == ['x' * 100]
+
+
+def test_oversized_record_dropped():
+    framer = LineFramer(size=16, max_record=32)
+    for _ in range(10):
+        framer.feed(b'y' * 10)
+    framer.feed(b'\r\nok\r\n')
+    assert framer.lines() == ['ok']
+    assert framer.dropped == 1
+
+
+def test_reset_forgets_partial_record():
+    framer = LineFramer()
+    framer.feed(b'half a rec')
+    framer.reset()
+    framer.feed(b'whole\r\n')
+    assert framer.lines() == ['whole']
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from cap2 import RGAIOC
+from metadata import MetadataCache
+
+CHANNELS = 4
+
+scanning = pytest.mark.simulator(channels=CHANNELS, cycle_rate=20)
+
+
+def make_ioc(simulator, **kwargs):
+    return RGAIOC(prefix='T:', host='127.0.0.1', port=simulator.port, metadata=MetadataCache(), **kwargs)
+
+
+async def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+async def acquire(ioc, condition):
+    """Run the simulated experiment and acquire until `condition()` holds."""
+    await ioc.client.open_experiment('file1.exp')
+    await ioc.client.run_experiment(verify_timeout=0)
+    await ioc.acquire.write(1)
+    try:
+        await wait_until(condition)
+    finally:
+        await ioc.acquire.write(0)
+        await asyncio.gather(ioc._task, return_exceptions=True)
+        await ioc.client.shutdown()
+        ioc.close()
+
+
+@scanning
+def test_streamed_rows_reach_the_pvs(simulator):
+    ioc = make_ioc(simulator)
+    asyncio.run(acquire(ioc, lambda: ioc._publisher is not None and ioc._publisher.published >= 5))
+    sent = np.array([row.values for row in simulator.sim.rows])
+    spectrum = np.asarray(ioc.spectrum.value)
+    # The newest published cycle, as MASsoft formatted it (4 significant digits)
+    assert np.isclose(sent, spectrum, rtol=1e-3).all(axis=1).any()
+    np.testing.assert_array_equal([pv.value for pv in ioc.mid_pvs], spectrum)
+    assert ioc.spectrum_time.value > 0
+    assert ioc.latency.value > 0
+
+
+@pytest.mark.simulator(channels=300, cycle_rate=20)
+def test_spectrum_waveforms_sized_from_legends(simulator):
+    ioc = make_ioc(simulator)
+    asyncio.run(acquire(ioc, lambda: len(ioc.spectrum.value) == 300))
+    np.testing.assert_allclose(ioc.mass_axis.value, simulator.sim.masses, atol=0.005)
+    assert len(ioc.spectrum.value) == 300
+    # All 300 masses published, not just the first ten
+    assert ioc.spectrum.value[-1] > 0
+
+
+def mid_names(ioc):
+    return sorted(name for name in ioc.pvdb if 'MID' in name)
+
+
+@scanning
+def test_mid_pvs_built_from_legends(simulator):
+    ioc = make_ioc(simulator)
+    assert len(ioc.mid_pvs) == 10  # served before any experiment is read
+    asyncio.run(acquire(ioc, lambda: ioc._publisher is not None and ioc._publisher.published))
+    assert mid_names(ioc) == sorted(
+        [f'T:XF:08IDB-SE{{RGA:1}}P:MID{i}-I' for i in range(1, CHANNELS + 1)]
+        + [f'T:XF:08IDB-VA{{RGA:1}}Mass:MID{i}' for i in range(1, CHANNELS + 1)])
+    np.testing.assert_allclose([pv.value for pv in ioc.mass_pvs], simulator.sim.masses, atol=0.005)
+    assert [col for col, _ in ioc._column_pvs] == list(range(2, CHANNELS + 2))
+    # A larger experiment adds the missing channels and keeps the existing ones
+    first = ioc.mid_pvs[0]
+    ioc._build_mid_pvs([float(m) for m in range(1, 13)])
+    assert len(mid_names(ioc)) == 24
+    assert ioc.mid_pvs[0] is first
+    assert ioc._column_pvs[-1] == (13, ioc.mid_pvs[11])
+
+
+@pytest.mark.simulator(channels=CHANNELS, latency=0.5)
+def test_slow_massoft_does_not_block_other_pvs(simulator):
+    async def run():
+        ioc = make_ioc(simulator)
+        loop = asyncio.get_running_loop()
+        try:
+            started = loop.time()
+            abort = asyncio.create_task(ioc.abort_exp.write(1))
+            await asyncio.sleep(0.05)
+            put_started = loop.time()
+            await ioc.max_rate.write(5.0)
+            put_time = loop.time() - put_started
+            await abort
+            return put_time, loop.time() - started, ioc.max_rate.value
+        finally:
+            await ioc.client.shutdown()
+            ioc.close()
+
+    put_time, abort_time, max_rate = asyncio.run(run())
+    assert abort_time >= 0.5  # waited for MASsoft's reply ...
+    assert put_time < 0.1     # ... while other PVs were served meanwhile
+    assert max_rate == 5.0
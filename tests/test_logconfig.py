@@ -0,0 +1,74 @@
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+import logconfig
+from logconfig import COMMAND_LOGGER, parse_levels, setup_logging, stop_logging
+
+HIDEN = os.path.dirname(logconfig.__file__)
+
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    names = [COMMAND_LOGGER, 'massoft.pool']
+    levels = {name: logging.getLogger(name).level for name in names}
+    yield
+    stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    for name in names:
+        logging.getLogger(name).setLevel(levels[name])
+        for f in list(logging.getLogger(name).filters):
+            logging.getLogger(name).removeFilter(f)
+
+
+def test_importing_the_clients_configures_nothing(tmp_path):
+    script = (
+        f"import logging, sys; sys.path.insert(0, {HIDEN!r})\n"
+        "import massoft_client, massoft_client_async, cap2\n"
+        "print(len(logging.getLogger().handlers))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path,
+                            capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip() == '0', result.stderr
+    assert os.listdir(tmp_path) == []  # no log file opened
+
+
+def test_levels_and_sampling(tmp_path, restore_logging):
+    path = tmp_path / 'rga.log'
+    setup_logging(level='INFO', levels='massoft.commands=DEBUG, massoft.pool=WARNING',
+                  filename=str(path), sample=3)
+    commands = logging.getLogger(COMMAND_LOGGER)
+    for i in range(9):
+        commands.debug(f"trace {i}")
+    logging.getLogger('massoft.pool').info("pool detail")
+    logging.getLogger('massoft.pool').warning("pool warning")
+    logging.getLogger('rga.ioc').debug("ioc detail")
+    stop_logging()  # writes out the queue
+    lines = path.read_text().splitlines()
+    assert [line.split(': ', 1)[1] for line in lines] == [
+        'trace 0', 'trace 3', 'trace 6', 'pool warning']
+
+
+def test_setup_twice_replaces_the_pipeline(tmp_path, restore_logging):
+    setup_logging(filename=str(tmp_path / 'a.log'), levels={})
+    setup_logging(filename=str(tmp_path / 'b.log'), levels={})
+    logging.getLogger('rga.ioc').warning("once")
+    stop_logging()
+    assert (tmp_path / 'a.log').read_text() == ''
+    assert (tmp_path / 'b.log').read_text().count('once') == 1
+
+
+def test_parse_levels():
+    assert parse_levels('') == {}
+    assert parse_levels('massoft.commands=debug,rga=INFO') == {'massoft.commands': 'DEBUG', 'rga': 'INFO'}
+    with pytest.raises(ValueError):
+        parse_levels('massoft.commands')
@@ -0,0 +1,86 @@
+import pytest
+
+from massoft_client import MASsoftClient
+from metadata import LAST_FILE, ExperimentMetadata, MetadataCache
+from pool import MASsoftPool
+from status import RunState
+
+LEGENDS = 'Time\tms\tmass 28.00\tmass 32.00'
+PARAMS = 'Scan\tStart\r\n1\t28\r\n2\t32'
+CHANNELS = 10
+
+
+def cache_with(*paths):
+    cache = MetadataCache()
+    for path in paths:
+        cache.load(path, 1, lambda: (LEGENDS, PARAMS))
+    return cache
+
+
+def test_metadata_without_legends_keeps_time_and_ms():
+    # View not ready: masses come from the scan parameters
+    meta = ExperimentMetadata('file1.exp', 1, [], [{'Start': '28'}, {'Start': '32'}])
+    assert not meta.ready
+    assert meta.columns == ['Time', 'ms', 'mass 28.00', 'mass 32.00']
+    assert len(meta.schema.parse(['0.1\t100\t1E-9\t2E-9'])) == 1
+
+
+def test_cache_fetches_once_per_file_and_view():
+    cache = MetadataCache()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return LEGENDS, PARAMS
+
+    first = cache.load('a.exp', 1, fetch)
+    assert cache.load('a.exp', 1, fetch) is first
+    cache.load('a.exp', 2, fetch)
+    assert len(fetches) == 2
+    assert first.masses == [28.0, 32.0]
+    assert cache.stats() == {'entries': 2, 'hits': 1, 'misses': 2}
+
+
+def test_unready_view_not_cached():
+    cache = MetadataCache()
+    assert not cache.load('a.exp', 1, lambda: ('0', '0')).ready
+    assert cache.load('a.exp', 1, lambda: (LEGENDS, PARAMS)).ready
+
+
+def test_run_start_drops_only_the_started_file():
+    cache = cache_with('a.exp', 'b.exp', LAST_FILE)
+    cache.observe_state(RunState.STOPPED, RunState.STARTING, 'StartingActive', 'a.exp')
+    assert cache.get('a.exp', 1) is None
+    assert cache.get(LAST_FILE, 1) is None
+    assert cache.get('b.exp', 1) is not None
+    # Scanning after starting is the same run
+    cache = cache_with('a.exp')
+    cache.observe_state(RunState.STARTING, RunState.SCANNING, 'ScanningActive', 'a.exp')
+    assert cache.get('a.exp', 1) is not None
+
+
+@pytest.mark.simulator(channels=CHANNELS, fragment=64, fragment_delay=0.005)
+def test_client_metadata_asks_massoft_only_on_a_miss(simulator):
+    pool = MASsoftPool(host='127.0.0.1', port=simulator.port, keepalive=0)
+    client = MASsoftClient('127.0.0.1', simulator.port, pool=pool, metadata=MetadataCache())
+    try:
+        client.initialize()
+        path = client.open_experiment_commands('file1.exp')
+        client.metadata.put(ExperimentMetadata('other.exp', 1, ['Time', 'ms', 'mass 2.00'], []))
+        sent = simulator.sim.commands
+        meta = client.get_metadata()
+        # -f, -lLegends and -lScanParameters; the file is already known
+        assert simulator.sim.commands - sent == 3
+        assert len(meta.scan_parameters) == CHANNELS
+        assert meta.columns[:2] == ['Time', 'ms']
+        assert len(meta.masses) == CHANNELS
+        sent = simulator.sim.commands
+        assert client.get_metadata() is meta
+        assert simulator.sim.commands == sent
+        # A run start seen on the status link drops this file's entry only
+        client.status.update('StartingActive')
+        assert client.metadata.get(path, 1) is None
+        assert client.metadata.get('other.exp', 1) is not None
+    finally:
+        client.shutdown()
+        pool.close()
@@ -0,0 +1,70 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from massoft_client import MASsoftSocket
+from metrics import COMMANDS, Registry, serve
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    hist = registry.histogram('rtt_seconds', 'Round trip', buckets=(0.001, 0.01))
+    for value in (0.0005, 0.005, 0.005, 2.0):
+        hist.observe(value)
+    samples = registry.snapshot()
+    assert samples['rtt_seconds_bucket{le="0.001"}'] == 1
+    assert samples['rtt_seconds_bucket{le="0.01"}'] == 3
+    assert samples['rtt_seconds_bucket{le="+Inf"}'] == 4
+    assert samples['rtt_seconds_count'] == 4
+    assert samples['rtt_seconds_sum'] == pytest.approx(2.0105)
+    assert hist.quantile(0.5) == 0.01
+    assert hist.quantile(1.0) == float('inf')
+
+
+def test_registry_returns_one_metric_per_name():
+    registry = Registry()
+    counter = registry.counter('rows_total', 'Rows')
+    assert registry.counter('rows_total', 'Rows') is counter
+    with pytest.raises(ValueError):
+        registry.gauge('rows_total', 'Rows')
+
+
+def test_prometheus_text():
+    registry = Registry()
+    registry.counter('rows_total', 'Rows parsed').inc(3)
+    registry.gauge('queue_depth', 'Batches waiting', fn=lambda: 7)
+    assert registry.render() == (
+        '# HELP rows_total Rows parsed\n'
+        '# TYPE rows_total counter\n'
+        'rows_total 3\n'
+        '# HELP queue_depth Batches waiting\n'
+        '# TYPE queue_depth gauge\n'
+        'queue_depth 7\n'
+    )
+
+
+def test_endpoint_serves_the_registry():
+    registry = Registry()
+    registry.counter('rows_total', 'Rows parsed').inc()
+    server = serve(port=0, registry=registry)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        with urllib.request.urlopen(f'{url}/metrics', timeout=5) as reply:
+            assert reply.headers['Content-Type'].startswith('text/plain')
+            assert reply.read().decode() == registry.render()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'{url}/other', timeout=5)
+    finally:
+        server.shutdown()
+
+
+def test_client_commands_counted(simulator):
+    sock = MASsoftSocket('127.0.0.1', simulator.port, name='TestSocket', timeout=2)
+    sock.connect()
+    try:
+        sent = COMMANDS.value
+        sock.send_commands(['-xStatus', '-xFilename'])
+        assert COMMANDS.value - sent == 2
+    finally:
+        sock.close()
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from metadata import ExperimentMetadata
+from parsing import RowSchema, ScanFrame, clock_to_seconds, parse_block
+
+LEGENDS = ['Time', 'ms', 'mass 28.00', 'mass 32.00']
+
+
+def row(i, sep='\t'):
+    return sep.join([f'{i * 0.1:.3f}', str(i * 100), f'{1e-9 * (i + 1):.4E}', f'{2e-9 * (i + 1):.4E}'])
+
+
+def test_clean_block():
+    block = parse_block('\r\n'.join(row(i) for i in range(3)), 4)
+    assert block.mask.all()
+    assert block.data.shape == (3, 4)
+    np.testing.assert_allclose(block.data[:, 1], [0, 100, 200])
+    np.testing.assert_allclose(block.data[2, 3], 6e-9)
+
+
+def test_whitespace_separated_rows():
+    block = parse_block([row(i, sep=' ') for i in range(2)])
+    assert block.data.shape == (2, 4)
+    assert block.mask.all()
+
+
+def test_acknowledgement_and_blank_lines_ignored():
+    block = parse_block(['0', '', row(0)], 4)
+    assert len(block.mask) == 1
+    assert block.mask.all()
+
+
+def test_empty_reply():
+    block = parse_block('0', 4)
+    assert block.data.shape == (0, 4)
+    assert not block.mask.size
+
+
+def test_malformed_rows_masked():
+    lines = [row(0), '0.2\t200\t1E-9', row(2), '0.3\t300\tnan?\t1E-9']
+    block = parse_block(lines, 4)
+    assert block.mask.tolist() == [True, False, True, False]
+    assert np.isnan(block.data[1]).all()
+    np.testing.assert_allclose(block.data[2, 1], 200)
+
+
+def test_clock_columns():
+    block = parse_block(['12:00:01\t12:00:01.500\t1\t2'], 4, time_fmt=True, ms_fmt=True)
+    assert block.mask.all()
+    assert block.data[0, 0] == clock_to_seconds('12:00:01') == 43201
+    assert block.data[0, 1] == pytest.approx(43201.5)
+    np.testing.assert_allclose(block.data[0, 2:], [1, 2])
+
+
+def test_frame_of_clean_block():
+    schema = RowSchema(LEGENDS, [28.0, 32.0])
+    frame = schema.parse([row(i) for i in range(3)], first_cycle=10, arrival=5.0)
+    assert len(frame) == 3
+    assert frame.dropped == 0
+    assert frame.cycles.tolist() == [10, 11, 12]
+    assert frame.end_cycle == 13
+    assert frame.arrival == 5.0
+    assert frame.intensities.shape == (3, 2)
+    np.testing.assert_allclose(frame.ms, [0, 100, 200])
+
+
+def test_frame_cycles_skip_malformed_rows():
+    schema = RowSchema(LEGENDS, [28.0, 32.0])
+    frame = schema.parse([row(0), 'garbage', row(2)], first_cycle=4)
+    assert frame.dropped == 1
+    assert frame.cycles.tolist() == [4, 6]
+    assert frame.end_cycle == 7
+
+
+def test_records_are_a_view_of_the_rows():
+    schema = RowSchema(LEGENDS, [28.0, 32.0])
+    frame = schema.parse([row(i) for i in range(3)])
+    records = frame.records
+    assert records.dtype == schema.record_dtype
+    assert np.shares_memory(records, frame.rows)
+    np.testing.assert_array_equal(records['intensities'], frame.intensities)
+    np.testing.assert_array_equal(records['ms'], frame.ms)
+
+
+def test_empty_frame():
+    frame = RowSchema(LEGENDS, [28.0, 32.0]).parse('0', first_cycle=3)
+    assert len(frame) == 0
+    assert frame.end_cycle == 3
+    assert frame.latest() is None
+    assert isinstance(frame, ScanFrame)
+
+
+def test_metadata_dtype_is_the_schema_record_dtype():
+    meta = ExperimentMetadata('file1.exp', 1, LEGENDS, [])
+    assert meta.ready
+    assert meta.masses == [28.0, 32.0]
+    assert meta.dtype == meta.schema.record_dtype
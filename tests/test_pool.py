@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from massoft_client import MASsoftClient
+from metadata import MetadataCache
+from pool import MASsoftPool
+
+FILE = r'C:\Data\file1.exp'
+
+
+@pytest.fixture
+def pool(simulator):
+    pool = MASsoftPool(host='127.0.0.1', port=simulator.port, max_per_host=2, keepalive=0,
+                       acquire_timeout=0.3)
+    yield pool
+    pool.close()
+
+
+def test_released_link_reused_with_its_association(pool):
+    sock = pool.acquire('command', file=FILE)
+    pool.release(sock)
+    again = pool.acquire('command', file=FILE)
+    assert again is sock
+    assert again.send_command('-xFilename') == FILE
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['reused'] == 1
+
+
+def test_idle_link_of_another_role_recycled_at_the_cap(pool):
+    pool.release(pool.acquire('status'))
+    first = pool.acquire('command')
+    second = pool.acquire('command')
+    assert first is not second
+    assert pool.stats()['evicted'] == 1
+    assert pool.stats()['open'] == {('127.0.0.1', pool.port): 2}
+
+
+def test_acquire_at_the_cap_times_out(pool):
+    leased = [pool.acquire('command'), pool.acquire('data')]
+    started = time.monotonic()
+    with pytest.raises(TimeoutError, match=r'All 2 MASsoft connections to 127\.0\.0\.1:\d+'):
+        pool.acquire('status')
+    assert time.monotonic() - started < 2
+    # A link freed meanwhile is handed over
+    pool.release(leased[0])
+    assert pool.acquire('command', timeout=0) is leased[0]
+    for sock in leased:
+        pool.release(sock)
+
+
+def test_client_beyond_the_cap_fails_instead_of_hanging(simulator):
+    pool = MASsoftPool(host='127.0.0.1', port=simulator.port, keepalive=0, acquire_timeout=0.3)
+    clients = [MASsoftClient('127.0.0.1', simulator.port, pool=pool, metadata=MetadataCache())
+               for _ in range(3)]
+    try:
+        clients[0].initialize()
+        clients[1].initialize()
+        with pytest.raises(TimeoutError, match='max_per_host'):
+            clients[2].initialize()
+    finally:
+        for client in clients:
+            client.shutdown()
+        pool.close()
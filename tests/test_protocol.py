@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+
+from massoft_client import MASsoftSocket
+from massoft_client_async import AsyncMASsoftClient, AsyncMASsoftSocket
+from metadata import MetadataCache
+
+FILE = r'C:\Data\file1.exp'
+CHANNELS = 10
+
+# Replies cut into 64-byte segments 5 ms apart, so a multi-line reply
+# spans several reads and records are split mid-line
+fragmented = pytest.mark.simulator(channels=CHANNELS, fragment=64, fragment_delay=0.005)
+
+
+def open_socket(simulator, timeout=2):
+    sock = MASsoftSocket('127.0.0.1', simulator.port, name='TestSocket', timeout=timeout)
+    sock.connect()
+    assert sock.send_command(f'-f"{FILE}"') == '1'
+    return sock
+
+
+@fragmented
+def test_multiline_reply_read_whole(simulator):
+    sock = open_socket(simulator)
+    try:
+        params = sock.send_command('-lScanParameters -v1').split('\r\n')
+        assert len(params) == CHANNELS + 1  # header and one row per channel
+        legends = sock.send_command('-lLegends -v1').split('\r\n')
+        assert legends[0].split('\t')[:2] == ['Time', 'ms']
+        # Nothing of the earlier replies is left to be taken for this one
+        assert sock.send_command('-xFilename') == FILE
+    finally:
+        sock.close()
+
+
+@pytest.mark.simulator(channels=CHANNELS, latency=0.5)
+def test_late_reply_not_taken_for_the_next(simulator):
+    sock = open_socket(simulator)
+    try:
+        sock.sock.settimeout(0.2)
+        assert sock.send_command('-lScanParameters -v1') == ''
+        assert sock.state.reconnects == 1
+        # The new link still has the file associated
+        assert sock.send_command('-xFilename') == FILE
+    finally:
+        sock.close()
+
+
+@fragmented
+def test_pipelined_replies_in_order(simulator):
+    sock = open_socket(simulator)
+    try:
+        assert sock.send_commands(['-xFilename', '-xStatus', '-xFilename']) == [FILE, 'Stopped', FILE]
+    finally:
+        sock.close()
+
+
+@fragmented
+def test_async_multiline_reply_read_whole(simulator):
+    async def run():
+        client = AsyncMASsoftClient('127.0.0.1', simulator.port, metadata=MetadataCache())
+        try:
+            await client.initialize()
+            await client.open_experiment('file1.exp')
+            params, filename = await asyncio.gather(
+                client.cmd_sock.send_command_lines('-lScanParameters -v1'),
+                client.cmd_sock.send_command('-xFilename'))
+            replies = await client.cmd_sock.send_commands(['-xStatus', '-xFilename'])
+            return params.split('\r\n'), filename, replies
+        finally:
+            await client.shutdown()
+
+    params, filename, replies = asyncio.run(run())
+    assert len(params) == CHANNELS + 1
+    assert filename.endswith('file1.exp')
+    assert replies == ['Stopped', filename]
+
+
+@pytest.mark.simulator(channels=CHANNELS, drop=('-lLegends',))
+def test_lost_multiline_reply_does_not_block_later_commands(simulator):
+    async def run():
+        sock = AsyncMASsoftSocket('TestSocket', '127.0.0.1', simulator.port)
+        await sock.send_command(f'-f"{FILE}"')
+        legends = asyncio.create_task(sock.send_command_lines('-lLegends -v1'))
+        await asyncio.sleep(0.2)
+        simulator.sim.drop.clear()  # answered when re-sent on the new link
+        started = time.monotonic()
+        status = await sock.send_command('-xStatus', timeout=0.5)
+        waited = time.monotonic() - started
+        filename = await sock.send_command('-xFilename', timeout=2)
+        legends = await asyncio.wait_for(legends, 2)
+        sock.close()
+        return status, waited, filename, legends, sock.state.reconnects
+
+    status, waited, filename, legends, reconnects = asyncio.run(run())
+    assert status == ''
+    assert waited < 2
+    assert reconnects == 1
+    assert filename == FILE  # association replayed
+    assert legends.startswith('Time\tms')
+
+
+@pytest.mark.simulator(channels=CHANNELS, drop=('-lLegends',))
+def test_heartbeat_recovers_from_lost_multiline_reply(simulator):
+    async def run():
+        client = AsyncMASsoftClient('127.0.0.1', simulator.port, metadata=MetadataCache())
+        await client.initialize()
+        await client.open_experiment('file1.exp')
+        legends = asyncio.create_task(client.cmd_sock.send_command_lines('-lLegends -v1'))
+        await asyncio.sleep(0.2)
+        simulator.sim.drop.clear()
+        heartbeat = asyncio.create_task(client.heartbeat(interval=0.1, timeout=0.5))
+        try:
+            deadline = time.monotonic() + 5
+            while not client.cmd_sock.state.reconnects and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            return (client.cmd_sock.state.reconnects,
+                    await client.cmd_sock.send_command('-xStatus', timeout=2),
+                    await asyncio.wait_for(legends, 2))
+        finally:
+            heartbeat.cancel()
+            await client.shutdown()
+
+    reconnects, status, legends = asyncio.run(run())
+    assert reconnects == 1
+    assert status == 'Stopped'
+    assert legends.startswith('Time\tms')
@@ -0,0 +1,99 @@
+import asyncio
+
+import numpy as np
+
+from publisher import RowPublisher
+
+
+def rows(first, count):
+    return np.arange(first, first + count, dtype=float).reshape(count, 1)
+
+
+def test_backlog_coalesced_to_newest_row():
+    async def run():
+        published = []
+
+        async def publish(row, arrival):
+            published.append((row[0], arrival))
+
+        publisher = RowPublisher(publish)
+        task = asyncio.create_task(publisher.run())
+        publisher.offer(rows(0, 5), 1.0)
+        publisher.offer(rows(5, 3), 2.0)  # overtakes the pending row
+        await asyncio.sleep(0.01)
+        publisher.offer(rows(8, 0), 3.0)  # empty batches are ignored
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return published, publisher.stats()
+
+    published, stats = asyncio.run(run())
+    assert published == [(7.0, 2.0)]
+    assert stats == {'offered': 8, 'published': 1, 'coalesced': 7}
+
+
+def test_max_rate_spaces_publications():
+    async def run():
+        loop = asyncio.get_running_loop()
+        times, values = [], []
+
+        async def publish(row, arrival):
+            times.append(loop.time())
+            values.append(row[0])
+
+        publisher = RowPublisher(publish, max_rate=20)
+        task = asyncio.create_task(publisher.run())
+        for i in range(30):  # 200 rows/s offered
+            publisher.offer(rows(i, 1), loop.time())
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return times, values, publisher
+
+    times, values, publisher = asyncio.run(run())
+    assert np.all(np.diff(times) >= 0.05 - 0.005)
+    assert len(times) < 10
+    assert values[-1] == 29.0  # the last row offered is not lost
+    assert publisher.published + publisher.coalesced == publisher.offered == 30
+
+
+def test_flush_publishes_pending_row():
+    async def run():
+        published = []
+
+        async def publish(row, arrival):
+            published.append(row[0])
+
+        publisher = RowPublisher(publish)
+        publisher.offer(rows(0, 2), 1.0)
+        await publisher.flush()
+        await publisher.flush()  # nothing left
+        return published, publisher.stats()
+
+    published, stats = asyncio.run(run())
+    assert published == [1.0]
+    assert stats == {'offered': 2, 'published': 1, 'coalesced': 1}
+
+
+def test_failed_publish_does_not_stop_the_task():
+    async def run():
+        published = []
+
+        async def publish(row, arrival):
+            if row[0] == 0:
+                raise RuntimeError('PV write failed')
+            published.append(row[0])
+
+        publisher = RowPublisher(publish)
+        task = asyncio.create_task(publisher.run())
+        publisher.offer(rows(0, 1), 1.0)
+        await asyncio.sleep(0.01)
+        publisher.offer(rows(1, 1), 2.0)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return published, publisher.published
+
+    published, count = asyncio.run(run())
+    assert published == [1.0]
+    assert count == 1
@@ -0,0 +1,87 @@
+import asyncio
+import contextlib
+
+import numpy as np
+import pytest
+
+from massoft_client_async import AsyncMASsoftClient
+from metadata import MetadataCache
+from parsing import CycleCounter, RowSchema
+
+SCHEMA = RowSchema(['Time', 'ms', 'mass 28.00'], [28.0])
+
+
+def lines(ms_values):
+    return [f'{ms / 1e3:.3f}\t{ms}\t1.0E-09' for ms in ms_values]
+
+
+def test_cycle_counter_counts_every_line():
+    counter = CycleCounter(20)
+    frame = SCHEMA.parse(lines([100, 200]) + ['garbage'], counter.cycle)
+    counter.advance(frame)
+    assert counter.cycle == 23
+    counter.advance(SCHEMA.parse('0', counter.cycle))
+    assert counter.cycle == 23
+
+
+def test_cycle_counter_restarts_with_a_new_run():
+    counter = CycleCounter()
+    counter.advance(SCHEMA.parse(lines([100, 200, 300]), counter.cycle))
+    # The last cycles of the run, then the first two of the next
+    counter.advance(SCHEMA.parse(lines([400, 500, 100, 200]), counter.cycle))
+    assert counter.cycle == 2
+    counter.advance(SCHEMA.parse(lines([300]), counter.cycle))
+    assert counter.cycle == 3
+
+
+async def open_client(simulator):
+    client = AsyncMASsoftClient('127.0.0.1', simulator.port, metadata=MetadataCache())
+    await client.initialize()
+    await client.open_experiment('file1.exp')
+    await client.run_experiment(verify_timeout=0)
+    return client
+
+
+@pytest.mark.simulator(channels=4, cycle_rate=50)
+def test_stream_resumes_at_the_next_cycle(simulator):
+    async def run():
+        client = await open_client(simulator)
+        frames = []
+        try:
+            # Opened mid-run: cycles are counted from 20, not from 0
+            stream = client.stream_data(start=20)
+            async with contextlib.aclosing(stream):
+                async for frame in stream:
+                    frames.append(frame)
+                    received = sum(len(f) for f in frames)
+                    if received >= 10 and not client.data_sock.state.reconnects:
+                        simulator.disconnect()
+                    elif received >= 30 and client.data_sock.state.reconnects:
+                        break
+            return frames, client.data_sock.state.reconnects
+        finally:
+            await client.shutdown()
+
+    frames, reconnects = asyncio.run(run())
+    assert reconnects == 1
+    cycles = np.concatenate([f.cycles for f in frames])
+    ms = np.concatenate([f.ms for f in frames])
+    np.testing.assert_array_equal(cycles, np.arange(20, 20 + len(cycles)))
+    # One cycle every 20 ms: nothing repeated or skipped across the resume
+    assert 19 <= np.diff(ms).min() and np.diff(ms).max() <= 21
+    assert abs(ms[0] - 21 * 20) <= 1
+
+
+@pytest.mark.simulator(channels=4, cycle_rate=50)
+def test_stream_gives_up_when_the_link_stays_down(simulator):
+    async def run():
+        client = await open_client(simulator)
+        try:
+            async for frame in client.stream_data(retries=1):
+                if len(frame):
+                    simulator.stop()
+        finally:
+            await client.shutdown()
+
+    with pytest.raises(OSError):
+        asyncio.run(run())
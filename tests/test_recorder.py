@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from recorder import Recording, ScanRecorder, read_recording
+
+COLUMNS = ['Time', 'ms', 'mass 28.00', 'mass 32.00']
+T0 = 1_700_000_000.0
+
+
+def record(path, n, compression=None, chunk_rows=16, batch=5):
+    """Record n rows stamped T0 + i/10 in batches; returns the rows."""
+    data = np.column_stack((np.arange(n) / 10, np.arange(n) * 100.0,
+                            np.arange(n) * 1e-9, np.arange(n) * 2e-9))
+    recorder = ScanRecorder(str(path), COLUMNS, {'view': 1}, chunk_rows=chunk_rows,
+                            compression=compression)
+    for first in range(0, n, batch):
+        block = data[first:first + batch]
+        recorder.append(block, T0 + np.arange(first, first + len(block)) / 10)
+    recorder.close()
+    return data
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_read_back_whole_recording(tmp_path, compression):
+    data = record(tmp_path / 'run', 50, compression)
+    columns, stored, attrs = read_recording(str(tmp_path / 'run'))
+    assert columns == ['timestamp'] + COLUMNS
+    assert attrs == {'view': 1}
+    np.testing.assert_array_equal(stored[:, 1:], data)
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_select_time_window(tmp_path, compression):
+    data = record(tmp_path / 'run', 50, compression)
+    recording = Recording(str(tmp_path / 'run'))
+    assert len(recording) == 50
+    # Rows 12..37, crossing chunk boundaries at 16 and 32
+    selected = recording.select(T0 + 1.2, T0 + 3.8, masses=[32])
+    assert list(selected) == ['timestamp', 'mass 32.00']
+    np.testing.assert_allclose(selected['timestamp'], T0 + np.arange(12, 38) / 10)
+    np.testing.assert_array_equal(selected['mass 32.00'], data[12:38, 3])
+
+
+def test_select_open_ends_and_columns(tmp_path):
+    data = record(tmp_path / 'run', 40)
+    recording = Recording(str(tmp_path / 'run'))
+    head = recording.select(stop=T0 + 0.5, columns=['ms'])
+    np.testing.assert_array_equal(head['ms'], data[:5, 1])
+    tail = recording.select(start=T0 + 3.5)
+    assert set(tail) == {'timestamp'} | set(COLUMNS)
+    np.testing.assert_array_equal(tail['mass 28.00'], data[35:, 2])
+    assert len(recording.select(T0 + 10, T0 + 11)['timestamp']) == 0
+
+
+def test_select_within_one_chunk_is_a_mapped_view(tmp_path):
+    record(tmp_path / 'run', 40)
+    recording = Recording(str(tmp_path / 'run'))
+    values = recording.select(T0 + 1.7, T0 + 2.5, masses=[28])['mass 28.00']
+    assert isinstance(values.base, np.memmap) or isinstance(values, np.memmap)
+    assert not values.flags.writeable
+
+
+def test_select_unknown_mass(tmp_path):
+    record(tmp_path / 'run', 10)
+    recording = Recording(str(tmp_path / 'run'))
+    with pytest.raises(ValueError):
+        recording.select(masses=[44])
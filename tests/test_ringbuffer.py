@@ -0,0 +1,139 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import ringbuffer
+from ringbuffer import ColumnRingBuffer, SharedHistory
+
+COLUMNS = ['Time', 'ms', 'mass 28.00']
+
+
+def rows(first, last):
+    cycles = np.arange(first, last, dtype=float)
+    return np.column_stack((cycles, cycles * 10, cycles * 100))
+
+
+def test_append_and_window_before_wrapping():
+    buf = ColumnRingBuffer(COLUMNS, capacity=8)
+    assert buf.latest() is None
+    for r in rows(0, 3):
+        buf.append(r)
+    assert len(buf) == 3
+    np.testing.assert_array_equal(buf.window(), rows(0, 3))
+    np.testing.assert_array_equal(buf.latest(), rows(2, 3)[0])
+
+
+def test_window_after_wrapping_is_newest_in_order():
+    buf = ColumnRingBuffer(COLUMNS, capacity=8)
+    buf.extend(rows(0, 5))
+    buf.extend(rows(5, 19))
+    assert len(buf) == 8
+    assert buf.total == 19
+    np.testing.assert_array_equal(buf.window(), rows(11, 19))
+    np.testing.assert_array_equal(buf.window(3), rows(16, 19))
+    np.testing.assert_array_equal(buf.column('ms', 4), rows(15, 19)[:, 1])
+
+
+def test_windows_are_views():
+    buf = ColumnRingBuffer(COLUMNS, capacity=8)
+    buf.extend(rows(0, 13))
+    column = buf.column('mass 28.00')
+    assert column.flags.c_contiguous
+    assert np.shares_memory(column, buf._data)
+    assert np.shares_memory(buf.window(5), buf._data)
+
+
+def test_extend_larger_than_capacity_keeps_newest():
+    buf = ColumnRingBuffer(COLUMNS, capacity=4)
+    buf.extend(rows(0, 10))
+    assert buf.total == 10
+    np.testing.assert_array_equal(buf.window(), rows(6, 10))
+
+
+def test_extend_rejects_wrong_width():
+    buf = ColumnRingBuffer(COLUMNS, capacity=4)
+    with pytest.raises(ValueError):
+        buf.extend(np.zeros((2, 2)))
+
+
+def test_spilled_and_buffered_rows_cover_the_run(tmp_path):
+    buf = ColumnRingBuffer(COLUMNS, capacity=8, spill_dir=str(tmp_path), spill_chunk=3)
+    buf.extend(rows(0, 30))
+    buf.flush()
+    spilled = [np.load(tmp_path / name) for name in sorted(os.listdir(tmp_path))]
+    np.testing.assert_array_equal(np.concatenate(spilled), rows(0, 30))
+    np.testing.assert_array_equal(buf.window(), rows(22, 30))
+
+
+def test_clear():
+    buf = ColumnRingBuffer(COLUMNS, capacity=4)
+    buf.extend(rows(0, 3))
+    buf.clear()
+    assert len(buf) == 0
+    assert buf.latest() is None
+
+
+def test_shared_history_reads_the_writer_rows():
+    buf = ColumnRingBuffer(COLUMNS, capacity=8, shared=True)
+    try:
+        reader = SharedHistory(buf.shm_name)
+        assert reader.columns == COLUMNS
+        buf.extend(rows(0, 11))
+        count, view = reader.snapshot(4)
+        assert count == 11
+        np.testing.assert_array_equal(view, rows(7, 11))
+        assert reader.valid(count, len(view))
+        np.testing.assert_array_equal(reader.latest(), rows(10, 11)[0])
+        del view
+        # The writer overwrites the snapshot's rows once it wraps past them
+        buf.extend(rows(11, 19))
+        assert not reader.valid(count, 4)
+    finally:
+        buf.close()
+    assert reader.closed
+    reader.close()
+
+
+def test_failed_spill_leaves_the_history_readable(tmp_path, monkeypatch):
+    buf = ColumnRingBuffer(COLUMNS, capacity=8, spill_dir=str(tmp_path), spill_chunk=4, shared=True)
+    try:
+        reader = SharedHistory(buf.shm_name)
+
+        def full(*args):
+            raise OSError('No space left on device')
+
+        monkeypatch.setattr(ringbuffer.np, 'save', full)
+        with pytest.raises(OSError):
+            buf.extend(rows(0, 12))
+        # The rows written before the spill are published, the seqlock released
+        assert reader.total == 8
+        np.testing.assert_array_equal(reader.window(), rows(0, 8))
+        monkeypatch.undo()
+        buf.extend(rows(8, 12))
+        np.testing.assert_array_equal(reader.window(4), rows(8, 12))
+        reader.close()
+    finally:
+        buf.close()
+
+
+def test_reader_process_exit_leaves_the_block():
+    buf = ColumnRingBuffer(COLUMNS, capacity=8, shared=True)
+    try:
+        buf.extend(rows(0, 3))
+        script = (
+            f"import sys; sys.path.insert(0, {os.path.dirname(ringbuffer.__file__)!r})\n"
+            "from ringbuffer import SharedHistory\n"
+            f"print(SharedHistory({buf.shm_name!r}).total)\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=30)
+        assert result.stdout.strip() == '3'
+        assert 'leaked' not in result.stderr
+        # Still mapped under its name after the reader's resource tracker exited
+        reader = SharedHistory(buf.shm_name)
+        assert reader.total == 3
+        reader.close()
+    finally:
+        buf.close()
@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from massoft_client_async import AsyncMASsoftClient
+from metadata import MetadataCache
+from status import STOPPED_STATES, RunState, StatusTracker, parse_status
+
+
+def test_parse_status():
+    assert parse_status('StartingActive') is RunState.STARTING
+    assert parse_status('ScanningActive\r\n') is RunState.SCANNING
+    assert parse_status('Paused') is RunState.PAUSED
+    assert parse_status('AbortingActive') is RunState.STOPPING
+    assert parse_status('Stopped') is RunState.STOPPED
+    assert parse_status('StoppedAborted') is RunState.ABORTED
+    assert parse_status('Calibrating') is RunState.UNKNOWN
+    assert parse_status('1') is None  # command acknowledgement
+
+
+def test_subscribers_see_each_change_once():
+    tracker = StatusTracker()
+    seen = []
+    unsubscribe = tracker.subscribe(lambda old, new, raw: seen.append((old, new, raw)))
+    tracker.update('StartingActive')
+    tracker.update('ScanningActive')
+    tracker.update('ScanningActive')  # no change
+    tracker.update('1')
+    assert seen == [(RunState.UNKNOWN, RunState.STARTING, 'StartingActive'),
+                    (RunState.STARTING, RunState.SCANNING, 'ScanningActive')]
+    assert tracker.transitions == 2
+    # Applied, but counted as unexpected
+    tracker.update('StartingActive')
+    assert tracker.state is RunState.STARTING
+    assert tracker.unexpected == 1
+    unsubscribe()
+    tracker.update('Stopped')
+    assert len(seen) == 3
+
+
+def test_wait_for_wakes_on_update_from_another_thread():
+    tracker = StatusTracker()
+    tracker.update('ScanningActive')
+    mark = tracker.transitions
+    timer = threading.Timer(0.05, tracker.update, ['Stopped'])
+    started = time.monotonic()
+    timer.start()
+    assert tracker.wait_for(STOPPED_STATES, timeout=2, after=mark) is RunState.STOPPED
+    assert time.monotonic() - started < 1
+    # Stopped is already current, but not entered after the new mark
+    with pytest.raises(TimeoutError):
+        tracker.wait_for(STOPPED_STATES, timeout=0.05, after=tracker.transitions)
+
+
+def test_until_resolves_and_times_out():
+    async def run():
+        tracker = StatusTracker()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, tracker.update, 'ScanningActive')
+        state = await tracker.until(RunState.SCANNING, timeout=2)
+        with pytest.raises(TimeoutError):
+            await tracker.until(RunState.STOPPED, timeout=0.05)
+        return state, tracker._waiters
+
+    state, waiters = asyncio.run(run())
+    assert state is RunState.SCANNING
+    assert waiters == []
+
+
+@pytest.mark.simulator(channels=4, cycle_rate=20)
+def test_stop_seen_within_milliseconds(simulator):
+    async def run():
+        client = AsyncMASsoftClient('127.0.0.1', simulator.port, metadata=MetadataCache())
+        try:
+            await client.open_experiment('file1.exp')
+            await client.run_experiment(verify_timeout=0)
+            await client.watch_status()
+            await client.status.until(RunState.SCANNING, timeout=5)
+            simulator.loop.call_soon_threadsafe(simulator.sim.stop_scan, 'Stopped')
+            stopped = time.monotonic()
+            await client.monitor_until_stopped(timeout=5)
+            return time.monotonic() - stopped, client.status.state
+        finally:
+            await client.shutdown()
+
+    waited, state = asyncio.run(run())
+    assert state is RunState.STOPPED
+    assert waited < 0.2
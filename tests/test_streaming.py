@@ -0,0 +1,75 @@
+import asyncio
+import contextlib
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from massoft_client import MASsoftClient
+from massoft_client_async import AsyncMASsoftClient
+from metadata import MetadataCache
+from pool import MASsoftPool
+
+CHANNELS = 4
+
+scanning = pytest.mark.simulator(channels=CHANNELS, cycle_rate=50)
+
+
+def assert_contiguous(ms):
+    # 50 cycles/s: one row every 20 ms, none lost or repeated
+    steps = np.diff(ms)
+    assert ((steps >= 19) & (steps <= 21)).all(), steps
+
+
+@scanning
+def test_aiter_data_yields_records_with_backpressure(simulator):
+    async def run():
+        client = AsyncMASsoftClient('127.0.0.1', simulator.port, metadata=MetadataCache())
+        try:
+            await client.open_experiment('file1.exp')
+            await client.run_experiment(verify_timeout=0)
+            meta = await client.get_metadata()
+            batches = []
+            async with contextlib.aclosing(client.aiter_data(records=True, maxsize=1)) as data:
+                async for batch in data:
+                    batches.append(batch)
+                    await asyncio.sleep(0.1)  # slower than MASsoft pushes
+                    if len(batches) == 5:
+                        break
+            return meta, batches, client.data_sock
+        finally:
+            await client.shutdown()
+
+    meta, batches, data_sock = asyncio.run(run())
+    assert all(batch.dtype == meta.dtype for batch in batches)
+    assert batches[0]['intensities'].shape[1] == CHANNELS
+    # The rows held back by the slow consumer arrive later, in order
+    assert sum(len(batch) for batch in batches) > 5
+    assert_contiguous(np.concatenate([batch['ms'] for batch in batches]))
+    assert not data_sock.state.hotlinks
+
+
+@scanning
+def test_iter_data_stops_its_reader_on_break(simulator):
+    pool = MASsoftPool(host='127.0.0.1', port=simulator.port, keepalive=0)
+    client = MASsoftClient('127.0.0.1', simulator.port, pool=pool, metadata=MetadataCache())
+    try:
+        client.initialize()
+        client.open_experiment_commands('file1.exp')
+        client.open_experiment_data('file1.exp')
+        client.run_experiment()
+        rows = []
+        started = time.monotonic()
+        for batch in client.iter_data(maxsize=2, poll_interval=0.05):
+            assert batch.shape[1] == CHANNELS + 2
+            rows.append(batch)
+            if sum(len(batch) for batch in rows) >= 10:
+                break
+        assert time.monotonic() - started < 5
+        assert_contiguous(np.concatenate(rows)[:, 1])
+        assert client.data_socket.sock is None
+        assert not any(thread.name == 'MASsoftDataReader' for thread in threading.enumerate())
+    finally:
+        client.shutdown()
+        pool.close()